@@ -81,6 +81,60 @@ else:
 
 DATABASE_ROUTERS = ['panel.routers.TenantRouter']
 
+# Aliases dinámicos de BD por tenant (ver panel.tenant_connections)
+TENANT_DB_MAX_ALIASES = config('TENANT_DB_MAX_ALIASES', default=200, cast=int)
+TENANT_DB_IDLE_TIMEOUT = config('TENANT_DB_IDLE_TIMEOUT', default=600, cast=int)
+TENANT_DB_CONN_MAX_AGE = config('TENANT_DB_CONN_MAX_AGE', default=300, cast=int)
+
+# Pool psycopg2 de las utilidades de BD del panel (ver panel.db_pool)
+DB_POOL_MAX_PER_KEY = config('DB_POOL_MAX_PER_KEY', default=4, cast=int)
+DB_POOL_MAX_TOTAL = config('DB_POOL_MAX_TOTAL', default=32, cast=int)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=300, cast=int)
+
+# Recolección concurrente de estadísticas por tenant (ver panel.collectors)
+STATS_COLLECTOR_MAX_WORKERS = config('STATS_COLLECTOR_MAX_WORKERS', default=8, cast=int)
+STATS_COLLECTOR_TIMEOUT = config('STATS_COLLECTOR_TIMEOUT', default=3, cast=int)
+STATS_COLLECTOR_DEADLINE = config('STATS_COLLECTOR_DEADLINE', default=10, cast=int)
+TENANT_STATS_INTERVAL = config('TENANT_STATS_INTERVAL', default=300, cast=int)
+TENANT_STATS_DEADLINE = config('TENANT_STATS_DEADLINE', default=120, cast=int)
+
+# Consola SQL / gestión de BDs
+SQL_EXACT_COUNT_TIMEOUT = config('SQL_EXACT_COUNT_TIMEOUT', default=30, cast=int)
+SQL_CONSOLE_STATEMENT_TIMEOUT = config('SQL_CONSOLE_STATEMENT_TIMEOUT', default=30, cast=int)
+SQL_CONSOLE_PAGE_SIZE = config('SQL_CONSOLE_PAGE_SIZE', default=100, cast=int)
+SQL_CONSOLE_MAX_ROWS = config('SQL_CONSOLE_MAX_ROWS', default=10000, cast=int)
+SQL_CONSOLE_EXPORT_TIMEOUT = config('SQL_CONSOLE_EXPORT_TIMEOUT', default=300, cast=int)
+SQL_CONSOLE_EXPORT_CHUNK = config('SQL_CONSOLE_EXPORT_CHUNK', default=2000, cast=int)
+SQL_CONSOLE_EXPORT_MAX_ROWS = config('SQL_CONSOLE_EXPORT_MAX_ROWS', default=1000000, cast=int)
+
+# Redis (invalidación de caches entre workers)
+REDIS_URL = config('REDIS_URL', default='')
+
+# Cache de Django compartida entre workers cuando hay Redis
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'tenant-master',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Contadores de tenants del dashboard (se invalidan al guardar/eliminar tenants)
+TENANT_COUNTERS_TTL = config('TENANT_COUNTERS_TTL', default=30, cast=int)
+
+# Cache de resolución de tenants en TenantMiddleware
+TENANT_CACHE_TTL = config('TENANT_CACHE_TTL', default=300, cast=int)
+TENANT_CACHE_MAX_ENTRIES = config('TENANT_CACHE_MAX_ENTRIES', default=1000, cast=int)
+TENANT_NEGATIVE_CACHE_TTL = config('TENANT_NEGATIVE_CACHE_TTL', default=60, cast=int)
+TENANT_NEGATIVE_CACHE_MAX_ENTRIES = config('TENANT_NEGATIVE_CACHE_MAX_ENTRIES', default=10000, cast=int)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -135,6 +189,43 @@ PORTAINER_BASE = config('PORTAINER_BASE', default='')
 PORTAINER_API_KEY = config('PORTAINER_API_KEY', default='')
 PORTAINER_ENDPOINT_ID = config('PORTAINER_ENDPOINT_ID', default=1, cast=int)
 
+# Registro de actividad: escritura por lotes en un hilo de fondo
+ACTIVITY_LOG_ASYNC = config('ACTIVITY_LOG_ASYNC', default=True, cast=bool)
+ACTIVITY_LOG_QUEUE_SIZE = config('ACTIVITY_LOG_QUEUE_SIZE', default=10000, cast=int)
+ACTIVITY_LOG_BATCH_SIZE = config('ACTIVITY_LOG_BATCH_SIZE', default=200, cast=int)
+ACTIVITY_LOG_FLUSH_INTERVAL = config('ACTIVITY_LOG_FLUSH_INTERVAL', default=1.0, cast=float)
+ACTIVITY_LOG_SHUTDOWN_TIMEOUT = config('ACTIVITY_LOG_SHUTDOWN_TIMEOUT', default=5, cast=int)
+
+# Retención del registro de actividad: meses completos más viejos se archivan en NDJSON gzip
+ACTIVITY_LOG_RETENTION_DAYS = config('ACTIVITY_LOG_RETENTION_DAYS', default=180, cast=int)
+ACTIVITY_ARCHIVE_DIR = config('ACTIVITY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'activity'))
+
+# Aprovisionamiento de workspaces (comando provisioning_worker)
+PROVISIONING_WORKER_CONCURRENCY = config('PROVISIONING_WORKER_CONCURRENCY', default=3, cast=int)
+PROVISIONING_POLL_INTERVAL = config('PROVISIONING_POLL_INTERVAL', default=3, cast=int)
+PROVISIONING_STALE_AFTER = config('PROVISIONING_STALE_AFTER', default=1800, cast=int)
+# Pasos de un mismo job que corren en paralelo y espera base entre reintentos (se duplica)
+PROVISIONING_STEP_CONCURRENCY = config('PROVISIONING_STEP_CONCURRENCY', default=4, cast=int)
+PROVISIONING_RETRY_BACKOFF = config('PROVISIONING_RETRY_BACKOFF', default=2, cast=int)
+
+# BDs plantilla por versión de producto (comando build_template_dbs)
+TEMPLATE_DB_ENABLED = config('TEMPLATE_DB_ENABLED', default=True, cast=bool)
+# Host de Postgres visto desde los contenedores de producto (vacío = el mismo del panel)
+TEMPLATE_DB_HOST = config('TEMPLATE_DB_HOST', default='')
+TEMPLATE_DB_INTERVAL = config('TEMPLATE_DB_INTERVAL', default=300, cast=int)
+
+# Pool tibio de BDs/roles listos por producto (comando fill_warm_pool)
+WARM_POOL_ENABLED = config('WARM_POOL_ENABLED', default=True, cast=bool)
+WARM_POOL_SIZE = config('WARM_POOL_SIZE', default=3, cast=int)
+WARM_POOL_INTERVAL = config('WARM_POOL_INTERVAL', default=30, cast=int)
+
+# Tamaño de página de los listados (paginación keyset)
+WORKSPACES_PAGE_SIZE = config('WORKSPACES_PAGE_SIZE', default=50, cast=int)
+ACTIVITY_PAGE_SIZE = config('ACTIVITY_PAGE_SIZE', default=50, cast=int)
+ACTIVITY_EXPORT_CHUNK = config('ACTIVITY_EXPORT_CHUNK', default=2000, cast=int)
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=50, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=200, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
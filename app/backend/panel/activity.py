@@ -0,0 +1,164 @@
+"""
+Escritura asíncrona del registro de actividad (ActivityLog)
+
+Las vistas encolan las entradas con log_activity() y un hilo de fondo las
+inserta por lotes con bulk_create, así la auditoría no suma round trips a
+cada acción del panel ni a los webhooks. La cola es acotada: si se llena,
+si el modo asíncrono está desactivado o el hilo no puede arrancar, la
+entrada se guarda en forma síncrona como antes. Al terminar el proceso se
+vacía lo pendiente.
+"""
+import atexit
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import ActivityLog
+
+_STOP = object()
+
+
+class ActivityWriter:
+    def __init__(self, enabled=True, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 shutdown_timeout=5):
+        self.enabled = enabled
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shutdown_timeout = shutdown_timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        atexit.register(self.shutdown)
+
+    def log(self, **fields):
+        """
+        Registra una entrada. Se encola al confirmar la transacción actual
+        (si se revierte, la entrada se descarta igual que con create()).
+        """
+        # created_at se fija aquí (default=timezone.now), no al escribir el lote
+        entry = ActivityLog(**fields)
+        transaction.on_commit(lambda: self._enqueue(entry))
+
+    def _enqueue(self, entry):
+        if not self.enabled or not self._ensure_thread():
+            self._save_one(entry)
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # Cola llena: mejor una escritura síncrona que perder la auditoría
+            self._save_one(entry)
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                # Proceso nuevo (fork de gunicorn) o hilo caído: cola e hilo propios
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.max_queue)
+                self._pid = os.getpid()
+                try:
+                    self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                    self._thread.start()
+                except RuntimeError as e:
+                    print(f"[ACTIVITY] No se pudo iniciar el escritor: {e}")
+                    self._thread = None
+                    return False
+        return True
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            item = first
+            while True:
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+        close_old_connections()
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            ActivityLog.objects.bulk_create(batch)
+        except Exception as e:
+            print(f"[ACTIVITY] Error en bulk_create ({len(batch)} entradas), reintentando una a una: {e}")
+            for entry in batch:
+                self._save_one(entry)
+
+    def _save_one(self, entry):
+        try:
+            entry.save()
+        except (IntegrityError, ValueError) as e:
+            # Tenant o usuario eliminados entre el log y la escritura: conservar la entrada sin ellos
+            print(f"[ACTIVITY] Error guardando entrada: {e}")
+            try:
+                entry.tenant = None
+                entry.user = None
+                entry.save()
+            except Exception as e:
+                print(f"[ACTIVITY] Entrada descartada: {e}")
+        except Exception as e:
+            print(f"[ACTIVITY] Entrada descartada: {e}")
+
+    def flush(self):
+        """Escribe en este hilo lo que quede en la cola"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._write(batch)
+
+    def shutdown(self):
+        """Detiene el hilo vaciando la cola (registrado en atexit)"""
+        if self._pid != os.getpid():
+            return
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=self.shutdown_timeout)
+            except queue.Full:
+                pass
+            self._thread.join(self.shutdown_timeout)
+        self.flush()
+
+
+activity_writer = ActivityWriter(
+    enabled=getattr(settings, 'ACTIVITY_LOG_ASYNC', True),
+    max_queue=getattr(settings, 'ACTIVITY_LOG_QUEUE_SIZE', 10000),
+    batch_size=getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 1.0),
+    shutdown_timeout=getattr(settings, 'ACTIVITY_LOG_SHUTDOWN_TIMEOUT', 5),
+)
+
+
+def log_activity(**fields):
+    """Reemplazo de ActivityLog.objects.create(...) que no bloquea el request"""
+    activity_writer.log(**fields)
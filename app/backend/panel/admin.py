@@ -1,11 +1,12 @@
 from django.contrib import admin
-from .models import Product, Tenant, TenantUser, ActivityLog
+from .models import Product, Tenant, TenantUser, ActivityLog, TenantStats, ProvisioningJob, WarmDatabase
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['display_name', 'name', 'is_active', 'created_at']
+    list_display = ['display_name', 'name', 'is_active', 'template_db', 'created_at']
     list_filter = ['is_active']
     search_fields = ['name', 'display_name']
+    readonly_fields = ['template_db', 'template_db_built_at']
 
 @admin.register(Tenant)
 class TenantAdmin(admin.ModelAdmin):
@@ -26,3 +27,23 @@ class ActivityLogAdmin(admin.ModelAdmin):
     list_filter = ['action', 'created_at']
     search_fields = ['description']
     readonly_fields = ['created_at']
+
+@admin.register(TenantStats)
+class TenantStatsAdmin(admin.ModelAdmin):
+    list_display = ['tenant', 'db_size_bytes', 'table_count', 'estimated_rows', 'user_count', 'is_reachable', 'refreshed_at']
+    list_filter = ['is_reachable']
+    search_fields = ['tenant__subdomain', 'tenant__db_name']
+    readonly_fields = ['refreshed_at']
+
+@admin.register(ProvisioningJob)
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tenant', 'status', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['tenant__subdomain']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'heartbeat_at']
+
+@admin.register(WarmDatabase)
+class WarmDatabaseAdmin(admin.ModelAdmin):
+    list_display = ['db_name', 'product', 'template_db', 'created_at']
+    list_filter = ['product']
+    readonly_fields = ['created_at']
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from ..models import Tenant, Product
+from ..models import Tenant, Product, ActivityLog
 from django.contrib.auth.models import User
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -22,3 +22,15 @@ class TenantSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at'
         ]
         read_only_fields = ['db_name', 'created_at', 'updated_at', 'url']
+
+class ActivityLogSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+    tenant_subdomain = serializers.CharField(source='tenant.subdomain', read_only=True, default=None)
+    
+    class Meta:
+        model = ActivityLog
+        fields = [
+            'id', 'action', 'description', 'ip_address',
+            'user', 'username', 'tenant', 'tenant_subdomain', 'created_at'
+        ]
+        read_only_fields = fields
@@ -6,6 +6,7 @@ urlpatterns = [
     path('tenants/<int:pk>/', views.TenantDetailView.as_view(), name='api_tenant_detail'),
     path('tenants/<int:pk>/convert/', views.ConvertTenantView.as_view(), name='api_convert_tenant'),
     path('products/', views.ProductListView.as_view(), name='api_products'),
+    path('activity/', views.ActivityListView.as_view(), name='api_activity'),
     path('deployments/sync/', views.SyncDeploymentsView.as_view(), name='api_sync_deployments'),
     
     # Webhook de GitHub para auto-deployment
@@ -1,56 +1,87 @@
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import BasePermission, IsAuthenticated
 from django.conf import settings
 from ..models import Tenant, Product, ActivityLog
-from .serializers import TenantSerializer, ProductSerializer
+from .serializers import TenantSerializer, ProductSerializer, ActivityLogSerializer
+from ..db_pool import db_pool
+from ..activity import log_activity
+from ..filters import filter_activity, filter_tenants
+from ..pagination import KeysetPagination
+from ..template_dbs import ready_template
+from ..warm_pool import claim_warm_database
 import requests
-import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import secrets
+
+class IsSuperuser(BasePermission):
+    """Solo superusuarios, igual que las vistas del panel con is_superuser"""
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
 
 class TenantListCreateView(generics.ListCreateAPIView):
     queryset = Tenant.objects.select_related('product', 'owner').all()
     serializer_class = TenantSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    
+    def get_queryset(self):
+        # ?status=&type=&plan=&product=&q= ; páginas con ?cursor=
+        return filter_tenants(super().get_queryset(), self.request.query_params)
     
     def perform_create(self, serializer):
         subdomain = serializer.validated_data['subdomain']
-        db_name = f"tenant_{subdomain}"
-        
-        self.create_database(db_name)
+        product = serializer.validated_data['product']
+        # Mismos nombres que create_workspace (los guiones romperían el RENAME del pool)
+        db_name, db_user = Tenant.db_identifiers(subdomain)
+        db_password = secrets.token_urlsafe(24)
         
+        # Primero el Tenant y después la BD, como en el paso de aprovisionamiento:
+        # una BD reclamada del pool nunca queda sin un Tenant que la apunte
         tenant = serializer.save(
             db_name=db_name,
+            db_user=db_user,
+            db_password=db_password,
             owner=self.request.user
         )
+        try:
+            if not claim_warm_database(product, db_name, db_user, db_password):
+                # Sin BD del pool: se crea con el rol del master
+                tenant.db_user = ''
+                tenant.db_password = ''
+                tenant.save(update_fields=['db_user', 'db_password'])
+                self.create_database(db_name, product)
+        except Exception:
+            tenant.delete()
+            raise
         
-        ActivityLog.objects.create(
+        log_activity(
             tenant=tenant,
             user=self.request.user,
             action='create',
             description=f'Tenant {tenant.company_name} creado vía API'
         )
     
-    def create_database(self, db_name):
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database='postgres'
-        )
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
-        
-        cursor.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}'")
-        exists = cursor.fetchone()
-        
-        if not exists:
-            cursor.execute(f"CREATE DATABASE {db_name}")
+    def create_database(self, db_name, product):
+        # Clonar la plantilla migrada del producto si está al día
+        template = ready_template(product)
+        with db_pool.connection('postgres', autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}'")
+                exists = cursor.fetchone()
+                
+                if exists:
+                    return
+                if template:
+                    cursor.execute(f"CREATE DATABASE {db_name} TEMPLATE {template[0]}")
+                else:
+                    cursor.execute(f"CREATE DATABASE {db_name}")
         
-        cursor.close()
-        conn.close()
+        if template:
+            with db_pool.connection(db_name, autocommit=True) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"REASSIGN OWNED BY {template[1]} TO CURRENT_USER")
+                    cursor.execute(f"REVOKE ALL ON SCHEMA public FROM {template[1]}")
 
 class TenantDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Tenant.objects.select_related('product', 'owner').all()
@@ -73,7 +104,7 @@ class ConvertTenantView(APIView):
             
             tenant.save()
             
-            ActivityLog.objects.create(
+            log_activity(
                 tenant=tenant,
                 user=request.user,
                 action='update',
@@ -97,6 +128,17 @@ class ProductListView(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
+class ActivityListView(generics.ListAPIView):
+    queryset = ActivityLog.objects.select_related('user', 'tenant')
+    serializer_class = ActivityLogSerializer
+    # El log incluye IPs y descripciones de todos los tenants
+    permission_classes = [IsAuthenticated, IsSuperuser]
+    pagination_class = KeysetPagination
+    
+    def get_queryset(self):
+        # ?tenant=&user=&action=&date_from=&date_to= ; páginas con ?cursor=
+        return filter_activity(super().get_queryset(), self.request.query_params)
+
 class SyncDeploymentsView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -140,7 +182,6 @@ class GitHubWebhookView(APIView):
         import hashlib
         import subprocess
         import docker
-        from ..models import ActivityLog
         
         # 1. Validar signature de GitHub
         signature = request.headers.get('X-Hub-Signature-256', '')
@@ -190,7 +231,7 @@ class GitHubWebhookView(APIView):
                 docker_output = f"Docker restart failed: {str(docker_err)}"
             
             # 6. Log de actividad
-            ActivityLog.objects.create(
+            log_activity(
                 user=None,
                 action='auto-deploy',
                 description=f'Auto-deployment ejecutado para {product_name}',
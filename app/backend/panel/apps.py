@@ -4,3 +4,6 @@ class PanelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'panel'
     verbose_name = 'Panel de Administración'
+
+    def ready(self):
+        from . import signals  # noqa: F401
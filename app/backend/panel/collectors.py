@@ -0,0 +1,45 @@
+"""
+Recolección concurrente de estadísticas de las BDs de los tenants
+
+Cada tenant vive en su propia base de datos, así que consultarlos en serie
+hace que la latencia crezca linealmente con la flota. Aquí las consultas se
+reparten en un pool de hilos acotado, con timeout por tenant y un plazo
+global: los tenants que no responden se marcan como degradados en vez de
+bloquear la página completa.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+
+def fan_out(items, task, key=lambda item: item.id, max_workers=None, deadline=None):
+    """
+    Ejecuta task(item) en paralelo y retorna {key(item): resultado}.
+    Cada resultado es {'degraded': False, 'value': ...} o
+    {'degraded': True, 'error': '...'} si falló o no terminó a tiempo.
+    """
+    items = list(items)
+    if not items:
+        return {}
+
+    max_workers = max_workers or getattr(settings, 'STATS_COLLECTOR_MAX_WORKERS', 8)
+    deadline = deadline or getattr(settings, 'STATS_COLLECTOR_DEADLINE', 10)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='collector')
+    try:
+        futures = {executor.submit(task, item): key(item) for item in items}
+        done, _ = wait(futures, timeout=deadline)
+
+        results = {}
+        for future, item_key in futures.items():
+            if future not in done:
+                results[item_key] = {'degraded': True, 'error': 'Sin respuesta (timeout)'}
+                continue
+            try:
+                results[item_key] = {'degraded': False, 'value': future.result()}
+            except Exception as e:
+                results[item_key] = {'degraded': True, 'error': str(e)}
+        return results
+    finally:
+        # No esperar a los tenants colgados: sus conexiones tienen su propio timeout
+        executor.shutdown(wait=False, cancel_futures=True)
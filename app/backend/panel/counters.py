@@ -0,0 +1,53 @@
+"""
+Contadores agregados de tenants para dashboard y bases de datos
+
+Una sola query con agregados condicionales en vez de un COUNT(*) por
+métrica, guardada en la cache de Django con un TTL corto. Las señales de
+Tenant la invalidan al confirmar la transacción.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Tenant
+
+COUNTERS_CACHE_KEY = 'panel:tenant-counters'
+
+
+def compute_tenant_counters():
+    """Calcula todos los contadores de tenants en una query"""
+    return Tenant.objects.aggregate(
+        total_tenants=Count('id'),
+        active_tenants=Count('id', filter=Q(status='active')),
+        dedicated_count=Count('id', filter=Q(type='dedicated')),
+        shared_count=Count('id', filter=Q(type='shared')),
+    )
+
+
+def get_tenant_counters():
+    """Contadores desde la cache; si no están (o la cache falla), se recalculan"""
+    try:
+        counters = cache.get(COUNTERS_CACHE_KEY)
+    except Exception as e:
+        print(f"[COUNTERS] Cache no disponible: {e}")
+        return compute_tenant_counters()
+
+    if counters is None:
+        counters = compute_tenant_counters()
+        try:
+            cache.set(COUNTERS_CACHE_KEY, counters, getattr(settings, 'TENANT_COUNTERS_TTL', 30))
+        except Exception as e:
+            print(f"[COUNTERS] Error guardando en cache: {e}")
+    return counters
+
+
+def invalidate_tenant_counters():
+    """Borra los contadores cacheados cuando confirme la transacción actual"""
+    def delete():
+        try:
+            cache.delete(COUNTERS_CACHE_KEY)
+        except Exception as e:
+            print(f"[COUNTERS] Error invalidando cache: {e}")
+
+    transaction.on_commit(delete)
@@ -0,0 +1,273 @@
+"""
+Pool compartido de conexiones psycopg2 para las utilidades de BD del panel
+
+Las funciones auxiliares de views (conteo de tablas, consola SQL, creación y
+eliminación de BDs) abrían una conexión nueva en cada llamada. Este pool
+reutiliza conexiones por (host, port, database, user), con tope por clave y
+global, desalojo de conexiones inactivas y health check antes de reusar.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from django.conf import settings
+
+
+class PoolExhausted(Exception):
+    """No hubo conexión disponible dentro del timeout"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Conexión que recuerda su clave y generación dentro del pool"""
+    _pool_key = None
+    _pool_generation = 0
+
+
+class PostgresPool:
+    def __init__(self, max_per_key=4, max_total=32, max_idle_seconds=300,
+                 health_check_after=30, acquire_timeout=10, connect_timeout=10):
+        self.max_per_key = max_per_key
+        self.max_total = max_total
+        self.max_idle_seconds = max_idle_seconds
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self.connect_timeout = connect_timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = {}        # key -> [(conn, returned_at), ...]
+        self._open = {}        # key -> conexiones abiertas (libres + en uso)
+        self._total = 0
+        self._generation = {}  # key -> generación; discard() la incrementa
+
+    def make_key(self, database, host=None, port=None, user=None):
+        default = settings.DATABASES['default']
+        return (
+            host or default['HOST'],
+            str(port or default['PORT']),
+            database,
+            user or default['USER'],
+        )
+
+    def acquire(self, database, host=None, port=None, user=None, password=None, autocommit=False,
+                timeout=None):
+        """
+        Toma una conexión del pool (o abre una nueva si hay cupo). timeout
+        acota tanto la espera por cupo como el connect de una conexión nueva.
+        """
+        key = self.make_key(database, host, port, user)
+        deadline = time.monotonic() + (timeout or self.acquire_timeout)
+
+        while True:
+            with self._cond:
+                if self._pid != os.getpid():
+                    # Proceso forkeado: las conexiones del padre no son nuestras
+                    self._reset()
+                conn, returned_at = self._reserve(key, database, deadline)
+                generation = self._generation.get(key, 0)
+
+            if conn is None:
+                try:
+                    conn = self._connect(key, password, timeout)
+                except Exception:
+                    with self._cond:
+                        self._forget(key)
+                        self._cond.notify()
+                    raise
+                break
+
+            # El health check va sin el lock: una conexión colgada solo demora a este hilo
+            if time.monotonic() - returned_at < self.health_check_after or self._is_healthy(conn):
+                break
+            self._close(conn)
+            with self._cond:
+                self._forget(key)
+                self._cond.notify()
+
+        conn.autocommit = autocommit
+        conn._pool_key = key
+        conn._pool_generation = generation
+        return conn
+
+    def release(self, conn, discard=False, reset_session=False):
+        """Devuelve la conexión al pool, o la cierra si quedó inservible"""
+        key = conn._pool_key
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if reset_session:
+                    # Deshacer SET, prepared statements, temp tables, etc.
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute('DISCARD ALL')
+                conn.autocommit = False
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            stale = conn._pool_generation != self._generation.get(key, 0)
+            if discard or stale or conn.closed:
+                self._close(conn)
+                self._forget(key)
+            else:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, database, host=None, port=None, user=None, password=None,
+                   autocommit=False, reset_session=False, timeout=None):
+        conn = self.acquire(database, host, port, user, password, autocommit, timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken, reset_session=reset_session)
+
+    def discard(self, database, host=None, port=None, user=None):
+        """
+        Cierra las conexiones libres de una BD y marca las que estén en uso
+        para cerrarse al devolverse (p.ej. antes de un DROP DATABASE).
+        """
+        def matches(key):
+            return (
+                key[2] == database
+                and (not host or key[0] == host)
+                and (not port or key[1] == str(port))
+                and (not user or key[3] == user)
+            )
+
+        with self._cond:
+            for key in set(self._idle) | set(self._open):
+                if not matches(key):
+                    continue
+                self._generation[key] = self._generation.get(key, 0) + 1
+                for conn, _ in self._idle.pop(key, []):
+                    self._close(conn)
+                    self._forget(key)
+            self._cond.notify_all()
+
+    def close_all(self):
+        with self._cond:
+            for key, entries in list(self._idle.items()):
+                for conn, _ in entries:
+                    self._close(conn)
+                    self._forget(key)
+            self._idle = {}
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'total': self._total,
+                'idle': sum(len(entries) for entries in self._idle.values()),
+                'keys': len(self._open),
+            }
+
+    def _connect(self, key, password, timeout=None):
+        host, port, database, user = key
+        if password is None:
+            password = settings.DATABASES['default']['PASSWORD']
+        return psycopg2.connect(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            # libpq exige un entero y trata 1 como 2 segundos
+            connect_timeout=max(2, int(timeout or self.connect_timeout)),
+            connection_factory=PooledConnection,
+        )
+
+    def _reserve(self, key, database, deadline):
+        """
+        Con el lock tomado: (conexión libre, devuelta_en) para reusar, o
+        (None, None) si se reservó cupo para abrir una nueva
+        """
+        while True:
+            self._evict_idle()
+            entries = self._idle.get(key)
+            while entries:
+                conn, returned_at = entries.pop()
+                if not conn.closed:
+                    return conn, returned_at
+                self._forget(key)
+
+            if self._open.get(key, 0) < self.max_per_key:
+                if self._total >= self.max_total:
+                    self._close_oldest_idle()
+                if self._total < self.max_total:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    self._total += 1
+                    return None, None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolExhausted(f"Sin conexiones disponibles para {database}")
+            self._cond.wait(remaining)
+
+    def _is_healthy(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self):
+        limit = time.monotonic() - self.max_idle_seconds
+        for key in list(self._idle):
+            keep = []
+            for conn, returned_at in self._idle[key]:
+                if returned_at < limit:
+                    self._close(conn)
+                    self._forget(key)
+                else:
+                    keep.append((conn, returned_at))
+            self._idle[key] = keep
+
+    def _close_oldest_idle(self):
+        oldest = None
+        for key, entries in self._idle.items():
+            for index, (conn, returned_at) in enumerate(entries):
+                if oldest is None or returned_at < oldest[2]:
+                    oldest = (key, index, returned_at)
+        if oldest is not None:
+            key, index, _ = oldest
+            conn, _ = self._idle[key].pop(index)
+            self._close(conn)
+            self._forget(key)
+
+    def _forget(self, key):
+        self._open[key] = self._open.get(key, 1) - 1
+        self._total -= 1
+        if self._open[key] <= 0:
+            self._open.pop(key, None)
+            if not self._idle.get(key):
+                self._idle.pop(key, None)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+db_pool = PostgresPool(
+    max_per_key=getattr(settings, 'DB_POOL_MAX_PER_KEY', 4),
+    max_total=getattr(settings, 'DB_POOL_MAX_TOTAL', 32),
+    max_idle_seconds=getattr(settings, 'DB_POOL_MAX_IDLE', 300),
+)
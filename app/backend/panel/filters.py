@@ -0,0 +1,84 @@
+"""
+Filtros de listados del panel, compartidos por las vistas HTML y la API
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+TENANT_FILTER_FIELDS = ('status', 'type', 'plan', 'product')
+
+
+def filter_tenants(queryset, params):
+    """
+    Aplica los filtros status/type/plan/product y la búsqueda q (subdominio
+    o empresa). Cada filtro tiene un índice (campo, created_at, id) y la
+    búsqueda un índice trigram, para combinar con la paginación keyset.
+    """
+    for field in ('status', 'type', 'plan'):
+        value = params.get(field)
+        if value:
+            queryset = queryset.filter(**{field: value})
+
+    product = params.get('product')
+    if product:
+        if product.isdigit():
+            queryset = queryset.filter(product_id=int(product))
+        else:
+            queryset = queryset.filter(product__name=product)
+
+    search = (params.get('q') or '').strip()
+    if search:
+        queryset = queryset.filter(Q(subdomain__icontains=search) | Q(company_name__icontains=search))
+
+    return queryset
+
+
+ACTIVITY_FILTER_FIELDS = ('tenant', 'user', 'action', 'date_from', 'date_to')
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def _start_of_day(value):
+    return timezone.make_aware(datetime.combine(value, time.min))
+
+
+def filter_activity(queryset, params):
+    """
+    Filtra ActivityLog por tenant (id o subdominio), user (id o username),
+    action y rango de fechas date_from/date_to (YYYY-MM-DD, ambos inclusive).
+    """
+    tenant = (params.get('tenant') or '').strip()
+    if tenant:
+        if tenant.isdigit():
+            queryset = queryset.filter(tenant_id=int(tenant))
+        else:
+            queryset = queryset.filter(tenant__subdomain=tenant)
+
+    user = (params.get('user') or '').strip()
+    if user:
+        if user.isdigit():
+            queryset = queryset.filter(user_id=int(user))
+        else:
+            queryset = queryset.filter(user__username=user)
+
+    action = params.get('action')
+    if action:
+        queryset = queryset.filter(action=action)
+
+    # Fechas mal formadas se ignoran, igual que un filtro vacío
+    date_from = _parse_day(params.get('date_from'))
+    if date_from:
+        queryset = queryset.filter(created_at__gte=_start_of_day(date_from))
+
+    date_to = _parse_day(params.get('date_to'))
+    if date_to:
+        queryset = queryset.filter(created_at__lt=_start_of_day(date_to + timedelta(days=1)))
+
+    return queryset
@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.utils import timezone
+
+from panel.models import ActivityLog
+
+ARCHIVE_FIELDS = [
+    'id', 'tenant_id', 'tenant__subdomain', 'user_id', 'user__username',
+    'action', 'description', 'ip_address', 'created_at',
+]
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return month_start(month_start(value) + timedelta(days=32))
+
+
+class Command(BaseCommand):
+    help = (
+        'Archiva los meses completos de ActivityLog más viejos que la retención '
+        'en NDJSON comprimido (activity_YYYY-MM.ndjson.gz) y luego los elimina'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'ACTIVITY_LOG_RETENTION_DAYS', 180),
+            help='Días de actividad que se conservan en la BD',
+        )
+        parser.add_argument(
+            '--output',
+            default=getattr(settings, 'ACTIVITY_ARCHIVE_DIR', 'archive/activity'),
+            help='Directorio de los archivos NDJSON',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por lote de lectura/eliminación')
+        parser.add_argument('--dry-run', action='store_true', help='Solo mostrar qué meses se archivarían')
+        parser.add_argument('--loop', action='store_true', help='Archivar periódicamente sin terminar')
+        parser.add_argument('--interval', type=int, default=86400, help='Segundos entre ejecuciones con --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                self.archive(options)
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f"✗ Error archivando actividad: {e}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def archive(self, options):
+        # Solo meses completos: el corte es el inicio del mes que contiene (hoy - días)
+        cutoff = month_start(timezone.localtime() - timedelta(days=options['days']))
+        oldest = ActivityLog.objects.filter(created_at__lt=cutoff).order_by('created_at').first()
+        if oldest is None:
+            self.stdout.write(f"✓ Nada que archivar antes de {cutoff:%Y-%m-%d}")
+            return
+
+        os.makedirs(options['output'], exist_ok=True)
+        month = month_start(timezone.localtime(oldest.created_at))
+        while month < cutoff:
+            end = next_month(month)
+            self.archive_month(month, end, options)
+            month = end
+
+    def archive_month(self, start, end, options):
+        rows = ActivityLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        count = rows.count()
+        if not count:
+            return
+
+        path = os.path.join(options['output'], f"activity_{start:%Y-%m}.ndjson.gz")
+        if options['dry_run']:
+            self.stdout.write(f"  {start:%Y-%m}: {count} entradas → {path}")
+            return
+
+        started = time.monotonic()
+        # La corrida se escribe en un temporal del mismo directorio y reemplaza al archivo
+        # con os.replace: un corte a mitad de escritura nunca deja un archivo final truncado.
+        # Si el mes ya tenía archivo (corrida anterior), su contenido se copia primero y se
+        # omiten las filas que ya estaban (corte entre el rename y el borrado).
+        archived_ids = set()
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as existing:
+                archived_ids = {json.loads(line)['id'] for line in existing if line.strip()}
+
+        encoder = DjangoJSONEncoder()
+        exported_ids = []
+        fd, tmp = tempfile.mkstemp(dir=options['output'], prefix=f".activity_{start:%Y-%m}.", suffix='.partial')
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                if archived_ids:
+                    # Miembros gzip concatenados: zcat y gzip.open los leen como un solo archivo
+                    with open(path, 'rb') as existing:
+                        shutil.copyfileobj(existing, raw)
+                with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                    for row in rows.order_by('id').values(*ARCHIVE_FIELDS).iterator(chunk_size=options['batch_size']):
+                        if row['id'] not in archived_ids:
+                            archive.write((encoder.encode(row) + '\n').encode('utf-8'))
+                        exported_ids.append(row['id'])
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        dir_fd = os.open(options['output'], os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        # Borrar solo lo que ya está en el archivo final, en lotes cortos
+        deleted = 0
+        batch_size = options['batch_size']
+        for index in range(0, len(exported_ids), batch_size):
+            deleted += ActivityLog.objects.filter(id__in=exported_ids[index:index + batch_size]).delete()[0]
+
+        size = os.path.getsize(path)
+        self.stdout.write(
+            f"✓ {start:%Y-%m}: {len(exported_ids)} entradas archivadas, {deleted} eliminadas "
+            f"({size / 1024:.1f} KB, {time.monotonic() - started:.1f}s)"
+        )
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from panel.models import Product
+from panel.template_dbs import build_template, template_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Construye la BD plantilla migrada (tpl_<producto>_<hash>) de cada producto '
+        'cuando cambian sus migraciones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', help='Nombre de un único producto')
+        parser.add_argument('--force', action='store_true', help='Reconstruir aunque el hash no haya cambiado')
+        parser.add_argument('--loop', action='store_true', help='Revisar periódicamente sin terminar')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'TEMPLATE_DB_INTERVAL', 300),
+            help='Segundos entre revisiones con --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            products = Product.objects.filter(is_active=True)
+            if options['product']:
+                products = products.filter(name=options['product'])
+
+            for product in products:
+                try:
+                    current = template_name(product)
+                    if current and current == product.template_db and not options['force']:
+                        continue
+                    name = build_template(product, force=options['force'])
+                    self.stdout.write(f"✓ {product.name}: {name}")
+                except Exception as e:
+                    if not options['loop'] and options['product']:
+                        raise
+                    self.stderr.write(f"✗ Error construyendo plantilla de {product.name}: {e}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
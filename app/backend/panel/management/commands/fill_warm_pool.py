@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from panel.warm_pool import fill_pool
+
+
+class Command(BaseCommand):
+    help = 'Mantiene por producto WARM_POOL_SIZE BDs y roles listos para asignar a tenants nuevos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=getattr(settings, 'WARM_POOL_SIZE', 3),
+            help='BDs listas por producto',
+        )
+        parser.add_argument('--loop', action='store_true', help='Rellenar periódicamente sin terminar')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'WARM_POOL_INTERVAL', 30),
+            help='Segundos entre rellenos con --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                summary = fill_pool(options['size'])
+                if any(summary.values()) or not options['loop']:
+                    self.stdout.write(
+                        f"✓ {summary['created']} creadas, {summary['recycled']} recicladas, "
+                        f"{summary['orphans']} huérfanas eliminadas"
+                    )
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f"✗ Error rellenando el pool: {e}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
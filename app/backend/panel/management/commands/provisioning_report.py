@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from panel.models import ProvisioningJob
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Resume la duración de cada paso en los últimos jobs de aprovisionamiento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--last', type=int, default=100, help='Cantidad de jobs terminados a analizar')
+
+    def handle(self, *args, **options):
+        jobs = list(
+            ProvisioningJob.objects.filter(status__in=['succeeded', 'failed'])
+            .order_by('-created_at')
+            .values('status', 'steps', 'started_at', 'finished_at')[:options['last']]
+        )
+        if not jobs:
+            self.stdout.write('Sin jobs terminados')
+            return
+
+        durations = {}
+        retries = {}
+        failures = {}
+        for job in jobs:
+            for step in job['steps']:
+                if step.get('duration_s') is None:
+                    continue
+                durations.setdefault(step['label'], []).append(step['duration_s'])
+                retries[step['label']] = retries.get(step['label'], 0) + max(step.get('attempts', 1) - 1, 0)
+                if step['status'] in ('failed', 'warning'):
+                    failures[step['label']] = failures.get(step['label'], 0) + 1
+
+        totals = [
+            (job['finished_at'] - job['started_at']).total_seconds()
+            for job in jobs if job['started_at'] and job['finished_at']
+        ]
+        failed = sum(1 for job in jobs if job['status'] == 'failed')
+        self.stdout.write(f"{len(jobs)} jobs ({failed} fallidos)")
+        if totals:
+            self.stdout.write(
+                f"Total por job: media {sum(totals) / len(totals):.1f}s, "
+                f"p95 {percentile(totals, 0.95):.1f}s, máx {max(totals):.1f}s"
+            )
+
+        self.stdout.write(f"\n{'Paso':45} {'n':>5} {'media':>8} {'p95':>8} {'máx':>8} {'reint.':>7} {'fallos':>7}")
+        for label, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            self.stdout.write(
+                f"{label[:45]:45} {len(values):>5} {sum(values) / len(values):>7.1f}s "
+                f"{percentile(values, 0.95):>7.1f}s {max(values):>7.1f}s "
+                f"{retries.get(label, 0):>7} {failures.get(label, 0):>7}"
+            )
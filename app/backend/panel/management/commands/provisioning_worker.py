@@ -0,0 +1,39 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from panel.provisioning import worker_loop
+
+
+class Command(BaseCommand):
+    help = 'Worker que ejecuta los jobs de aprovisionamiento de workspaces (ProvisioningJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'PROVISIONING_WORKER_CONCURRENCY', 3),
+            help='Jobs ejecutados en paralelo',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=int,
+            default=getattr(settings, 'PROVISIONING_POLL_INTERVAL', 3),
+            help='Segundos entre revisiones de la BD cuando no llegan avisos por Redis',
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            # Dejar de tomar jobs nuevos; los que están corriendo terminan
+            self.stdout.write('Deteniendo worker, esperando jobs en curso...')
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"✓ Worker de aprovisionamiento iniciado (concurrencia {options['concurrency']})")
+        worker_loop(options['concurrency'], options['poll_interval'], stop_event)
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from panel.models import Tenant
+from panel.stats import refresh_tenant_stats
+
+
+class Command(BaseCommand):
+    help = 'Refresca el snapshot de estadísticas (TenantStats) de las BDs de los tenants'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='db_name de un único tenant a refrescar')
+        parser.add_argument('--loop', action='store_true', help='Refrescar periódicamente sin terminar')
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=getattr(settings, 'TENANT_STATS_INTERVAL', 300),
+            help='Segundos entre refrescos con --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            tenants = Tenant.objects.select_related('product')
+            if options['tenant']:
+                tenants = tenants.filter(db_name=options['tenant'])
+
+            try:
+                updated, failed = refresh_tenant_stats(tenants)
+                self.stdout.write(f"✓ {updated} tenants actualizados, {failed} sin respuesta")
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f"✗ Error refrescando estadísticas: {e}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
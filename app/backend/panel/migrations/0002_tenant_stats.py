@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_size_bytes', models.BigIntegerField(default=0)),
+                ('table_count', models.IntegerField(default=0)),
+                ('estimated_rows', models.BigIntegerField(default=0)),
+                ('dead_rows', models.BigIntegerField(default=0)),
+                ('user_count', models.IntegerField(default=0)),
+                ('is_reachable', models.BooleanField(default=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('refreshed_at', models.DateTimeField(db_index=True)),
+                ('tenant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='panel.tenant')),
+            ],
+            options={
+                'db_table': 'panel_tenant_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_product_user_indexes(apps, schema_editor):
+    """Indexa las tablas {product}_users_master de los productos existentes"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    Product = apps.get_model('panel', 'Product')
+    with schema_editor.connection.cursor() as cursor:
+        for name in Product.objects.values_list('name', flat=True):
+            cursor.execute("SELECT to_regclass(%s)", [f'{name}_users_master'])
+            if cursor.fetchone()[0] is None:
+                continue
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {name}_users_master_tenant_idx
+                ON {name}_users_master (tenant_id, is_super_admin)
+            """)
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {name}_users_master_super_admin_idx
+                ON {name}_users_master (is_super_admin) WHERE is_super_admin
+            """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0002_tenant_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_user_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_search_indexes(apps, schema_editor):
+    """Índices trigram para la búsqueda icontains (UPPER(col) LIKE UPPER('%q%'))"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in ('subdomain', 'company_name'):
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS tenant_{column}_trgm_idx
+                ON panel_tenant USING gin (UPPER({column}::text) gin_trgm_ops)
+            """)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for column in ('subdomain', 'company_name'):
+            cursor.execute(f"DROP INDEX IF EXISTS tenant_{column}_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0003_product_users_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['created_at', 'id'], name='tenant_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='tenant_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['type', 'created_at', 'id'], name='tenant_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['plan', 'created_at', 'id'], name='tenant_plan_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='tenant_product_created_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0008_provisioning_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='template_db',
+            field=models.CharField(blank=True, help_text='BD plantilla migrada (tpl_<producto>_<hash>)', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='template_db_built_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0009_product_template_db'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WarmDatabase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('db_name', models.CharField(max_length=100, unique=True)),
+                ('db_user', models.CharField(max_length=100, unique=True)),
+                ('template_db', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warm_databases', to='panel.product')),
+            ],
+            options={
+                'db_table': 'panel_warm_database',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['product', 'template_db', 'created_at'], name='warm_product_template_idx')],
+            },
+        ),
+    ]
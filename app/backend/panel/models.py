@@ -10,6 +10,8 @@ class Product(models.Model):
     docker_image = models.CharField(max_length=200, blank=True)
     template_path = models.CharField(max_length=255, blank=True, help_text="Path en /opt/proyectos/")
     github_repo_url = models.CharField(max_length=500, blank=True, help_text="URL del repositorio GitHub del código base")
+    template_db = models.CharField(max_length=100, blank=True, help_text="BD plantilla migrada (tpl_<producto>_<hash>)")
+    template_db_built_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -74,6 +76,20 @@ class Tenant(models.Model):
     class Meta:
         db_table = 'panel_tenant'
         ordering = ['-created_at']
+        # Paginación keyset (created_at, id), sola o detrás de cada filtro
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='tenant_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='tenant_status_created_idx'),
+            models.Index(fields=['type', 'created_at', 'id'], name='tenant_type_created_idx'),
+            models.Index(fields=['plan', 'created_at', 'id'], name='tenant_plan_created_idx'),
+            models.Index(fields=['product', 'created_at', 'id'], name='tenant_product_created_idx'),
+        ]
+
+    @staticmethod
+    def db_identifiers(subdomain):
+        """(db_name, db_user) del tenant: el subdominio sin guiones, válido como identificador SQL"""
+        safe_subdomain = subdomain.replace('-', '_')
+        return f"tenant_{safe_subdomain}", f"user_{safe_subdomain}"
 
     def __str__(self):
         return f"{self.company_name} ({self.subdomain})"
@@ -123,11 +139,95 @@ class ActivityLog(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     description = models.TextField()
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default en vez de auto_now_add: las entradas se escriben por lotes (panel.activity)
+    # y deben conservar la hora del evento, no la del bulk_create
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         db_table = 'panel_activity_log'
         ordering = ['-created_at']
+        # Actividad reciente global y por workspace; el historial viejo se
+        # archiva con el comando archive_activity
+        indexes = [
+            models.Index(fields=['created_at'], name='activity_created_idx'),
+            models.Index(fields=['tenant', 'created_at'], name='activity_tenant_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='activity_user_created_idx'),
+            models.Index(fields=['action', 'created_at'], name='activity_action_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.action} - {self.created_at}"
+
+class TenantStats(models.Model):
+    """Snapshot de estadísticas de la BD de un tenant (lo llena refresh_tenant_stats)"""
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, related_name='stats')
+    db_size_bytes = models.BigIntegerField(default=0)
+    table_count = models.IntegerField(default=0)
+    estimated_rows = models.BigIntegerField(default=0)
+    dead_rows = models.BigIntegerField(default=0)
+    user_count = models.IntegerField(default=0)
+    is_reachable = models.BooleanField(default=True)
+    last_error = models.TextField(blank=True)
+    refreshed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'panel_tenant_stats'
+
+    def __str__(self):
+        return f"Stats {self.tenant.subdomain} ({self.refreshed_at})"
+
+class ProvisioningJob(models.Model):
+    """Aprovisionamiento de un workspace, ejecutado por el worker (provisioning_worker)"""
+    STATUS_CHOICES = [
+        ('queued', 'En cola'),
+        ('running', 'En progreso'),
+        ('succeeded', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    tenant = models.ForeignKey(Tenant, on_delete=models.SET_NULL, null=True, blank=True, related_name='provisioning_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    params = models.JSONField(default=dict, blank=True)
+    # [{'name', 'label', 'depends_on', 'status', 'detail', 'attempts',
+    #   'started_at', 'finished_at', 'duration_s', 'output'}, ...]
+    steps = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'panel_provisioning_job'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='provisioning_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+class WarmDatabase(models.Model):
+    """BD y rol ya creados, listos para asignar a un tenant nuevo (pool tibio)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='warm_databases')
+    db_name = models.CharField(max_length=100, unique=True)
+    db_user = models.CharField(max_length=100, unique=True)
+    # Plantilla de la que se clonó ('' = BD vacía); solo se asigna si sigue vigente
+    template_db = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'panel_warm_database'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['product', 'template_db', 'created_at'], name='warm_product_template_idx'),
+        ]
+
+    def __str__(self):
+        return self.db_name
@@ -0,0 +1,59 @@
+"""
+Lectura de usuarios de productos desde {product}_users_master
+
+Las tablas de usuarios de cada producto viven en la BD master. La usan
+views (listados por tenant) y stats (conteo por lote para el snapshot).
+"""
+from django.db import connection
+
+
+def get_product_users(product_name, tenant_id=None):
+    """Obtiene usuarios de la tabla {product}_users_master"""
+    try:
+        with connection.cursor() as cursor:
+            if tenant_id:
+                cursor.execute(f"""
+                    SELECT id, username, email, phone, login_type, is_super_admin, is_active, created_at
+                    FROM {product_name}_users_master
+                    WHERE tenant_id = %s OR is_super_admin = TRUE
+                    ORDER BY is_super_admin DESC, created_at DESC
+                """, [tenant_id])
+            else:
+                cursor.execute(f"""
+                    SELECT id, username, email, phone, login_type, is_super_admin, is_active, created_at
+                    FROM {product_name}_users_master
+                    ORDER BY is_super_admin DESC, created_at DESC
+                """)
+            
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error getting product users: {e}")
+        return []
+
+
+def count_product_users(product_name, tenant_ids):
+    """
+    Cuenta usuarios por tenant con un solo GROUP BY sobre {product}_users_master.
+    Igual que get_product_users, cada tenant incluye a los super admins.
+    Retorna {tenant_id: cantidad} para todos los tenant_ids dados.
+    """
+    tenant_ids = list(tenant_ids)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT
+                    tenant_id,
+                    COUNT(*) FILTER (WHERE is_super_admin IS NOT TRUE),
+                    COUNT(*) FILTER (WHERE is_super_admin IS TRUE)
+                FROM {product_name}_users_master
+                GROUP BY tenant_id
+            """)
+            rows = cursor.fetchall()
+    except Exception as e:
+        print(f"Error counting product users: {e}")
+        return {tenant_id: 0 for tenant_id in tenant_ids}
+    
+    super_admins = sum(admins for _, _, admins in rows)
+    per_tenant = {tenant_id: users for tenant_id, users, _ in rows if tenant_id is not None}
+    return {tenant_id: per_tenant.get(tenant_id, 0) + super_admins for tenant_id in tenant_ids}
@@ -0,0 +1,506 @@
+"""
+Aprovisionamiento de workspaces en segundo plano
+
+create_workspace solo registra el Tenant y un ProvisioningJob; la creación de
+la BD, los repositorios y los deploys (subprocesos de varios minutos) los
+ejecuta el comando provisioning_worker. Redis (lista QUEUE_KEY) avisa al
+worker de inmediato; la tabla panel_provisioning_job es la fuente de verdad,
+así que si Redis no está o pierde un aviso, el worker igual encuentra los
+jobs en cola consultando la BD.
+
+Cada job es un grafo de pasos (plan_steps): los independientes corren en
+paralelo, cada paso tiene reintentos y, si uno obligatorio falla, los pasos ya
+completados se deshacen (undo) en orden inverso. Cada paso registra intentos y
+duración (duration_s) en job.steps.
+"""
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .activity import log_activity
+from .models import ProvisioningJob
+from .redis_client import get_redis
+from .template_dbs import ready_template
+from .warm_pool import claim_warm_database, database_exists
+
+QUEUE_KEY = 'tenant-master:provisioning'
+
+
+class ProvisioningError(Exception):
+    """Un paso del aprovisionamiento falló"""
+
+
+class SkipStep(Exception):
+    """El paso no aplica (p. ej. no hay repo al que hacer push)"""
+
+
+def plan_steps(tenant, create_github_repo):
+    """
+    Grafo de pasos del job: [(nombre, dependencias), ...]. Los pasos sin
+    dependencias pendientes corren en paralelo (p. ej. la BD y el repo de
+    GitHub); el orden de la lista es solo el de presentación.
+    """
+    steps = [('create_database', []), ('product_admin', [])]
+    if create_github_repo:
+        if tenant.type == 'shared':
+            steps += [
+                ('product_repo', []),
+                ('deploy_shared', ['create_database', 'product_repo']),
+            ]
+        else:
+            steps += [
+                ('github_repo', []),
+                ('copy_source', []),
+                ('git_init', ['copy_source']),
+                ('push_repo', ['git_init', 'github_repo']),
+                ('finish_dedicated', ['create_database', 'git_init']),
+            ]
+    return steps
+
+
+def create_job(tenant, user, create_github_repo=False, ip_address=None):
+    """Crea el job del tenant y lo encola al confirmar la transacción"""
+    job = ProvisioningJob.objects.create(
+        tenant=tenant,
+        requested_by=user,
+        params={'create_github_repo': create_github_repo, 'ip_address': ip_address},
+        steps=[
+            {'name': name, 'label': STEPS[name]['label'], 'depends_on': depends_on, 'status': 'pending', 'detail': ''}
+            for name, depends_on in plan_steps(tenant, create_github_repo)
+        ],
+    )
+    transaction.on_commit(lambda: enqueue(job.id))
+    return job
+
+
+def enqueue(job_id):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.lpush(QUEUE_KEY, job_id)
+    except Exception as e:
+        # El worker también revisa la BD: el job no se pierde
+        print(f"[PROVISIONING] No se pudo encolar el job {job_id} en Redis: {e}")
+
+
+def claim(job_id):
+    """Marca el job como en progreso si sigue en cola (atómico entre workers)"""
+    now = timezone.now()
+    return ProvisioningJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=now, heartbeat_at=now,
+    ) == 1
+
+
+def next_queued_job():
+    """Reclama el job en cola más antiguo, o retorna None"""
+    for job_id in ProvisioningJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:10]:
+        if claim(job_id):
+            return job_id
+    return None
+
+
+def fail_stale_jobs():
+    """Jobs 'running' sin latido (worker caído) se marcan como fallidos"""
+    limit = timezone.now() - timedelta(seconds=getattr(settings, 'PROVISIONING_STALE_AFTER', 1800))
+    stale = ProvisioningJob.objects.filter(status='running', heartbeat_at__lt=limit).update(
+        status='failed', finished_at=timezone.now(), error='El worker se interrumpió durante el aprovisionamiento',
+    )
+    if stale:
+        print(f"[PROVISIONING] {stale} jobs interrumpidos marcados como fallidos")
+
+
+# ============================================
+# PASOS
+# ============================================
+# Cada paso recibe (job, tenant, step) y retorna el detalle a mostrar; puede
+# guardar datos para pasos posteriores o para su rollback en step['output'].
+
+def step_create_database(job, tenant, step):
+    from .views import create_database
+    # Único lugar donde se reclama del pool; en un reintento la BD puede existir ya
+    if not database_exists(tenant.db_name) and claim_warm_database(
+        tenant.product, tenant.db_name, tenant.db_user, tenant.db_password
+    ):
+        return f'BD {tenant.db_name} asignada del pool'
+    template = ready_template(tenant.product)
+    if create_database(tenant.db_name, tenant.db_user, tenant.db_password, template=template):
+        return f'BD {tenant.db_name} clonada de {template[0]}'
+    return f'BD {tenant.db_name} lista'
+
+
+def undo_create_database(job, tenant, step):
+    from .views import delete_database
+    delete_database(tenant.db_name, tenant.db_user)
+    return f'BD {tenant.db_name} eliminada'
+
+
+def step_product_admin(job, tenant, step):
+    from .views import ensure_super_admin_in_product
+    if job.requested_by:
+        ensure_super_admin_in_product(tenant.product.name, job.requested_by)
+    return ''
+
+
+def step_product_repo(job, tenant, step):
+    from .views import initialize_product_repo
+    product = tenant.product
+
+    if product.github_repo_url:
+        tenant.git_repo_url = product.github_repo_url
+        tenant.save(update_fields=['git_repo_url', 'updated_at'])
+        return f'Repositorio base ya existe: {product.github_repo_url}'
+
+    repo_result = initialize_product_repo(product.name)
+    if not repo_result.get('success'):
+        # Como antes: sin repo base el deploy se intenta igual
+        return f'⚠️ No se pudo inicializar repositorio: {repo_result.get("error")}'
+
+    product.github_repo_url = repo_result.get('repo_url', '')
+    product.template_path = repo_result.get('path', '')
+    product.save()
+
+    tenant.git_repo_url = product.github_repo_url
+    tenant.save(update_fields=['git_repo_url', 'updated_at'])
+    return f'Repositorio base inicializado: {product.github_repo_url}'
+
+
+def step_deploy_shared(job, tenant, step):
+    from .views import deploy_shared_workspace_auto
+    deploy_result = deploy_shared_workspace_auto(
+        tenant.product.name, tenant.subdomain, tenant.db_name, tenant.db_user, tenant.db_password,
+    )
+    if not deploy_result.get('success'):
+        raise ProvisioningError(f'Deployment falló: {deploy_result.get("error")}')
+
+    tenant.is_deployed = True
+    tenant.save(update_fields=['is_deployed', 'updated_at'])
+    log_activity(
+        tenant=tenant,
+        user=job.requested_by,
+        action='auto_deployed',
+        description=f'Workspace deployed automáticamente - URL: {deploy_result.get("url", "N/A")}',
+        ip_address=job.params.get('ip_address'),
+    )
+    return f'Desplegado en {deploy_result.get("url")}'
+
+
+def _deploy_step(tenant, name, **kwargs):
+    from .views import run_dedicated_deploy_step
+    result = run_dedicated_deploy_step(
+        name, tenant.product.name, tenant.subdomain, tenant.db_name, tenant.db_user, tenant.db_password, **kwargs,
+    )
+    if not result.get('success'):
+        raise ProvisioningError(result.get('error') or f'La etapa {name} falló')
+    return result
+
+
+def step_github_repo(job, tenant, step):
+    result = _deploy_step(tenant, 'repo')
+    if not result.get('repo_url'):
+        raise SkipStep('GITHUB_TOKEN no configurado, sin repositorio')
+    step['output'] = {'repo_url': result['repo_url'], 'created': result.get('created', False)}
+    return f'Repositorio {"creado" if result.get("created") else "existente"}: {result["repo_url"]}'
+
+
+def undo_github_repo(job, tenant, step):
+    from .views import delete_github_repo
+    output = step.get('output') or {}
+    # Un repo que ya existía antes del job no es nuestro para borrarlo
+    if not output.get('created'):
+        return 'Repositorio existente conservado'
+    repo_name = output['repo_url'].split('/')[-1].replace('.git', '')
+    result = delete_github_repo(repo_name)
+    if not result.get('success'):
+        raise ProvisioningError(result.get('error'))
+    return f'Repositorio {repo_name} eliminado'
+
+
+def step_copy_source(job, tenant, step):
+    result = _deploy_step(tenant, 'copy')
+    step['output'] = {'path': result['path']}
+    return f'Código copiado en {result["path"]}'
+
+
+def undo_copy_source(job, tenant, step):
+    path = (step.get('output') or {}).get('path')
+    if path and os.path.exists(path):
+        shutil.rmtree(path)
+    return f'{path} eliminado'
+
+
+def step_git_init(job, tenant, step):
+    _deploy_step(tenant, 'git')
+    return 'Repositorio git inicializado'
+
+
+def step_push_repo(job, tenant, step):
+    repo_url = _find_step(job, 'github_repo')['output']['repo_url']
+    _deploy_step(tenant, 'push', repo_url=repo_url)
+    step['output'] = {'repo_url': repo_url}
+    return f'Push a {repo_url}'
+
+
+def step_finish_dedicated(job, tenant, step):
+    push = _find_step(job, 'push_repo')
+    tenant.git_repo_url = (push.get('output') or {}).get('repo_url', '') if push['status'] == 'done' else ''
+    tenant.is_deployed = True
+    tenant.save(update_fields=['git_repo_url', 'is_deployed', 'updated_at'])
+    return 'Workspace dedicado desplegado'
+
+
+# attempts: intentos antes de dar el paso por fallido. optional: su fallo no
+# aborta el job, solo omite los pasos que dependen de él. undo: rollback del
+# paso si otro paso obligatorio falla después.
+STEPS = {
+    'create_database': {
+        'label': 'Crear base de datos', 'run': step_create_database, 'undo': undo_create_database, 'attempts': 3,
+    },
+    'product_admin': {
+        'label': 'Registrar super admin en el producto', 'run': step_product_admin, 'attempts': 2,
+    },
+    'product_repo': {
+        'label': 'Repositorio base del producto', 'run': step_product_repo, 'attempts': 2,
+    },
+    'deploy_shared': {
+        'label': 'Desplegar workspace compartido', 'run': step_deploy_shared, 'attempts': 2,
+    },
+    'github_repo': {
+        'label': 'Crear repositorio en GitHub', 'run': step_github_repo, 'undo': undo_github_repo,
+        'attempts': 3, 'optional': True,
+    },
+    'copy_source': {
+        'label': 'Copiar código y generar docker-compose', 'run': step_copy_source, 'undo': undo_copy_source,
+        'attempts': 2,
+    },
+    'git_init': {
+        'label': 'Inicializar git', 'run': step_git_init, 'attempts': 2,
+    },
+    'push_repo': {
+        'label': 'Push a GitHub', 'run': step_push_repo, 'attempts': 3, 'optional': True,
+    },
+    'finish_dedicated': {
+        'label': 'Marcar workspace dedicado como desplegado', 'run': step_finish_dedicated, 'attempts': 1,
+    },
+}
+
+
+# ============================================
+# EJECUCIÓN
+# ============================================
+
+def _find_step(job, name):
+    return next(step for step in job.steps if step['name'] == name)
+
+
+class JobProgress:
+    """Guarda los pasos del job; varios hilos lo actualizan a la vez"""
+
+    def __init__(self, job):
+        self.job = job
+        self.lock = threading.Lock()
+
+    def save(self, **fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self.job, name, value)
+            self.job.heartbeat_at = timezone.now()
+            self.job.save(update_fields=['steps', 'heartbeat_at'] + list(fields))
+
+
+def _execute_step(job, tenant, step, progress):
+    """Corre un paso con reintentos; retorna su estado final"""
+    spec = STEPS[step['name']]
+    backoff = getattr(settings, 'PROVISIONING_RETRY_BACKOFF', 2)
+    close_old_connections()
+
+    step['status'] = 'running'
+    step['started_at'] = timezone.now().isoformat()
+    progress.save()
+    started = time.monotonic()
+
+    try:
+        for attempt in range(1, spec['attempts'] + 1):
+            step['attempts'] = attempt
+            try:
+                step['detail'] = spec['run'](job, tenant, step) or ''
+                step['status'] = 'done'
+                break
+            except SkipStep as e:
+                step['detail'] = str(e)
+                step['status'] = 'skipped'
+                break
+            except Exception as e:
+                if attempt < spec['attempts']:
+                    step['detail'] = f'Intento {attempt} falló: {e}. Reintentando...'
+                    progress.save()
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                    continue
+                step['detail'] = str(e)
+                step['status'] = 'warning' if spec.get('optional') else 'failed'
+                print(f"[PROVISIONING] Job {job.id} ({tenant.subdomain}) paso {step['name']} "
+                      f"falló tras {attempt} intentos: {e}")
+    finally:
+        step['finished_at'] = timezone.now().isoformat()
+        step['duration_s'] = round(time.monotonic() - started, 2)
+        progress.save()
+        connection.close()
+
+    return step['status']
+
+
+def _rollback(job, tenant, progress):
+    """Deshace en orden inverso los pasos completados que tienen rollback"""
+    completed = [step for step in job.steps if step['status'] == 'done' and STEPS[step['name']].get('undo')]
+    errors = []
+    for step in sorted(completed, key=lambda step: step['finished_at'], reverse=True):
+        try:
+            step['detail'] = STEPS[step['name']]['undo'](job, tenant, step) or ''
+            step['status'] = 'compensated'
+        except Exception as e:
+            step['detail'] = f'Rollback falló: {e}'
+            errors.append(f"{step['label']}: {e}")
+            print(f"[PROVISIONING] Job {job.id} rollback de {step['name']} falló: {e}")
+        progress.save()
+    return errors
+
+
+def run_job(job_id):
+    """
+    Ejecuta el grafo de pasos de un job ya reclamado: lanza cada paso en
+    cuanto sus dependencias terminan. Si un paso obligatorio falla, deja de
+    lanzar pasos, espera los que están corriendo y hace rollback.
+    """
+    job = ProvisioningJob.objects.select_related('tenant__product', 'requested_by').get(id=job_id)
+    tenant = job.tenant
+    progress = JobProgress(job)
+    started = time.monotonic()
+
+    if tenant is None:
+        progress.save(status='failed', finished_at=timezone.now(), error='El workspace fue eliminado')
+        return
+
+    # Todas las claves desde el inicio: los hilos cambian valores, nunca el
+    # tamaño de un dict que otro hilo puede estar serializando
+    for step in job.steps:
+        for key, default in (('attempts', 0), ('started_at', None), ('finished_at', None),
+                             ('duration_s', None), ('output', {})):
+            step.setdefault(key, default)
+    by_name = {step['name']: step for step in job.steps}
+    failed = None
+    running = {}
+    max_workers = getattr(settings, 'PROVISIONING_STEP_CONCURRENCY', 4)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'job-{job.id}') as executor:
+        while True:
+            for step in job.steps:
+                if step['status'] != 'pending' or step['name'] in running.values():
+                    continue
+                if failed is not None:
+                    step['status'] = 'skipped'
+                    step['detail'] = f"Cancelado: falló {by_name[failed]['label']}"
+                    continue
+                dependencies = [by_name[name]['status'] for name in step.get('depends_on', [])]
+                if any(status in ('failed', 'warning', 'skipped') for status in dependencies):
+                    step['status'] = 'skipped'
+                    step['detail'] = 'Omitido: una dependencia no se completó'
+                elif all(status == 'done' for status in dependencies):
+                    running[executor.submit(_execute_step, job, tenant, step, progress)] = step['name']
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.result() == 'failed' and failed is None:
+                    failed = name
+
+    close_old_connections()
+    elapsed = time.monotonic() - started
+    if failed is None:
+        progress.save(status='succeeded', finished_at=timezone.now())
+        print(f"[PROVISIONING] Job {job.id} ({tenant.subdomain}) completado en {elapsed:.1f}s")
+        return
+
+    error = f"{by_name[failed]['label']}: {by_name[failed]['detail']}"
+    rollback_errors = _rollback(job, tenant, progress)
+    if rollback_errors:
+        error += ' | Rollback incompleto: ' + '; '.join(rollback_errors)
+    progress.save(status='failed', finished_at=timezone.now(), error=error)
+    print(f"[PROVISIONING] Job {job.id} ({tenant.subdomain}) falló en {failed} tras {elapsed:.1f}s")
+
+
+def _run_claimed(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    except Exception as e:
+        print(f"[PROVISIONING] Error inesperado en job {job_id}: {e}")
+        ProvisioningJob.objects.filter(id=job_id, status='running').update(
+            status='failed', finished_at=timezone.now(), error=str(e),
+        )
+    finally:
+        connection.close()
+
+
+def worker_loop(concurrency=3, poll_interval=3, stop_event=None):
+    """
+    Atiende la cola con hasta `concurrency` jobs en paralelo. Espera avisos
+    en Redis (BRPOP); entre avisos revisa la BD por jobs en cola o colgados.
+    """
+    stop_event = stop_event or threading.Event()
+    slots = threading.BoundedSemaphore(concurrency)
+    client = get_redis()
+    # BRPOP debe volver antes que el socket_timeout del cliente compartido
+    wait = max(1, min(poll_interval, 4))
+
+    def submit(job_id):
+        def task():
+            try:
+                _run_claimed(job_id)
+            finally:
+                slots.release()
+        executor.submit(task)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='provisioning') as executor:
+        while not stop_event.is_set():
+            # Con timeout: un stop con todos los slots ocupados no debe quedar esperando
+            if not slots.acquire(timeout=wait):
+                continue
+            if stop_event.is_set():
+                slots.release()
+                break
+            job_id = None
+            try:
+                if client is not None:
+                    try:
+                        item = client.brpop(QUEUE_KEY, timeout=wait)
+                        # Si el stop llegó durante el BRPOP no se reclama: el job sigue
+                        # 'queued' en la BD y lo toma el próximo worker al revisarla
+                        if item and not stop_event.is_set() and claim(int(item[1])):
+                            job_id = int(item[1])
+                    except Exception as e:
+                        print(f"[PROVISIONING] Redis no disponible: {e}")
+                        time.sleep(wait)
+                else:
+                    stop_event.wait(wait)
+
+                close_old_connections()
+                if job_id is None and not stop_event.is_set():
+                    fail_stale_jobs()
+                    job_id = next_queued_job()
+            except Exception as e:
+                print(f"[PROVISIONING] Error buscando jobs: {e}")
+                time.sleep(wait)
+
+            if job_id is None:
+                slots.release()
+                continue
+            submit(job_id)
@@ -0,0 +1,45 @@
+"""
+Cliente Redis compartido por el panel (cache de tenants, colas de trabajo)
+"""
+import os
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+def get_redis():
+    """
+    Retorna un cliente Redis por proceso, o None si REDIS_URL no está
+    configurado o la librería redis no está instalada.
+    """
+    global _client, _client_pid
+
+    url = getattr(settings, 'REDIS_URL', '')
+    if not url:
+        return None
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            try:
+                import redis
+            except ImportError:
+                print("[REDIS] Librería redis no instalada, usando modo local")
+                return None
+
+            # Tras un fork de gunicorn no se reutiliza el pool del padre
+            _client = redis.Redis.from_url(
+                url,
+                socket_connect_timeout=2,
+                socket_timeout=5,
+                health_check_interval=30,
+            )
+            _client_pid = pid
+    return _client
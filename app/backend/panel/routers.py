@@ -1,25 +1,34 @@
+from contextvars import ContextVar
 from django.conf import settings
+from .tenant_connections import tenant_connections
+
+# Tenant del request en curso; lo fija TenantMiddleware. El ORM no pasa el
+# request en los hints, así que el router lo lee de aquí.
+current_tenant = ContextVar('current_tenant', default=None)
+
 
 class TenantRouter:
+    def _tenant_alias(self, hints):
+        request = hints.get('request')
+        tenant = getattr(request, 'tenant', None) if request else None
+        tenant = tenant or current_tenant.get()
+        if tenant:
+            # Registra el alias bajo demanda (conexión persistente por tenant)
+            return tenant_connections.alias_for(tenant)
+        
+        return 'default'
+    
     def db_for_read(self, model, **hints):
         if model._meta.app_label == 'panel':
             return 'default'
         
-        request = hints.get('request')
-        if request and hasattr(request, 'tenant') and request.tenant:
-            return request.tenant.db_name
-        
-        return 'default'
+        return self._tenant_alias(hints)
     
     def db_for_write(self, model, **hints):
         if model._meta.app_label == 'panel':
             return 'default'
         
-        request = hints.get('request')
-        if request and hasattr(request, 'tenant') and request.tenant:
-            return request.tenant.db_name
-        
-        return 'default'
+        return self._tenant_alias(hints)
     
     def allow_relation(self, obj1, obj2, **hints):
         return True
@@ -0,0 +1,33 @@
+"""
+Señales del panel: mantienen coherentes las caches al modificar modelos
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .counters import invalidate_tenant_counters
+from .models import Tenant, Product
+from .tenant_cache import invalidate_on_commit
+from .tenant_connections import tenant_connections
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    invalidate_on_commit(tenant_id=instance.id, subdomain=instance.subdomain)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def invalidate_counters(sender, instance, **kwargs):
+    invalidate_tenant_counters()
+
+
+@receiver(post_delete, sender=Tenant)
+def discard_tenant_connection(sender, instance, **kwargs):
+    tenant_connections.discard(instance.db_name)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_on_commit(product_id=instance.id)
@@ -0,0 +1,115 @@
+"""
+Snapshot de estadísticas por tenant (tabla panel_tenant_stats)
+
+Las páginas del panel leen TenantStats en lugar de consultar cada BD de
+tenant en cada render. El snapshot lo refresca periódicamente el comando
+refresh_tenant_stats, y bajo demanda para un tenant desde la vista.
+"""
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .collectors import fan_out
+from .db_pool import db_pool
+from .models import Tenant, TenantStats
+from .product_users import count_product_users
+
+STATS_FIELDS = ['db_size_bytes', 'table_count', 'estimated_rows', 'dead_rows', 'user_count']
+
+
+def query_tenant_stats(db_name, timeout=None):
+    """Lee tamaño, tablas y filas estimadas de una BD desde el catálogo"""
+    timeout = timeout or getattr(settings, 'STATS_COLLECTOR_TIMEOUT', 3)
+
+    with db_pool.connection(db_name, timeout=timeout) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", [int(timeout * 1000)])
+            # reltuples es -1 en tablas nunca analizadas (PG14+)
+            cursor.execute("""
+                SELECT
+                    pg_database_size(current_database()),
+                    COUNT(s.relid),
+                    COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint,
+                    COALESCE(SUM(s.n_dead_tup), 0)::bigint
+                FROM pg_stat_user_tables s
+                JOIN pg_class c ON c.oid = s.relid
+                WHERE s.schemaname = 'public'
+            """)
+            db_size, table_count, estimated_rows, dead_rows = cursor.fetchone()
+
+    return {
+        'db_size_bytes': db_size,
+        'table_count': table_count,
+        'estimated_rows': estimated_rows,
+        'dead_rows': dead_rows,
+    }
+
+
+def refresh_tenant_stats(tenants=None):
+    """
+    Recalcula el snapshot de los tenants dados (por defecto, todos) y lo
+    guarda con un upsert por lote. Retorna (actualizados, degradados).
+    """
+    if tenants is None:
+        tenants = Tenant.objects.select_related('product')
+    tenants = list(tenants)
+
+    started = time.monotonic()
+    results = fan_out(
+        tenants,
+        lambda tenant: query_tenant_stats(tenant.db_name),
+        deadline=getattr(settings, 'TENANT_STATS_DEADLINE', 120),
+    )
+    now = timezone.now()
+
+    # Un GROUP BY por producto en vez de listar los usuarios de cada tenant
+    tenants_by_product = {}
+    for tenant in tenants:
+        tenants_by_product.setdefault(tenant.product.name, []).append(tenant.id)
+    user_counts = {}
+    for product_name, tenant_ids in tenants_by_product.items():
+        user_counts.update(count_product_users(product_name, tenant_ids))
+
+    reachable = []
+    unreachable = []
+    for tenant in tenants:
+        result = results[tenant.id]
+        if result['degraded']:
+            unreachable.append(TenantStats(
+                tenant=tenant,
+                is_reachable=False,
+                last_error=result['error'][:1000],
+                refreshed_at=now,
+            ))
+            continue
+
+        values = result['value']
+        values['user_count'] = user_counts[tenant.id]
+        reachable.append(TenantStats(
+            tenant=tenant,
+            is_reachable=True,
+            last_error='',
+            refreshed_at=now,
+            **values,
+        ))
+
+    if reachable:
+        TenantStats.objects.bulk_create(
+            reachable,
+            update_conflicts=True,
+            unique_fields=['tenant'],
+            update_fields=STATS_FIELDS + ['is_reachable', 'last_error', 'refreshed_at'],
+        )
+    if unreachable:
+        # Conservar las últimas cifras buenas, solo marcar el fallo
+        TenantStats.objects.bulk_create(
+            unreachable,
+            update_conflicts=True,
+            unique_fields=['tenant'],
+            update_fields=['is_reachable', 'last_error', 'refreshed_at'],
+        )
+
+    print(f"[STATS] {len(tenants)} tenants refrescados en {time.monotonic() - started:.2f}s "
+          f"({len(unreachable)} sin respuesta)")
+    return len(reachable), len(unreachable)
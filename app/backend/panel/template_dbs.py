@@ -0,0 +1,192 @@
+"""
+BDs plantilla por versión de producto (tpl_<producto>_<hash>)
+
+Una BD de tenant recién creada estaba vacía y el contenedor del producto
+corría todas las migraciones en su primer arranque. Aquí se mantiene, por
+producto, una BD ya migrada cuyo nombre lleva el hash de los archivos de
+migraciones del código fuente; create_database la clona con
+CREATE DATABASE ... TEMPLATE, así que el tenant arranca con el esquema listo.
+
+Las migraciones las corre el contenedor compartido del producto (docker exec)
+conectado como el rol tpl_<producto>_owner. Al clonar, los objetos de ese rol
+se reasignan al usuario del tenant.
+
+La vigencia de la plantilla la decide solo build_template_dbs (recorre el
+código y calcula el hash cada TEMPLATE_DB_INTERVAL). ready_template, que está
+en el camino de cada alta, confía en product.template_db sin tocar el disco:
+si el código cambió y la plantilla aún no se reconstruyó, se clona la
+anterior y el contenedor del producto aplica al arrancar las migraciones que
+falten.
+"""
+import hashlib
+import os
+import secrets
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .db_pool import db_pool
+
+MIGRATION_SKIP_DIRS = {'.git', '__pycache__', 'venv', '.venv', 'node_modules'}
+
+
+class TemplateBuildError(Exception):
+    """No se pudo construir la BD plantilla"""
+
+
+def source_path(product):
+    return product.template_path or f"/opt/proyectos/{product.name}-system"
+
+
+def template_owner(product_name):
+    return f"tpl_{product_name}_owner"
+
+
+def migrations_fingerprint(product):
+    """Hash de las rutas y el contenido de los archivos de migraciones del producto"""
+    root = source_path(product)
+    if not os.path.isdir(root):
+        return None
+
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in MIGRATION_SKIP_DIRS)
+        if os.path.basename(dirpath) != 'migrations':
+            continue
+        for filename in sorted(f for f in filenames if f.endswith('.py')):
+            path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(path, root).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def template_name(product, fingerprint=None):
+    fingerprint = fingerprint or migrations_fingerprint(product)
+    if fingerprint is None:
+        return None
+    return f"tpl_{product.name}_{fingerprint}"
+
+
+def ready_template(product):
+    """
+    (plantilla, rol dueño) si el producto tiene una plantilla construida;
+    None si hay que crear la BD vacía
+    """
+    if not getattr(settings, 'TEMPLATE_DB_ENABLED', True):
+        return None
+    if not product.template_db or product.template_db_built_at is None:
+        return None
+    return product.template_db, template_owner(product.name)
+
+
+def _database_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [name])
+    return cursor.fetchone() is not None
+
+
+def _drop_template(cursor, name):
+    db_pool.discard(name)
+    if _database_exists(cursor, name):
+        cursor.execute(f"ALTER DATABASE {name} IS_TEMPLATE false")
+        cursor.execute(f"DROP DATABASE {name}")
+
+
+def _run_product_migrations(product, db_name, owner, password):
+    """Corre migrate del producto contra db_name dentro de su contenedor compartido"""
+    import docker
+
+    default = settings.DATABASES['default']
+    host = getattr(settings, 'TEMPLATE_DB_HOST', '') or default['HOST']
+    port = default['PORT'] or 5432
+    container_name = f"tenant-master-{product.name}-shared"
+
+    try:
+        container = docker.from_env().containers.get(container_name)
+    except Exception as e:
+        raise TemplateBuildError(f'Contenedor {container_name} no disponible: {e}')
+
+    exit_code, output = container.exec_run(
+        ['python', 'manage.py', 'migrate', '--noinput'],
+        environment={
+            'DATABASE_URL': f"postgresql://{owner}:{password}@{host}:{port}/{db_name}",
+            'DB_NAME': db_name,
+            'DB_USER': owner,
+            'DB_PASSWORD': password,
+            'DB_HOST': host,
+            'DB_PORT': str(port),
+        },
+    )
+    if exit_code != 0:
+        raise TemplateBuildError(f'migrate falló: {output.decode("utf-8", "replace")[-2000:]}')
+
+
+def build_template(product, force=False):
+    """
+    Construye (o reutiliza) la plantilla de la versión actual del producto y
+    elimina la anterior. Retorna el nombre de la plantilla.
+    """
+    name = template_name(product)
+    if name is None:
+        raise TemplateBuildError(f'No existe el código fuente en {source_path(product)}')
+
+    owner = template_owner(product.name)
+    previous = product.template_db
+
+    with db_pool.connection('postgres', autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            if not force and previous == name and _database_exists(cursor, name):
+                return name
+
+            started = time.monotonic()
+            print(f"[TEMPLATES] Construyendo {name}")
+
+            password = secrets.token_urlsafe(24)
+            cursor.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", [owner])
+            if cursor.fetchone():
+                cursor.execute(f"ALTER ROLE {owner} WITH LOGIN PASSWORD %s", [password])
+            else:
+                cursor.execute(f"CREATE ROLE {owner} WITH LOGIN PASSWORD %s", [password])
+
+            # Restos de una construcción interrumpida
+            _drop_template(cursor, name)
+            # La BD es del usuario del panel; sus objetos, de tpl_<producto>_owner
+            cursor.execute(f"CREATE DATABASE {name}")
+            cursor.execute(f"GRANT CONNECT, CREATE, TEMPORARY ON DATABASE {name} TO {owner}")
+
+    with db_pool.connection(name, autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"GRANT ALL ON SCHEMA public TO {owner}")
+
+    try:
+        _run_product_migrations(product, name, owner, password)
+
+        with db_pool.connection(name, autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                # Los clones heredan las filas ya congeladas y las estadísticas
+                cursor.execute("VACUUM (FREEZE, ANALYZE)")
+    except Exception:
+        with db_pool.connection('postgres', autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                _drop_template(cursor, name)
+        raise
+
+    # Sin conexiones abiertas: CREATE DATABASE ... TEMPLATE falla si alguien está conectado
+    db_pool.discard(name)
+    with db_pool.connection('postgres', autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER DATABASE {name} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false")
+            cursor.execute(f"ALTER ROLE {owner} WITH NOLOGIN")
+
+    product.template_db = name
+    product.template_db_built_at = timezone.now()
+    product.save(update_fields=['template_db', 'template_db_built_at'])
+
+    if previous and previous != name:
+        with db_pool.connection('postgres', autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                _drop_template(cursor, previous)
+
+    print(f"[TEMPLATES] {name} lista en {time.monotonic() - started:.1f}s")
+    return name
@@ -0,0 +1,231 @@
+"""
+Cache local (por proceso) de resolución subdomain -> tenant
+
+Cada worker de gunicorn mantiene un LRU con TTL de snapshots de tenants
+activos (incluyendo los campos del producto), de modo que resolver un
+tenant en estado estable no cuesta ninguna query. Las invalidaciones se
+aplican localmente y se publican por Redis para el resto de workers.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Tenant
+from .redis_client import get_redis
+
+INVALIDATION_CHANNEL = 'tenant-master:tenant-cache'
+
+
+class ProductSnapshot:
+    """Campos del producto que necesita el middleware"""
+    __slots__ = ('id', 'name', 'display_name', 'icon')
+
+    def __init__(self, product):
+        self.id = product.id
+        self.name = product.name
+        self.display_name = product.display_name
+        self.icon = product.icon
+
+
+class TenantSnapshot:
+    """Copia de solo lectura de un Tenant, desacoplada del ORM"""
+    __slots__ = (
+        'id', 'name', 'subdomain', 'company_name', 'plan', 'type', 'status',
+        'db_name', 'db_user', 'db_password', 'db_host', 'db_port',
+        'is_deployed', 'updated_at', 'product_id', 'product', 'pages',
+    )
+
+    def __init__(self, tenant):
+        self.id = tenant.id
+        self.name = tenant.name
+        self.subdomain = tenant.subdomain
+        self.company_name = tenant.company_name
+        self.plan = tenant.plan
+        self.type = tenant.type
+        self.status = tenant.status
+        self.db_name = tenant.db_name
+        self.db_user = tenant.db_user
+        self.db_password = tenant.db_password
+        self.db_host = tenant.db_host
+        self.db_port = tenant.db_port
+        self.is_deployed = tenant.is_deployed
+        self.updated_at = tenant.updated_at
+        self.product_id = tenant.product_id
+        self.product = ProductSnapshot(tenant.product)
+        # Páginas pre-renderizadas (ver tenant_pages); mueren con el snapshot
+        self.pages = {}
+
+    def __str__(self):
+        return f"{self.company_name} ({self.subdomain})"
+
+    def get_plan_display(self):
+        return dict(Tenant.PLAN_CHOICES).get(self.plan, self.plan)
+
+    def get_type_display(self):
+        return dict(Tenant.TYPE_CHOICES).get(self.type, self.type)
+
+    @property
+    def url(self):
+        return f"https://{self.subdomain}.{settings.BASE_DOMAIN}"
+
+
+class TenantCache:
+    """
+    LRU con TTL de snapshots de tenants activos indexado por subdomain,
+    más una cache negativa acotada de subdominios inexistentes.
+    """
+
+    def __init__(self, ttl=300, max_entries=1000, negative_ttl=60, negative_max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.negative_max_entries = negative_max_entries
+        self._entries = OrderedDict()  # subdomain -> (expires_at, snapshot)
+        self._missing = OrderedDict()  # subdomain -> expires_at
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._listener_pid = None
+
+    def get(self, subdomain):
+        """
+        Retorna el snapshot del tenant activo con ese subdomain.
+        Lanza Tenant.DoesNotExist si no existe o no está activo.
+        """
+        self._ensure_listener()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(subdomain)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(subdomain)
+                    return entry[1]
+                del self._entries[subdomain]
+
+            expires_at = self._missing.get(subdomain)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._missing.move_to_end(subdomain)
+                    raise Tenant.DoesNotExist(f"Subdomain {subdomain} no existe (cache)")
+                del self._missing[subdomain]
+            generation = self._generation
+
+        try:
+            tenant = Tenant.objects.select_related('product').get(subdomain=subdomain, status='active')
+        except Tenant.DoesNotExist:
+            with self._lock:
+                if generation == self._generation:
+                    self._missing[subdomain] = now + self.negative_ttl
+                    self._missing.move_to_end(subdomain)
+                    while len(self._missing) > self.negative_max_entries:
+                        self._missing.popitem(last=False)
+            raise
+
+        snapshot = TenantSnapshot(tenant)
+
+        with self._lock:
+            # Si llegó una invalidación mientras consultábamos, no guardar
+            if generation == self._generation:
+                self._entries[subdomain] = (now + self.ttl, snapshot)
+                self._entries.move_to_end(subdomain)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate_local(self, tenant_id=None, subdomain=None, product_id=None, everything=False):
+        """Elimina entradas de este proceso"""
+        with self._lock:
+            self._generation += 1
+            if everything:
+                self._entries.clear()
+                self._missing.clear()
+                return
+            if subdomain:
+                self._entries.pop(subdomain, None)
+                # Un tenant creado (o reactivado) deja de ser "inexistente"
+                self._missing.pop(subdomain, None)
+            if tenant_id is not None or product_id is not None:
+                stale = [
+                    key for key, (_, snapshot) in self._entries.items()
+                    if snapshot.id == tenant_id or snapshot.product_id == product_id
+                ]
+                for key in stale:
+                    del self._entries[key]
+
+    def invalidate(self, **message):
+        """Invalida en este proceso y publica la invalidación al resto de workers"""
+        self.invalidate_local(**message)
+
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.publish(INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception as e:
+            print(f"[TENANT-CACHE] Error publicando invalidación: {e}")
+
+    def _ensure_listener(self):
+        """Arranca (una vez por proceso) el hilo suscrito a invalidaciones"""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            # Un proceso recién forkeado no debe confiar en lo heredado
+            self._entries.clear()
+            self._missing.clear()
+            self._generation += 1
+
+        if get_redis() is None:
+            return
+
+        thread = threading.Thread(target=self._listen, name='tenant-cache-listener', daemon=True)
+        thread.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Pudimos perder mensajes mientras no estábamos suscritos
+                self.invalidate_local(everything=True)
+                backoff = 1
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self.invalidate_local(**json.loads(message['data']))
+            except Exception as e:
+                print(f"[TENANT-CACHE] Listener desconectado: {e}")
+                # Sin canal no podemos garantizar frescura más allá del TTL
+                self.invalidate_local(everything=True)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+tenant_cache = TenantCache(
+    ttl=getattr(settings, 'TENANT_CACHE_TTL', 300),
+    max_entries=getattr(settings, 'TENANT_CACHE_MAX_ENTRIES', 1000),
+    negative_ttl=getattr(settings, 'TENANT_NEGATIVE_CACHE_TTL', 60),
+    negative_max_entries=getattr(settings, 'TENANT_NEGATIVE_CACHE_MAX_ENTRIES', 10000),
+)
+
+
+def invalidate_on_commit(**message):
+    """Programa la invalidación para cuando la transacción actual confirme"""
+    transaction.on_commit(lambda: tenant_cache.invalidate(**message))
@@ -0,0 +1,117 @@
+"""
+Registro dinámico de aliases de base de datos por tenant
+
+TenantRouter devuelve el db_name del tenant como alias, pero ese alias no
+existe en settings.DATABASES. Este registro lo crea bajo demanda a partir de
+Tenant.db_host/db_port/db_user/db_password, con conexiones persistentes y
+health checks de Django, un tope global de aliases y desalojo LRU de los
+aliases inactivos.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class TenantConnectionRegistry:
+    """Aliases de tenants registrados en este proceso, en orden LRU"""
+
+    def __init__(self, max_aliases=200, idle_timeout=600, conn_max_age=300):
+        self.max_aliases = max_aliases
+        self.idle_timeout = idle_timeout
+        self.conn_max_age = conn_max_age
+        self._aliases = OrderedDict()  # alias -> (fingerprint, last_used)
+        self._lock = threading.RLock()
+
+    def alias_for(self, tenant):
+        """
+        Retorna el alias de BD del tenant (Tenant o TenantSnapshot),
+        registrándolo si hace falta.
+        """
+        alias = tenant.db_name
+        fingerprint = (tenant.db_host, int(tenant.db_port), tenant.db_user, tenant.db_password)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._aliases.get(alias)
+            if entry is not None and entry[0] == fingerprint and alias in connections.settings:
+                self._aliases[alias] = (fingerprint, now)
+                self._aliases.move_to_end(alias)
+                return alias
+
+            if entry is not None:
+                # Cambiaron las credenciales: la conexión vieja ya no sirve
+                self._drop(alias, force=True)
+
+            connections.settings[alias] = self.settings_for(tenant)
+            self._aliases[alias] = (fingerprint, now)
+            self._evict(now)
+        return alias
+
+    def discard(self, alias):
+        """Olvida un alias (p.ej. al eliminar el tenant o su BD)"""
+        with self._lock:
+            if alias in self._aliases:
+                self._drop(alias, force=True)
+
+    def registered(self):
+        with self._lock:
+            return list(self._aliases)
+
+    def settings_for(self, tenant):
+        """Settings de BD del alias del tenant (también sirven para conectarse sin alias)"""
+        base = connections.settings[DEFAULT_DB_ALIAS]
+        db = copy.deepcopy({k: v for k, v in base.items() if k != 'TEST'})
+        db.update({
+            'NAME': tenant.db_name,
+            # Tenants creados vía API no tienen rol propio: usar el del master
+            'USER': tenant.db_user or base['USER'],
+            'PASSWORD': tenant.db_password if tenant.db_user else base['PASSWORD'],
+            'HOST': tenant.db_host or base['HOST'],
+            'PORT': str(tenant.db_port or base['PORT']),
+            'ATOMIC_REQUESTS': False,
+            'CONN_MAX_AGE': self.conn_max_age,
+            'CONN_HEALTH_CHECKS': True,
+            'TEST': {'CHARSET': None, 'COLLATION': None, 'MIGRATE': False, 'MIRROR': None, 'NAME': None},
+        })
+        return db
+
+    def _evict(self, now):
+        """Desaloja aliases inactivos y, si se supera el tope, los menos usados"""
+        for alias, (_, last_used) in list(self._aliases.items()):
+            if now - last_used > self.idle_timeout:
+                self._drop(alias)
+
+        # El último (recién usado) nunca se desaloja
+        for alias in list(self._aliases)[:-1]:
+            if len(self._aliases) <= self.max_aliases:
+                break
+            self._drop(alias)
+
+    def _drop(self, alias, force=False):
+        """
+        Cierra la conexión del hilo actual y elimina el alias. Sin force, un
+        alias con una transacción abierta en este hilo no se desaloja.
+        """
+        if hasattr(connections._connections, alias):
+            conn = connections[alias]
+            if conn.in_atomic_block and not force:
+                return
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"[TENANT-DB] Error cerrando conexión {alias}: {e}")
+            del connections[alias]
+
+        connections.settings.pop(alias, None)
+        self._aliases.pop(alias, None)
+
+
+tenant_connections = TenantConnectionRegistry(
+    max_aliases=getattr(settings, 'TENANT_DB_MAX_ALIASES', 200),
+    idle_timeout=getattr(settings, 'TENANT_DB_IDLE_TIMEOUT', 600),
+    conn_max_age=getattr(settings, 'TENANT_DB_CONN_MAX_AGE', 300),
+)
@@ -0,0 +1,125 @@
+"""
+Migración de BDs de tenants con el grafo de migraciones cargado una vez
+
+`manage.py migrate` carga e importa todo el grafo, corre los system checks y
+reconstruye el estado del proyecto en cada invocación. TenantMigrator carga
+el grafo una sola vez por proceso y calcula el plan (y el estado previo) una
+vez por versión: los tenants con las mismas migraciones aplicadas reusan
+ambos, así que el costo fijo por tenant queda en leer django_migrations.
+"""
+import copy
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management.sql import emit_post_migrate_signal, emit_pre_migrate_signal
+from django.db import router
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.migrations.state import ModelState
+from django.utils.module_loading import module_has_submodule
+
+
+class MigrationConflict(Exception):
+    """El código tiene migraciones en conflicto (varias hojas en una app)"""
+
+
+def tenant_nodes(graph):
+    """
+    (app, nombre) del grafo que el router deja migrar en una BD de tenant
+    (cualquier alias distinto de default): lo que debe quedar aplicado.
+    """
+    return {node for node in graph.nodes if router.allow_migrate('tenant', node[0])}
+
+
+class SharedGraphExecutor(MigrationExecutor):
+    """MigrationExecutor que usa un loader ya construido en vez de cargar uno nuevo"""
+
+    def __init__(self, connection, loader, progress_callback=None):
+        self.connection = connection
+        self.loader = loader
+        self.recorder = MigrationRecorder(connection)
+        self.progress_callback = progress_callback
+
+
+class TenantMigrator:
+    def __init__(self):
+        self.loader = MigrationLoader(None, ignore_no_migrations=True)
+        conflicts = self.loader.detect_conflicts()
+        if conflicts:
+            raise MigrationConflict('; '.join(
+                f"{', '.join(names)} en {app}" for app, names in conflicts.items()
+            ))
+        # Las hojas de las apps que van a los tenants: el mismo conjunto que se
+        # compara contra django_migrations para decidir si un tenant está al día
+        self.nodes = tenant_nodes(self.loader.graph)
+        self.targets = [node for node in self.loader.graph.leaf_nodes() if node in self.nodes]
+        # frozenset(migraciones aplicadas) -> (plan, estado previo)
+        self._plans = {}
+        self.plan_hits = 0
+
+        # Igual que migrate: registra los receptores de pre/post_migrate
+        for app_config in apps.get_app_configs():
+            if module_has_submodule(app_config.module, 'management'):
+                import_module('.management', app_config.name)
+
+    def applied_migrations(self, connection):
+        """
+        Migraciones aplicadas en la BD, con los squash ya cubiertos marcados
+        como aplicados. None si un squash está aplicado a medias (ese caso lo
+        resuelve el loader completo de Django).
+        """
+        recorder = MigrationRecorder(connection)
+        applied = recorder.applied_migrations() if recorder.has_table() else {}
+        for key, migration in self.loader.replacements.items():
+            replaced = [target in applied for target in migration.replaces]
+            if all(replaced):
+                applied.setdefault(key, migration)
+            elif any(replaced):
+                return None
+        return applied
+
+    def _executor(self, connection, applied, progress_callback):
+        loader = copy.copy(self.loader)
+        loader.applied_migrations = applied
+        return SharedGraphExecutor(connection, loader, progress_callback)
+
+    def migrate(self, connection, progress_callback=None):
+        """Aplica las migraciones pendientes; retorna los nombres aplicados"""
+        applied = self.applied_migrations(connection)
+        if applied is None:
+            executor = MigrationExecutor(connection, progress_callback)
+            key = None
+        else:
+            executor = self._executor(connection, applied, progress_callback)
+            key = frozenset(name for name in applied if name in self.loader.graph.nodes)
+
+        if key in self._plans:
+            plan, pre_state = self._plans[key]
+            self.plan_hits += 1
+        else:
+            plan = executor.migration_plan(self.targets)
+            pre_state = executor._create_project_state(with_applied_migrations=True) if plan else None
+            if key is not None:
+                self._plans[key] = (plan, pre_state)
+
+        if not plan:
+            return []
+
+        connection.prepare_database()
+        emit_pre_migrate_signal(0, False, connection.alias, apps=pre_state.apps, plan=plan)
+        post_state = executor.migrate(self.targets, plan=plan, state=pre_state.clone())
+
+        # Como migrate: los receptores de post_migrate ven todos los modelos renderizados
+        post_state.clear_delayed_apps_cache()
+        post_apps = post_state.apps
+        with post_apps.bulk_update():
+            model_keys = []
+            for model_state in post_apps.real_models:
+                model_key = model_state.app_label, model_state.name_lower
+                model_keys.append(model_key)
+                post_apps.unregister_model(*model_key)
+        post_apps.render_multiple([ModelState.from_model(apps.get_model(*model)) for model in model_keys])
+        emit_post_migrate_signal(0, False, connection.alias, apps=post_apps, plan=plan)
+
+        return [str(migration) for migration, _ in plan]
@@ -0,0 +1,230 @@
+"""
+Páginas HTML que TenantMiddleware sirve directamente en los subdominios
+
+Los cuerpos se renderizan una sola vez y se guardan como bytes en el
+snapshot de cada tenant, con ETag y Last-Modified para que las visitas
+repetidas se respondan con 304. El 404 es una única plantilla pre-renderizada
+en la que solo se inserta el subdomain.
+"""
+import hashlib
+from calendar import timegm
+from functools import lru_cache
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+from django.utils.http import http_date
+
+
+class RenderedPage:
+    """Cuerpo pre-renderizado con sus validadores HTTP"""
+    __slots__ = ('body', 'status', 'etag', 'last_modified')
+
+    def __init__(self, html, status=200, last_modified=None):
+        self.body = html.encode('utf-8')
+        self.status = status
+        self.etag = '"%s"' % hashlib.md5(self.body).hexdigest()
+        self.last_modified = last_modified
+
+    def respond(self, request):
+        response = HttpResponse(self.body, content_type='text/html; charset=utf-8', status=self.status)
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = 'no-cache'
+        return get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            response=response,
+        )
+
+
+def not_found_response(request, subdomain):
+    """
+    404 de workspace inexistente. La plantilla se renderiza una sola vez y
+    solo se inserta el subdomain escapado: no se guarda nada por subdomain
+    (los elige quien hace el request); la búsqueda ya la cubre la cache
+    negativa de tenant_cache.
+    """
+    prefix, suffix = _not_found_parts()
+    body = prefix + escape(subdomain).encode('utf-8') + suffix
+    response = HttpResponse(body, content_type='text/html; charset=utf-8', status=404)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def tenant_response(request, tenant):
+    """Página del workspace ("en construcción" o info), cacheada en el snapshot"""
+    kind = 'workspace' if tenant.is_deployed else 'construction'
+    page = tenant.pages.get(kind)
+
+    if page is None:
+        last_modified = None
+        if tenant.updated_at:
+            last_modified = timegm(tenant.updated_at.utctimetuple())
+        if tenant.is_deployed:
+            html = render_workspace_info(tenant)
+        else:
+            html = render_under_construction(tenant)
+        page = RenderedPage(html, last_modified=last_modified)
+        tenant.pages[kind] = page
+
+    return page.respond(request)
+
+
+def render_under_construction(tenant):
+    return f"""
+                <!DOCTYPE html>
+                <html>
+                <head>
+                    <title>{escape(tenant.company_name)} - En Construcción</title>
+                    <style>
+                        body {{
+                            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+                            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                            display: flex;
+                            align-items: center;
+                            justify-content: center;
+                            min-height: 100vh;
+                            margin: 0;
+                            color: white;
+                        }}
+                        .container {{
+                            text-align: center;
+                            padding: 2rem;
+                        }}
+                        h1 {{
+                            font-size: 3rem;
+                            margin-bottom: 1rem;
+                        }}
+                        p {{
+                            font-size: 1.2rem;
+                            opacity: 0.9;
+                        }}
+                        .icon {{
+                            font-size: 5rem;
+                            margin-bottom: 1rem;
+                        }}
+                    </style>
+                </head>
+                <body>
+                    <div class="container">
+                        <div class="icon">{escape(tenant.product.icon)}</div>
+                        <h1>{escape(tenant.company_name)}</h1>
+                        <p>🚧 Sistema en construcción</p>
+                        <p>Workspace: {escape(tenant.subdomain)}.surgir.online</p>
+                        <p>Producto: {escape(tenant.product.display_name)}</p>
+                    </div>
+                </body>
+                </html>
+                """
+
+
+def render_workspace_info(tenant):
+    return f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>{escape(tenant.company_name)}</title>
+                <style>
+                    body {{
+                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                        display: flex;
+                        align-items: center;
+                        justify-content: center;
+                        min-height: 100vh;
+                        margin: 0;
+                        color: white;
+                    }}
+                    .container {{
+                        text-align: center;
+                        padding: 2rem;
+                        background: rgba(255, 255, 255, 0.1);
+                        border-radius: 1rem;
+                        backdrop-filter: blur(10px);
+                    }}
+                    h1 {{
+                        font-size: 2.5rem;
+                        margin-bottom: 1rem;
+                    }}
+                    .info {{
+                        text-align: left;
+                        margin-top: 2rem;
+                        padding: 1rem;
+                        background: rgba(0, 0, 0, 0.2);
+                        border-radius: 0.5rem;
+                    }}
+                    .info p {{
+                        margin: 0.5rem 0;
+                    }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <h1>{escape(tenant.product.icon)} {escape(tenant.company_name)}</h1>
+                    <p>✅ Workspace activo y configurado</p>
+                    <div class="info">
+                        <p><strong>Subdomain:</strong> {escape(tenant.subdomain)}</p>
+                        <p><strong>Producto:</strong> {escape(tenant.product.display_name)}</p>
+                        <p><strong>Plan:</strong> {escape(tenant.get_plan_display())}</p>
+                        <p><strong>Tipo:</strong> {escape(tenant.get_type_display())}</p>
+                        <p><strong>Base de datos:</strong> {escape(tenant.db_name)}</p>
+                        <p><strong>URL completa:</strong> {escape(tenant.url)}</p>
+                    </div>
+                    <p style="margin-top: 2rem; opacity: 0.7;">
+                        💡 Pronto se cargará la aplicación {escape(tenant.product.display_name)}
+                    </p>
+                </div>
+            </body>
+            </html>
+            """
+
+
+NOT_FOUND_MARKER = '__SUBDOMAIN__'
+
+
+@lru_cache(maxsize=1)
+def _not_found_parts():
+    """(antes, después) del subdomain en el 404, ya codificados"""
+    prefix, suffix = render_not_found(NOT_FOUND_MARKER).encode('utf-8').split(NOT_FOUND_MARKER.encode(), 1)
+    return prefix, suffix
+
+
+def render_not_found(subdomain):
+    return f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>Workspace no encontrado</title>
+                <style>
+                    body {{
+                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+                        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
+                        display: flex;
+                        align-items: center;
+                        justify-content: center;
+                        min-height: 100vh;
+                        margin: 0;
+                        color: white;
+                    }}
+                    .container {{
+                        text-align: center;
+                        padding: 2rem;
+                    }}
+                    h1 {{
+                        font-size: 3rem;
+                        margin-bottom: 1rem;
+                    }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <h1>❌ 404</h1>
+                    <p>El workspace "{escape(subdomain)}" no existe</p>
+                    <p><a href="https://panel.surgir.online" style="color: white;">← Volver al panel</a></p>
+                </div>
+            </body>
+            </html>
+            """
@@ -14,6 +14,8 @@ urlpatterns = [
     # Workspaces CRUD
     path('workspaces/', views.workspaces, name='workspaces'),
     path('workspaces/create/', views.create_workspace, name='create_workspace'),
+    path('workspaces/jobs/<int:job_id>/', views.provisioning_job, name='provisioning_job'),
+    path('workspaces/jobs/<int:job_id>/status/', views.provisioning_job_status, name='provisioning_job_status'),
     path('workspaces/<int:tenant_id>/', views.workspace_detail, name='workspace_detail'),
     path('workspaces/<int:tenant_id>/edit/', views.edit_workspace, name='edit_workspace'),
     path('workspaces/<int:tenant_id>/action/', views.workspace_action, name='workspace_action'),
@@ -30,6 +32,10 @@ urlpatterns = [
     path('databases/', views.databases, name='databases'),
     path('databases/<str:db_name>/', views.database_manage, name='database_manage'),
     path('databases/<str:db_name>/users/', views.database_users_api, name='database_users_api'),
+    path('databases/<str:db_name>/refresh-stats/', views.refresh_database_stats, name='refresh_database_stats'),
+    path('databases/<str:db_name>/tables/<str:table_name>/count/', views.database_table_count, name='database_table_count'),
+    path('databases/<str:db_name>/export/', views.database_export_query, name='database_export_query'),
     path('activity/', views.activity, name='activity'),
+    path('activity/export/', views.activity_export, name='activity_export'),
     path('settings/', views.settings_view, name='settings'),
 ]
\ No newline at end of file
@@ -7,15 +7,26 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import logout
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.conf import settings
-from django.db.models import Count
+from django.db.models import Count, Min, Q, Sum
 from django.db import connection
-from .models import Tenant, Product, TenantUser, ActivityLog
+from .models import Tenant, Product, TenantUser, ActivityLog, TenantStats, ProvisioningJob
+from .db_pool import db_pool
+from .stats import refresh_tenant_stats
+from .counters import get_tenant_counters
+from .product_users import get_product_users
+from .activity import log_activity
+from .provisioning import create_job
+from .filters import ACTIVITY_FILTER_FIELDS, TENANT_FILTER_FIELDS, filter_activity, filter_tenants
+from .pagination import InvalidCursor, keyset_page
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from psycopg2 import errors as pg_errors, sql
+import csv
+import re
 import secrets
 import string
 import subprocess
@@ -55,22 +66,24 @@ def health_check(request):
 def dashboard(request):
     """Dashboard principal"""
     try:
-        total_tenants = Tenant.objects.count()
-        active_tenants = Tenant.objects.filter(status='active').count()
-        
-        dedicated_count = Tenant.objects.filter(type='dedicated').count()
-        shared_count = Tenant.objects.filter(type='shared').count()
+        # total / activos / dedicados / compartidos: una query, cacheada
+        counters = get_tenant_counters()
         
         recent_tenants = Tenant.objects.select_related('product', 'owner').order_by('-created_at')[:10]
         recent_activity = ActivityLog.objects.select_related('user', 'tenant').order_by('-created_at')[:10]
         
+        # Resumen de BDs desde el snapshot (sin tocar las BDs de los tenants)
+        fleet_stats = TenantStats.objects.aggregate(
+            total_db_size=Sum('db_size_bytes'),
+            unreachable=Count('id', filter=Q(is_reachable=False)),
+            oldest_refresh=Min('refreshed_at'),
+        )
+        
         context = {
-            'total_tenants': total_tenants,
-            'active_tenants': active_tenants,
-            'dedicated_count': dedicated_count,
-            'shared_count': shared_count,
+            **counters,
             'recent_tenants': recent_tenants,
             'recent_activity': recent_activity,
+            'fleet_stats': fleet_stats,
         }
         return render(request, 'panel/dashboard.html', context)
     except Exception as e:
@@ -81,19 +94,38 @@ def dashboard(request):
 @login_required
 @user_passes_test(is_superuser)
 def workspaces(request):
-    """Lista de workspaces"""
+    """Lista de workspaces (filtros en servidor, paginada por keyset)"""
+    filters = {field: request.GET.get(field, '') for field in ('q',) + TENANT_FILTER_FIELDS}
+    products = Product.objects.filter(is_active=True)
+    
     try:
-        tenants = Tenant.objects.select_related('product', 'owner').all()
-        products = Product.objects.filter(is_active=True)
+        tenants = filter_tenants(Tenant.objects.select_related('product', 'owner'), request.GET)
+        
+        try:
+            tenants, next_cursor = keyset_page(
+                tenants,
+                request.GET.get('cursor'),
+                getattr(settings, 'WORKSPACES_PAGE_SIZE', 50),
+            )
+        except InvalidCursor:
+            messages.error(request, 'El enlace de paginación no es válido')
+            return redirect('workspaces')
         
         context = {
             'tenants': tenants,
             'products': products,
+            'filters': filters,
+            'is_filtered': any(filters.values()),
+            'plan_choices': Tenant.PLAN_CHOICES,
+            'next_cursor': next_cursor,
+            'is_first_page': not request.GET.get('cursor'),
         }
         return render(request, 'panel/workspaces.html', context)
     except Exception as e:
         messages.error(request, f'Error al cargar workspaces: {str(e)}')
-        return render(request, 'panel/workspaces.html', {'tenants': [], 'products': []})
+        return render(request, 'panel/workspaces.html', {
+            'tenants': [], 'products': products, 'filters': filters, 'plan_choices': Tenant.PLAN_CHOICES,
+        })
 
 
 @login_required
@@ -153,14 +185,9 @@ def create_workspace(request):
                 except Exception as e:
                     print(f"Error creando usuario en producto: {e}")
             
-            # Sanitizar subdomain para nombres de BD (reemplazar guiones por guiones bajos)
-            safe_subdomain = subdomain.replace('-', '_')
-            db_name = f"tenant_{safe_subdomain}"
-            db_user = f"user_{safe_subdomain}"
+            db_name, db_user = Tenant.db_identifiers(subdomain)
             db_password = generate_password()
             
-            create_database(db_name, db_user, db_password)
-            
             if workspace_type == 'dedicated':
                 project_path = f"/opt/proyectos/{product.name}-system-clients/{subdomain}"
                 stack_path = f"{project_path}/docker-compose.yml"
@@ -186,90 +213,10 @@ def create_workspace(request):
                 is_deployed=False
             )
             
-            # Crear usuario admin en la tabla master del producto
-            ensure_super_admin_in_product(product.name, request.user)
-            
-            # Si es SHARED y el checkbox está marcado, inicializar repo
-            if workspace_type == 'shared' and create_github_repo:
-                try:
-                    # Verificar si ya existe el repo del producto
-                    if not product.github_repo_url:
-                        # Inicializar repo base del producto
-                        repo_result = initialize_product_repo(product.name)
-                        
-                        if repo_result.get('success'):
-                            # Actualizar producto con URL del repo
-                            product.github_repo_url = repo_result.get('repo_url', '')
-                            product.template_path = repo_result.get('path', '')
-                            product.save()
-                            
-                            # Actualizar tenant con info del repo
-                            tenant.git_repo_url = product.github_repo_url
-                            tenant.save()
-                            
-                            messages.success(request, f'Repositorio base inicializado: {product.github_repo_url}')
-                        else:
-                            messages.warning(request, f'No se pudo inicializar repositorio: {repo_result.get("error")}')
-                    else:
-                        tenant.git_repo_url = product.github_repo_url
-                        tenant.save()
-                        messages.info(request, f'Repositorio base ya existe: {product.github_repo_url}')
-                        
-                    # Ejecutar deployment
-                    deploy_result = deploy_shared_workspace_auto(
-                        product.name,
-                        subdomain,
-                        db_name,
-                        db_user,
-                        db_password
-                    )
-                    
-                    print(f"🔍 DEBUG - Deploy result: {deploy_result}")  # Debug
-                    
-                    if deploy_result.get('success'):
-                        # ⭐ Marcar como deployed automáticamente
-                        tenant.is_deployed = True
-                        tenant.save()
-                        
-                        # Registrar en log de actividad
-                        ActivityLog.objects.create(
-                            tenant=tenant,
-                            user=request.user,
-                            action='auto_deployed',
-                            description=f'Workspace deployed automáticamente - URL: {deploy_result.get("url", "N/A")}',
-                            ip_address=get_client_ip(request)
-                        )
-                        
-                        print(f"✅ Workspace marcado como deployed: {subdomain}")  # Debug
-                        messages.success(request, f'✅ Workspace {company_name} desplegado exitosamente en {deploy_result.get("url")}')
-                    else:
-                        print(f"❌ Deployment falló: {deploy_result.get('error')}")  # Debug
-                        messages.warning(request, f'⚠️ Workspace creado pero deployment falló: {deploy_result.get("error")}')
-                except Exception as e:
-                    print(f"❌ Excepción en deployment: {str(e)}")  # Debug
-                    messages.warning(request, f'⚠️ Error en deployment: {str(e)}')
+            # BD (del pool tibio si hay), super admin, repos y deploy los ejecuta el worker (provisioning_worker)
+            job = create_job(tenant, request.user, create_github_repo, get_client_ip(request))
             
-            if workspace_type == 'dedicated' and create_github_repo:
-                try:
-                    deploy_result = deploy_dedicated_workspace(
-                        product.name,
-                        subdomain,
-                        db_name,
-                        db_user,
-                        db_password
-                    )
-                    
-                    if deploy_result.get('success'):
-                        tenant.git_repo_url = deploy_result.get('repo_url', '')
-                        tenant.is_deployed = True
-                        tenant.save()
-                        messages.success(request, f'Workspace {company_name} desplegado exitosamente')
-                    else:
-                        messages.warning(request, f'Workspace creado pero deployment falló: {deploy_result.get("error")}')
-                except Exception as e:
-                    messages.warning(request, f'Workspace creado pero deployment falló: {str(e)}')
-            
-            ActivityLog.objects.create(
+            log_activity(
                 tenant=tenant,
                 user=request.user,
                 action='create',
@@ -277,8 +224,8 @@ def create_workspace(request):
                 ip_address=get_client_ip(request)
             )
             
-            messages.success(request, f'Workspace {company_name} creado exitosamente')
-            return redirect('workspace_detail', tenant_id=tenant.id)
+            messages.success(request, f'Workspace {company_name} creado, aprovisionando en segundo plano')
+            return redirect('provisioning_job', job_id=job.id)
             
         except Exception as e:
             messages.error(request, f'Error al crear workspace: {str(e)}')
@@ -294,6 +241,30 @@ def create_workspace(request):
     return render(request, 'panel/create_workspace.html', context)
 
 
+@login_required
+@user_passes_test(is_superuser)
+def provisioning_job(request, job_id):
+    """Progreso del aprovisionamiento de un workspace"""
+    job = get_object_or_404(ProvisioningJob.objects.select_related('tenant'), id=job_id)
+    return render(request, 'panel/provisioning_job.html', {'job': job})
+
+
+@login_required
+@user_passes_test(is_superuser)
+def provisioning_job_status(request, job_id):
+    """Estado del job en JSON (lo consulta la página de progreso)"""
+    job = get_object_or_404(ProvisioningJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'is_finished': job.is_finished,
+        'error': job.error,
+        'steps': job.steps,
+        'tenant_id': job.tenant_id,
+    })
+
+
 @login_required
 @user_passes_test(is_superuser)
 def edit_workspace(request, tenant_id):
@@ -313,7 +284,7 @@ def edit_workspace(request, tenant_id):
             
             tenant.save()
             
-            ActivityLog.objects.create(
+            log_activity(
                 tenant=tenant,
                 user=request.user,
                 action='update',
@@ -345,6 +316,7 @@ def workspace_detail(request, tenant_id):
         tenant = get_object_or_404(Tenant, id=tenant_id)
         tenant_users = TenantUser.objects.filter(tenant=tenant).select_related('user')
         activity = ActivityLog.objects.filter(tenant=tenant).order_by('-created_at')[:20]
+        provisioning_job = tenant.provisioning_jobs.first()
         
         # Obtener usuarios del producto
         product_users = get_product_users(tenant.product.name, tenant.id)
@@ -354,6 +326,7 @@ def workspace_detail(request, tenant_id):
             'tenant_users': tenant_users,
             'activity': activity,
             'product_users': product_users,
+            'provisioning_job': provisioning_job,
         }
         return render(request, 'panel/workspace_detail.html', context)
     except Exception as e:
@@ -465,7 +438,7 @@ def create_workspace_repo(request, tenant_id):
                     messages.error(request, f'Error al crear repositorio: {result.get("error")}')
             
             # Log de actividad
-            ActivityLog.objects.create(
+            log_activity(
                 tenant=tenant,
                 user=request.user,
                 action='create',
@@ -552,7 +525,7 @@ def workspace_action(request, tenant_id):
                 messages.success(request, f'Workspace {company_name} eliminado permanentemente')
                 return redirect('workspaces')
                 
-            ActivityLog.objects.create(
+            log_activity(
                 tenant=tenant,
                 user=request.user,
                 action=action,
@@ -666,13 +639,15 @@ def create_product(request):
                         )
                     """)
                     
+                    ensure_product_user_indexes(name)
+                    
                     # Crear super admin en la tabla del producto
                     ensure_super_admin_in_product(name, request.user)
             except Exception as e:
                 print(f"Error creando tabla master: {e}")
             
             # Log de actividad
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='create',
                 description=f'Producto "{display_name}" ({name}) creado',
@@ -700,66 +675,55 @@ def databases(request):
             'type': 'master',
             'users_count': User.objects.count(),
             'products_count': Product.objects.count(),
-            'workspaces_count': Tenant.objects.count(),
+            'workspaces_count': get_tenant_counters()['total_tenants'],
         }
         
-        # 2. Por Producto
-        products = Product.objects.filter(is_active=True).annotate(
-            tenant_count=Count('tenant')
+        # 2. Por Producto (los conteos salen de agrupar los tenants abajo)
+        products = Product.objects.filter(is_active=True)
+        
+        # Las cifras por tenant salen del snapshot TenantStats: una sola query
+        tenants = list(
+            Tenant.objects.filter(product__is_active=True).select_related('owner', 'product', 'stats')
         )
         
+        tenants_by_product = {}
+        for tenant in tenants:
+            tenants_by_product.setdefault(tenant.product_id, []).append(tenant)
+        
+        refreshed_times = []
         products_data = []
         for product in products:
-            # Workspaces SHARED
-            shared_tenants = Tenant.objects.filter(
-                product=product,
-                type='shared'
-            ).select_related('owner')
-            
             shared_data = []
-            for tenant in shared_tenants:
-                # Contar usuarios del tenant
-                user_count = len(get_product_users(product.name, tenant.id))
-                
-                # Contar tablas (intentar)
-                table_count = get_table_count(tenant.db_name)
-                
-                shared_data.append({
-                    'id': tenant.id,
-                    'db_name': tenant.db_name,
-                    'subdomain': tenant.subdomain,
-                    'url': tenant.url,
-                    'owner': tenant.owner.username,
-                    'status': tenant.status,
-                    'users_count': user_count,
-                    'tables_count': table_count,
-                    'created_at': tenant.created_at,
-                })
-            
-            # Workspaces DEDICATED
-            dedicated_tenants = Tenant.objects.filter(
-                product=product,
-                type='dedicated'
-            ).select_related('owner')
-            
             dedicated_data = []
-            for tenant in dedicated_tenants:
-                user_count = len(get_product_users(product.name, tenant.id))
-                table_count = get_table_count(tenant.db_name)
+            
+            for tenant in tenants_by_product.get(product.id, []):
+                stats = getattr(tenant, 'stats', None)
+                if stats:
+                    refreshed_times.append(stats.refreshed_at)
                 
-                dedicated_data.append({
+                tenant_data = {
                     'id': tenant.id,
                     'db_name': tenant.db_name,
                     'subdomain': tenant.subdomain,
                     'url': tenant.url,
                     'owner': tenant.owner.username,
                     'status': tenant.status,
-                    'users_count': user_count,
-                    'tables_count': table_count,
-                    'project_path': tenant.project_path,
-                    'git_repo_url': tenant.git_repo_url,
+                    'users_count': stats.user_count if stats else 0,
+                    'tables_count': stats.table_count if stats else 0,
+                    'db_size_bytes': stats.db_size_bytes if stats else 0,
+                    'estimated_rows': stats.estimated_rows if stats else 0,
+                    'stats_refreshed_at': stats.refreshed_at if stats else None,
+                    'degraded': bool(stats) and not stats.is_reachable,
+                    'error': stats.last_error if stats else '',
                     'created_at': tenant.created_at,
-                })
+                }
+                
+                if tenant.type == 'shared':
+                    shared_data.append(tenant_data)
+                else:
+                    tenant_data['project_path'] = tenant.project_path
+                    tenant_data['git_repo_url'] = tenant.git_repo_url
+                    dedicated_data.append(tenant_data)
             
             products_data.append({
                 'id': product.id,
@@ -777,6 +741,7 @@ def databases(request):
         context = {
             'master_db': master_db,
             'products': products_data,
+            'stats_refreshed_at': min(refreshed_times) if refreshed_times else None,
         }
         return render(request, 'panel/databases.html', context)
     except Exception as e:
@@ -810,13 +775,18 @@ def database_manage(request, db_name):
                 'product_name': tenant.product.name,
             }
         
-        # Si es POST, ejecutar query
+        # Si es POST, ejecutar query (una página de resultados)
         query_result = None
         if request.method == 'POST':
             sql_query = request.POST.get('sql_query', '').strip()
             
+            try:
+                page = int(request.POST.get('page', 1))
+            except ValueError:
+                page = 1
+            
             if sql_query:
-                query_result = execute_sql_query(db_name, sql_query)
+                query_result = execute_sql_query(db_name, sql_query, page=page)
         
         # Listar tablas
         tables = get_database_tables(db_name)
@@ -833,6 +803,35 @@ def database_manage(request, db_name):
         return redirect('databases')
 
 
+@login_required
+@user_passes_test(is_superuser)
+def database_export_query(request, db_name):
+    """Exporta el resultado de un SELECT como CSV o NDJSON en streaming"""
+    if request.method != 'POST':
+        return redirect('database_manage', db_name=db_name)
+    
+    if db_name != 'tenant_master' and not Tenant.objects.filter(db_name=db_name).exists():
+        messages.error(request, f'Base de datos {db_name} no encontrada')
+        return redirect('databases')
+    
+    sql_query = request.POST.get('sql_query', '').strip()
+    export_format = 'ndjson' if request.POST.get('format') == 'ndjson' else 'csv'
+    
+    stream = stream_sql_query(db_name, sql_query, export_format)
+    try:
+        # Abre la query antes de responder: los errores de SQL se muestran en la consola
+        next(stream)
+    except Exception as e:
+        stream.close()
+        messages.error(request, f'Error al exportar: {str(e)}')
+        return redirect('database_manage', db_name=db_name)
+    
+    content_type = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv; charset=utf-8'
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{db_name}_export.{export_format}"'
+    return response
+
+
 @login_required
 @user_passes_test(is_superuser)
 def database_users_api(request, db_name):
@@ -874,15 +873,6 @@ def database_users_api(request, db_name):
             data = json.loads(request.body)
             user_id = data.get('id')
             
-            conn = psycopg2.connect(
-                host=settings.DATABASES['default']['HOST'],
-                port=settings.DATABASES['default']['PORT'],
-                user=settings.DATABASES['default']['USER'],
-                password=settings.DATABASES['default']['PASSWORD'],
-                database='tenant_master'
-            )
-            cursor = conn.cursor()
-            
             # Construir UPDATE
             updates = []
             params = []
@@ -902,15 +892,14 @@ def database_users_api(request, db_name):
             
             params.append(user_id)
             
-            cursor.execute(f"""
-                UPDATE {table_name}
-                SET {', '.join(updates)}
-                WHERE id = %s AND is_super_admin = FALSE
-            """, params)
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_pool.connection('tenant_master') as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        UPDATE {table_name}
+                        SET {', '.join(updates)}
+                        WHERE id = %s AND is_super_admin = FALSE
+                    """, params)
+                conn.commit()
             
             return JsonResponse({'success': True, 'message': 'Usuario actualizado'})
         
@@ -927,20 +916,92 @@ def database_users_api(request, db_name):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required
+@user_passes_test(is_superuser)
+def database_table_count(request, db_name, table_name):
+    """Conteo exacto de filas de una tabla (se pide bajo demanda desde la UI)"""
+    if db_name != 'tenant_master' and not Tenant.objects.filter(db_name=db_name).exists():
+        return JsonResponse({'error': 'Base de datos no encontrada'}, status=404)
+    
+    try:
+        rows = get_exact_row_count(db_name, table_name)
+        return JsonResponse({'table': table_name, 'rows': rows})
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+@user_passes_test(is_superuser)
+def refresh_database_stats(request, db_name):
+    """Refresca bajo demanda el snapshot de estadísticas de un tenant"""
+    if request.method == 'POST':
+        tenant = get_object_or_404(Tenant.objects.select_related('product'), db_name=db_name)
+        
+        updated, failed = refresh_tenant_stats([tenant])
+        if failed:
+            messages.warning(request, f'La base de datos {db_name} no respondió; se conservan las últimas cifras')
+        else:
+            messages.success(request, f'Estadísticas de {db_name} actualizadas')
+    
+    return redirect('databases')
+
+
 @login_required
 @user_passes_test(is_superuser)
 def activity(request):
-    """Log de actividades"""
+    """Log de actividades (filtros en servidor, paginado por keyset)"""
+    filters = {field: request.GET.get(field, '') for field in ACTIVITY_FILTER_FIELDS}
+    
     try:
-        logs = ActivityLog.objects.select_related('user', 'tenant').order_by('-created_at')[:100]
+        logs = filter_activity(ActivityLog.objects.select_related('user', 'tenant'), request.GET)
+        
+        try:
+            logs, next_cursor = keyset_page(
+                logs,
+                request.GET.get('cursor'),
+                getattr(settings, 'ACTIVITY_PAGE_SIZE', 50),
+            )
+        except InvalidCursor:
+            messages.error(request, 'El enlace de paginación no es válido')
+            return redirect('activity')
         
         context = {
             'logs': logs,
+            'filters': filters,
+            'is_filtered': any(filters.values()),
+            'action_choices': ActivityLog.ACTION_CHOICES,
+            'next_cursor': next_cursor,
+            'is_first_page': not request.GET.get('cursor'),
         }
         return render(request, 'panel/activity.html', context)
     except Exception as e:
         messages.error(request, f'Error al cargar actividad: {str(e)}')
-        return render(request, 'panel/activity.html', {'logs': []})
+        return render(request, 'panel/activity.html', {
+            'logs': [], 'filters': filters, 'action_choices': ActivityLog.ACTION_CHOICES,
+        })
+
+
+@login_required
+@user_passes_test(is_superuser)
+def activity_export(request):
+    """Exporta la actividad filtrada a CSV en streaming"""
+    logs = filter_activity(ActivityLog.objects.all(), request.GET).order_by('-created_at', '-id')
+    rows = logs.values_list(
+        'created_at', 'action', 'description', 'user__username', 'tenant__subdomain', 'ip_address', 'id',
+    ).iterator(chunk_size=getattr(settings, 'ACTIVITY_EXPORT_CHUNK', 2000))
+    
+    def stream():
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(['fecha', 'accion', 'descripcion', 'usuario', 'tenant', 'ip', 'id'])
+        for created_at, *values in rows:
+            yield writer.writerow([timezone.localtime(created_at).isoformat(), *values])
+    
+    filename = f"actividad_{timezone.localdate():%Y%m%d}.csv"
+    response = StreamingHttpResponse(stream(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @login_required
@@ -1032,29 +1093,17 @@ def settings_view(request):
 # FUNCIONES AUXILIARES - USUARIOS DE PRODUCTOS
 # ============================================
 
-def get_product_users(product_name, tenant_id=None):
-    """Obtiene usuarios de la tabla {product}_users_master"""
-    try:
-        with connection.cursor() as cursor:
-            if tenant_id:
-                cursor.execute(f"""
-                    SELECT id, username, email, phone, login_type, is_super_admin, is_active, created_at
-                    FROM {product_name}_users_master
-                    WHERE tenant_id = %s OR is_super_admin = TRUE
-                    ORDER BY is_super_admin DESC, created_at DESC
-                """, [tenant_id])
-            else:
-                cursor.execute(f"""
-                    SELECT id, username, email, phone, login_type, is_super_admin, is_active, created_at
-                    FROM {product_name}_users_master
-                    ORDER BY is_super_admin DESC, created_at DESC
-                """)
-            
-            columns = [col[0] for col in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
-    except Exception as e:
-        print(f"Error getting product users: {e}")
-        return []
+def ensure_product_user_indexes(product_name):
+    """Índices de {product}_users_master para filtros por tenant y super admin"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {product_name}_users_master_tenant_idx
+            ON {product_name}_users_master (tenant_id, is_super_admin)
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {product_name}_users_master_super_admin_idx
+            ON {product_name}_users_master (is_super_admin) WHERE is_super_admin
+        """)
 
 
 def create_product_user(product_name, tenant_id, username, password, email='', phone='', login_type='username'):
@@ -1112,33 +1161,36 @@ def ensure_super_admin_in_product(product_name, admin_user):
 # FUNCIONES AUXILIARES - BASE DE DATOS
 # ============================================
 
-def create_database(db_name, db_user, db_password):
-    """Crea una base de datos y usuario para el tenant"""
+def create_database(db_name, db_user, db_password, template=None):
+    """
+    Crea una base de datos y usuario para el tenant. template es
+    (plantilla, rol dueño) de template_dbs.ready_template: la BD se clona ya
+    migrada y sus objetos pasan al usuario del tenant.
+    """
     try:
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database='postgres'
-        )
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(f"SELECT 1 FROM pg_roles WHERE rolname = '{db_user}'")
-            if not cursor.fetchone():
-                cursor.execute(f"CREATE USER {db_user} WITH PASSWORD '{db_password}'")
-            
-            cursor.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}'")
-            if not cursor.fetchone():
-                cursor.execute(f"CREATE DATABASE {db_name} OWNER {db_user}")
-            
-            cursor.execute(f"GRANT ALL PRIVILEGES ON DATABASE {db_name} TO {db_user}")
-            
-        finally:
-            cursor.close()
-            conn.close()
+        cloned = False
+        with db_pool.connection('postgres', autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT 1 FROM pg_roles WHERE rolname = '{db_user}'")
+                if not cursor.fetchone():
+                    cursor.execute(f"CREATE USER {db_user} WITH PASSWORD '{db_password}'")
+                
+                cursor.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}'")
+                if not cursor.fetchone():
+                    if template:
+                        cursor.execute(f"CREATE DATABASE {db_name} OWNER {db_user} TEMPLATE {template[0]}")
+                        cloned = True
+                    else:
+                        cursor.execute(f"CREATE DATABASE {db_name} OWNER {db_user}")
+                
+                cursor.execute(f"GRANT ALL PRIVILEGES ON DATABASE {db_name} TO {db_user}")
+        
+        if cloned:
+            with db_pool.connection(db_name, autocommit=True) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"REASSIGN OWNED BY {template[1]} TO {db_user}")
+                    cursor.execute(f"REVOKE ALL ON SCHEMA public FROM {template[1]}")
+        return cloned
     except Exception as e:
         raise Exception(f"Error al crear base de datos: {str(e)}")
 
@@ -1146,34 +1198,24 @@ def create_database(db_name, db_user, db_password):
 def delete_database(db_name, db_user):
     """Elimina una base de datos y usuario del tenant"""
     try:
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database='postgres'
-        )
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-        cursor = conn.cursor()
+        # Cerrar primero las conexiones que el pool mantiene abiertas a esa BD
+        db_pool.discard(db_name)
         
-        try:
-            # Terminar conexiones activas a la BD
-            cursor.execute(f"""
-                SELECT pg_terminate_backend(pg_stat_activity.pid)
-                FROM pg_stat_activity
-                WHERE pg_stat_activity.datname = '{db_name}'
-                AND pid <> pg_backend_pid()
-            """)
-            
-            # Eliminar BD
-            cursor.execute(f"DROP DATABASE IF EXISTS {db_name}")
-            
-            # Eliminar usuario
-            cursor.execute(f"DROP USER IF EXISTS {db_user}")
-            
-        finally:
-            cursor.close()
-            conn.close()
+        with db_pool.connection('postgres', autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                # Terminar conexiones activas a la BD
+                cursor.execute(f"""
+                    SELECT pg_terminate_backend(pg_stat_activity.pid)
+                    FROM pg_stat_activity
+                    WHERE pg_stat_activity.datname = '{db_name}'
+                    AND pid <> pg_backend_pid()
+                """)
+                
+                # Eliminar BD
+                cursor.execute(f"DROP DATABASE IF EXISTS {db_name}")
+                
+                # Eliminar usuario
+                cursor.execute(f"DROP USER IF EXISTS {db_user}")
     except Exception as e:
         raise Exception(f"Error al eliminar base de datos: {str(e)}")
 
@@ -1188,121 +1230,163 @@ def get_client_ip(request):
     return ip
 
 
-def get_table_count(db_name):
-    """Cuenta las tablas en una base de datos"""
-    try:
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database=db_name
-        )
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-            AND table_type = 'BASE TABLE'
-        """)
-        
-        count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
-        return count
-    except:
-        return 0
-
-
 def get_database_tables(db_name):
-    """Obtiene lista de tablas de una base de datos con info"""
+    """
+    Obtiene lista de tablas de una base de datos con info del catálogo.
+    Las filas son la estimación de pg_class.reltuples (sin COUNT(*));
+    el conteo exacto se pide por tabla con get_exact_row_count.
+    """
     try:
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database=db_name
-        )
-        cursor = conn.cursor()
-        
-        # Obtener tablas con conteo de filas
-        cursor.execute("""
-            SELECT 
-                schemaname,
-                tablename,
-                (SELECT COUNT(*) FROM information_schema.columns 
-                 WHERE table_name = tablename) as column_count
-            FROM pg_tables
-            WHERE schemaname = 'public'
-            ORDER BY tablename
-        """)
-        
-        tables = []
-        for row in cursor.fetchall():
-            schema, table_name, column_count = row
-            
-            # Obtener conteo de filas (puede ser lento en tablas grandes)
-            try:
-                cursor.execute(f'SELECT COUNT(*) FROM {table_name}')
-                row_count = cursor.fetchone()[0]
-            except:
-                row_count = 0
-            
-            tables.append({
-                'name': table_name,
-                'columns': column_count,
-                'rows': row_count,
-            })
-        
-        cursor.close()
-        conn.close()
-        return tables
+        with db_pool.connection(db_name) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        c.relname,
+                        (SELECT COUNT(*) FROM pg_attribute a
+                         WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped) AS column_count,
+                        GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+                        c.reltuples < 0 AS never_analyzed,
+                        pg_table_size(c.oid) AS table_size,
+                        pg_indexes_size(c.oid) AS index_size
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = 'public'
+                    AND c.relkind IN ('r', 'p')
+                    ORDER BY c.relname
+                """)
+                
+                tables = []
+                for table_name, column_count, estimated_rows, never_analyzed, table_size, index_size in cursor.fetchall():
+                    tables.append({
+                        'name': table_name,
+                        'columns': column_count,
+                        'rows': estimated_rows,
+                        'never_analyzed': never_analyzed,
+                        'table_size': table_size,
+                        'index_size': index_size,
+                    })
+                
+                return tables
     except Exception as e:
         print(f"Error getting tables: {e}")
         return []
 
 
-def execute_sql_query(db_name, sql_query):
-    """Ejecuta una query SQL y retorna resultados"""
-    try:
-        conn = psycopg2.connect(
-            host=settings.DATABASES['default']['HOST'],
-            port=settings.DATABASES['default']['PORT'],
-            user=settings.DATABASES['default']['USER'],
-            password=settings.DATABASES['default']['PASSWORD'],
-            database=db_name
-        )
-        cursor = conn.cursor()
-        
-        # Ejecutar query
-        cursor.execute(sql_query)
-        
-        # Si es SELECT, obtener resultados
-        if sql_query.strip().upper().startswith('SELECT'):
-            columns = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
+def get_exact_row_count(db_name, table_name):
+    """COUNT(*) exacto de una tabla del schema public, acotado por statement_timeout"""
+    timeout = getattr(settings, 'SQL_EXACT_COUNT_TIMEOUT', 30)
+    
+    with db_pool.connection(db_name) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", [timeout * 1000])
+            
+            # Validar contra el catálogo en vez de interpolar el nombre
+            cursor.execute("""
+                SELECT 1 FROM pg_tables WHERE schemaname = 'public' AND tablename = %s
+            """, [table_name])
+            if not cursor.fetchone():
+                raise ValueError(f'La tabla {table_name} no existe')
             
-            result = {
-                'success': True,
-                'type': 'select',
-                'columns': columns,
-                'rows': rows,
-                'row_count': len(rows),
-            }
-        else:
-            # Para INSERT, UPDATE, DELETE, etc.
-            conn.commit()
-            result = {
-                'success': True,
-                'type': 'modify',
-                'affected_rows': cursor.rowcount,
-            }
-        
-        cursor.close()
-        conn.close()
-        return result
+            cursor.execute(
+                sql.SQL('SELECT COUNT(*) FROM {}.{}').format(sql.Identifier('public'), sql.Identifier(table_name))
+            )
+            return cursor.fetchone()[0]
+
+
+# Queries que PostgreSQL acepta en DECLARE CURSOR (cursor del lado del servidor)
+CURSOR_QUERY_KEYWORDS = ('SELECT', 'WITH', 'VALUES', 'TABLE')
+
+# Lo que no es una lectura simple: CTEs que modifican datos, SELECT INTO y
+# funciones de administración cuyo efecto no se puede dejar a medio evaluar
+NON_CURSOR_PATTERN = re.compile(
+    r'\b(INSERT|UPDATE|DELETE|MERGE|INTO|pg_terminate_backend|pg_cancel_backend|'
+    r'pg_reload_conf|pg_notify|pg_advisory_\w+|dblink\w*)\b',
+    re.IGNORECASE,
+)
+
+
+def clean_sql_query(sql_query):
+    """Quita espacios y ';' finales (DECLARE CURSOR no admite varias sentencias)"""
+    return sql_query.strip().rstrip(';').strip()
+
+
+def is_cursor_query(sql_query):
+    """
+    True si la query es una lectura simple que puede ir en un cursor con
+    nombre. Ante la duda retorna False y la query va por el cursor normal.
+    """
+    words = sql_query.lstrip('( \t\r\n').split(None, 1)
+    return (
+        bool(words)
+        and words[0].upper() in CURSOR_QUERY_KEYWORDS
+        and not NON_CURSOR_PATTERN.search(sql_query)
+    )
+
+
+def execute_sql_query(db_name, sql_query, page=1, page_size=None):
+    """
+    Ejecuta una query SQL y retorna una página de resultados.
+    Los SELECT de solo lectura van por un cursor con nombre: el servidor salta
+    hasta la página pedida y solo se traen page_size filas, hasta
+    SQL_CONSOLE_MAX_ROWS. El resto (CTEs que modifican datos, SELECT con
+    efectos) se ejecuta completo en el cursor normal y se confirma con commit.
+    Toda query queda acotada por SQL_CONSOLE_STATEMENT_TIMEOUT.
+    """
+    page_size = page_size or getattr(settings, 'SQL_CONSOLE_PAGE_SIZE', 100)
+    max_rows = getattr(settings, 'SQL_CONSOLE_MAX_ROWS', 10000)
+    timeout = getattr(settings, 'SQL_CONSOLE_STATEMENT_TIMEOUT', 30)
+    sql_query = clean_sql_query(sql_query)
+    page = max(1, page)
+    offset = (page - 1) * page_size
+    
+    if offset >= max_rows:
+        return {
+            'success': False,
+            'error': f'La consola muestra como máximo {max_rows} filas; usa la exportación para más',
+        }
+    
+    try:
+        # reset_session: la query del usuario puede dejar SETs o temp tables
+        with db_pool.connection(db_name, reset_session=True) as conn:
+            if is_cursor_query(sql_query):
+                try:
+                    return fetch_cursor_page(conn, sql_query, timeout, page, page_size, offset, max_rows)
+                except pg_errors.ReadOnlySqlTransaction:
+                    # nextval(), setval(), funciones que escriben: se ejecuta completa y con commit
+                    conn.rollback()
+            
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [timeout * 1000])
+                cursor.execute(sql_query)
+                
+                # INSERT ... RETURNING, EXPLAIN, SHOW: devuelven filas sin cursor con nombre
+                if cursor.description is not None:
+                    columns = [desc[0] for desc in cursor.description]
+                    rows = cursor.fetchmany(page_size + 1)
+                    conn.commit()
+                    return {
+                        'success': True,
+                        'type': 'select',
+                        'columns': columns,
+                        'rows': rows[:page_size],
+                        'row_count': len(rows[:page_size]),
+                        'page': 1,
+                        'page_size': page_size,
+                        'first_row': 1,
+                        'last_row': len(rows[:page_size]),
+                        'has_previous': False,
+                        'has_next': False,
+                        'capped': len(rows) > page_size,
+                        'max_rows': page_size,
+                    }
+                
+                # Para INSERT, UPDATE, DELETE, etc.
+                conn.commit()
+                return {
+                    'success': True,
+                    'type': 'modify',
+                    'affected_rows': cursor.rowcount,
+                }
         
     except Exception as e:
         return {
@@ -1311,41 +1395,137 @@ def execute_sql_query(db_name, sql_query):
         }
 
 
+def fetch_cursor_page(conn, sql_query, timeout, page, page_size, offset, max_rows):
+    """
+    Página de un SELECT vía cursor con nombre, en una transacción READ ONLY:
+    el cursor solo evalúa las filas que se leen y la transacción se descarta,
+    así que una query que intente escribir falla en vez de perder el cambio.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION READ ONLY")
+        cursor.execute("SET LOCAL statement_timeout = %s", [timeout * 1000])
+    
+    with conn.cursor(name='panel_sql_console') as cursor:
+        cursor.execute(sql_query)
+        if offset:
+            cursor.scroll(offset)
+        
+        # Una fila extra para saber si hay página siguiente
+        limit = min(page_size, max_rows - offset)
+        rows = cursor.fetchmany(limit + 1)
+        columns = [desc[0] for desc in cursor.description]
+    conn.rollback()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'success': True,
+        'type': 'select',
+        'columns': columns,
+        'rows': rows,
+        'row_count': len(rows),
+        'page': page,
+        'page_size': page_size,
+        'first_row': offset + 1,
+        'last_row': offset + len(rows),
+        'has_previous': page > 1,
+        'has_next': has_more and offset + len(rows) < max_rows,
+        'capped': has_more and offset + len(rows) >= max_rows,
+        'max_rows': max_rows,
+    }
+
+
+class EchoBuffer:
+    """Buffer para csv.writer que devuelve la línea en vez de acumularla"""
+    def write(self, value):
+        return value
+
+
+def stream_sql_query(db_name, sql_query, export_format='csv'):
+    """
+    Generador que exporta el resultado de un SELECT en CSV o NDJSON.
+    Lee del cursor con nombre en bloques de SQL_CONSOLE_EXPORT_CHUNK filas,
+    dentro de una transacción READ ONLY, sin materializar el resultado.
+    El primer valor producido es '' una vez abierta la query, para que
+    el llamador detecte errores antes de empezar a responder.
+    """
+    chunk_size = getattr(settings, 'SQL_CONSOLE_EXPORT_CHUNK', 2000)
+    max_rows = getattr(settings, 'SQL_CONSOLE_EXPORT_MAX_ROWS', 1000000)
+    timeout = getattr(settings, 'SQL_CONSOLE_EXPORT_TIMEOUT', 300)
+    sql_query = clean_sql_query(sql_query)
+    
+    if not is_cursor_query(sql_query):
+        raise ValueError('Solo se pueden exportar consultas SELECT de solo lectura')
+    
+    # La conexión se retiene hasta que el generador termina o se cierra
+    with db_pool.connection(db_name, reset_session=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute("SET LOCAL statement_timeout = %s", [timeout * 1000])
+        
+        with conn.cursor(name='panel_sql_export') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(sql_query)
+            rows = cursor.fetchmany(chunk_size)
+            columns = [desc[0] for desc in cursor.description]
+            yield ''
+            
+            if export_format == 'ndjson':
+                encoder = DjangoJSONEncoder()
+                def encode(row):
+                    return encoder.encode(dict(zip(columns, row))) + '\n'
+            else:
+                writer = csv.writer(EchoBuffer())
+                encode = writer.writerow
+                yield encode(columns)
+            
+            sent = 0
+            while rows and sent < max_rows:
+                rows = rows[:max_rows - sent]
+                yield ''.join(encode(row) for row in rows)
+                sent += len(rows)
+                rows = cursor.fetchmany(chunk_size)
+    
+    print(f"[SQL-EXPORT] {db_name}: {sent} filas exportadas ({export_format})")
+
+
 # ============================================
 # FUNCIONES AUXILIARES - DEPLOYMENT
 # ============================================
 
+def parse_script_result(stdout):
+    """Extrae el JSON que los scripts de infra imprimen tras '=== RESULT ==='"""
+    json_start = False
+    json_output = []
+    
+    for line in stdout.split('\n'):
+        if '=== RESULT ===' in line:
+            json_start = True
+            continue
+        if json_start and line.strip():
+            json_output.append(line)
+    
+    if json_output:
+        return json.loads(''.join(json_output))
+    return {
+        'success': False,
+        'error': 'No se pudo parsear el resultado del deployment'
+    }
+
+
+DEDICATED_DEPLOY_SCRIPT = '/app/infra/scripts/deploy_dedicated_workspace.py'
+
+
 def deploy_dedicated_workspace(product_name, subdomain, db_name, db_user, db_password):
     """Ejecuta el script de deployment automático para workspaces dedicados"""
     try:
-        script_path = '/app/infra/scripts/deploy_dedicated_workspace.py'
-        
         result = subprocess.run(
-            ['python3', script_path, product_name, subdomain, db_name, db_user, db_password],
+            ['python3', DEDICATED_DEPLOY_SCRIPT, product_name, subdomain, db_name, db_user, db_password],
             capture_output=True,
             text=True,
             timeout=300  # 5 minutos timeout
         )
-        
-        # Extraer JSON del output
-        output_lines = result.stdout.split('\n')
-        json_start = False
-        json_output = []
-        
-        for line in output_lines:
-            if '=== RESULT ===' in line:
-                json_start = True
-                continue
-            if json_start and line.strip():
-                json_output.append(line)
-        
-        if json_output:
-            return json.loads(''.join(json_output))
-        else:
-            return {
-                'success': False,
-                'error': 'No se pudo parsear el resultado del deployment'
-            }
+        return parse_script_result(result.stdout)
             
     except subprocess.TimeoutExpired:
         return {
@@ -1359,6 +1539,30 @@ def deploy_dedicated_workspace(product_name, subdomain, db_name, db_user, db_pas
         }
 
 
+def run_dedicated_deploy_step(step, product_name, subdomain, db_name, db_user, db_password, repo_url='', timeout=300):
+    """Ejecuta una sola etapa (copy, git, repo, push) del deployment dedicado"""
+    try:
+        result = subprocess.run(
+            ['python3', DEDICATED_DEPLOY_SCRIPT, product_name, subdomain, db_name, db_user, db_password,
+             '--step', step, '--repo-url', repo_url],
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        return parse_script_result(result.stdout)
+    
+    except subprocess.TimeoutExpired:
+        return {
+            'success': False,
+            'error': f'Etapa {step} timeout (>{timeout}s)'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
 def initialize_product_repo(product_name):
     """Inicializa repositorio base para productos SHARED"""
     try:
@@ -0,0 +1,150 @@
+"""
+Pool tibio de BDs y roles de tenant
+
+CREATE DATABASE y CREATE USER se serializan en Postgres y se vuelven lentos
+cuando llegan muchas altas juntas. El comando fill_warm_pool mantiene por
+producto WARM_POOL_SIZE pares BD/rol ya creados (clonados de la plantilla
+vigente si existe); al crear un workspace se reclama uno con
+SELECT ... FOR UPDATE SKIP LOCKED y se renombra al nombre del tenant en una
+sola transacción, así que la BD queda lista en milisegundos.
+"""
+import secrets
+
+from django.conf import settings
+from django.db import transaction
+
+from .db_pool import db_pool
+from .models import Product, WarmDatabase
+from .template_dbs import ready_template
+
+WARM_PREFIX = 'warm_'
+
+
+def _database_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", [name])
+    return cursor.fetchone() is not None
+
+
+def database_exists(db_name):
+    with db_pool.connection('postgres', autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            return _database_exists(cursor, db_name)
+
+
+def claim_warm_database(product, db_name, db_user, db_password):
+    """
+    Asigna una BD del pool al tenant: la renombra a db_name, renombra su rol a
+    db_user y le pone db_password. Retorna False si no hay BD disponible (o el
+    nombre ya existe) y el llamador debe crearla como siempre.
+    """
+    if not getattr(settings, 'WARM_POOL_ENABLED', True):
+        return False
+
+    template = ready_template(product)
+    template_db = template[0] if template else ''
+
+    try:
+        with transaction.atomic():
+            warm = (
+                WarmDatabase.objects.select_for_update(skip_locked=True)
+                .filter(product=product, template_db=template_db)
+                .first()
+            )
+            if warm is None:
+                return False
+
+            db_pool.discard(warm.db_name)
+            with db_pool.connection('postgres') as conn:
+                try:
+                    with conn.cursor() as cursor:
+                        if _database_exists(cursor, db_name):
+                            conn.rollback()
+                            return False
+                        # RENAME es transaccional: o se renombran ambos o ninguno
+                        cursor.execute(f"ALTER DATABASE {warm.db_name} RENAME TO {db_name}")
+                        cursor.execute(f"ALTER ROLE {warm.db_user} RENAME TO {db_user}")
+                        cursor.execute(f"ALTER ROLE {db_user} WITH LOGIN PASSWORD %s", [db_password])
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+            warm.delete()
+    except Exception as e:
+        print(f"[WARM POOL] No se pudo reclamar BD para {db_name}: {e}")
+        return False
+
+    print(f"[WARM POOL] {warm.db_name} asignada como {db_name}")
+    return True
+
+
+def _drop(db_name, db_user):
+    from .views import delete_database
+    delete_database(db_name, db_user)
+
+
+def recycle_stale(product):
+    """Elimina las BDs del pool clonadas de una plantilla que ya no es la vigente"""
+    template = ready_template(product)
+    template_db = template[0] if template else ''
+    removed = 0
+    for warm in WarmDatabase.objects.filter(product=product).exclude(template_db=template_db):
+        with transaction.atomic():
+            # Bloquear para no borrar una que otro proceso está reclamando
+            locked = WarmDatabase.objects.select_for_update(skip_locked=True).filter(id=warm.id).first()
+            if locked is None:
+                continue
+            _drop(locked.db_name, locked.db_user)
+            locked.delete()
+            removed += 1
+    return removed
+
+
+def remove_orphans():
+    """Elimina BDs y roles warm_* que no están registrados (creación interrumpida)"""
+    registered = set(WarmDatabase.objects.values_list('db_name', flat=True))
+    pattern = WARM_PREFIX.replace('_', '\\_') + '%'
+    with db_pool.connection('postgres', autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT datname FROM pg_database WHERE datname LIKE %s
+                UNION
+                SELECT rolname FROM pg_roles WHERE rolname LIKE %s
+            """, [pattern, pattern])
+            orphans = [row[0] for row in cursor.fetchall() if row[0] not in registered]
+    for name in orphans:
+        # La BD y su rol se crean con el mismo nombre
+        _drop(name, name)
+    return len(orphans)
+
+
+def fill_product(product, size=None):
+    """Crea BDs del pool hasta tener `size` listas para el producto. Retorna cuántas creó"""
+    from .views import create_database
+
+    size = getattr(settings, 'WARM_POOL_SIZE', 3) if size is None else size
+    template = ready_template(product)
+    template_db = template[0] if template else ''
+    missing = size - WarmDatabase.objects.filter(product=product, template_db=template_db).count()
+
+    created = 0
+    for _ in range(max(missing, 0)):
+        name = f"{WARM_PREFIX}{product.name}_{secrets.token_hex(4)}"
+        create_database(name, name, secrets.token_urlsafe(24), template=template)
+        # Sin conexiones abiertas: ALTER DATABASE ... RENAME las rechaza
+        db_pool.discard(name)
+        WarmDatabase.objects.create(product=product, db_name=name, db_user=name, template_db=template_db)
+        created += 1
+    return created
+
+
+def fill_pool(size=None):
+    """Recicla, limpia y rellena el pool de todos los productos activos"""
+    summary = {'created': 0, 'recycled': 0, 'orphans': remove_orphans()}
+    for product in Product.objects.filter(is_active=True):
+        try:
+            summary['recycled'] += recycle_stale(product)
+            summary['created'] += fill_product(product, size)
+        except Exception as e:
+            print(f"[WARM POOL] Error rellenando pool de {product.name}: {e}")
+    return summary
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Backups de la BD master y de las BDs de tenants activos
+
+- pg_dump -Fc (formato custom) con paralelismo acotado.
+- Cada corrida es un directorio BACKUP_DIR/<YYYYmmdd_HHMMSS>/ con un volcado
+  por BD y un manifest.json (tamaño, duración, firma y filas estimadas por
+  tabla de cada BD).
+- Con --store chunks (por defecto) el volcado sale sin comprimir (-Z0) por un
+  pipe al repositorio de chunks (chunkstore.py, en BACKUP_DIR/chunks/) y en
+  la corrida queda solo un índice <db>.idx: los bloques que se repiten entre
+  tenants del mismo producto y entre corridas se guardan una vez. Con
+  --store files se escribe un <db>.dump comprimido como antes.
+- Un tenant cuya BD no cambió desde la corrida anterior no se vuelve a
+  volcar: su volcado anterior se enlaza (hardlink) en la corrida nueva, así
+  cada directorio es completo por sí mismo y la retención puede borrar
+  corridas viejas sin perder nada. "No cambió" = misma firma en
+  pg_stat_database: oid de la BD, stats_reset y los contadores de tuplas
+  insertadas/actualizadas/eliminadas (xact_commit no sirve: también lo
+  incrementan las lecturas, incluido el propio pg_dump).
+- La master siempre se vuelca. Un tenant sin cambios se vuelca igual si su
+  último volcado real tiene más de --full-every días.
+- Después de la retención se borran los chunks que ya no referencia ningún
+  índice.
+
+Uso:
+    python backup.py [--concurrency 4] [--retention-days 7] [--full-every 7] [--tenant tenant_acme]
+    python backup.py --store files
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from chunkstore import INDEX_SUFFIX, ChunkStore, referenced_chunks, write_index
+
+RUN_FORMAT = '%Y%m%d_%H%M%S'
+MANIFEST = 'manifest.json'
+
+
+def pg_settings():
+    return {
+        'host': os.getenv('POSTGRES_HOST', 'localhost'),
+        'port': os.getenv('POSTGRES_PORT', '5432'),
+        'user': os.getenv('POSTGRES_USER', 'tenant_admin'),
+        'password': os.getenv('POSTGRES_PASSWORD') or os.getenv('PGPASSWORD'),
+    }
+
+
+def connect(pg, db_name):
+    return psycopg2.connect(
+        dbname=db_name, host=pg['host'], port=pg['port'], user=pg['user'], password=pg['password'],
+        connect_timeout=10,
+    )
+
+
+# ============================================
+# ESTADO
+# ============================================
+
+def list_tenant_dbs(pg, master_db, only=None):
+    with connect(pg, master_db) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT db_name FROM panel_tenant WHERE status = 'active' ORDER BY db_name")
+            names = [row[0] for row in cursor.fetchall()]
+    if only:
+        names = [name for name in names if name in only]
+    return names
+
+
+def database_signatures(pg, master_db, names):
+    """db_name -> firma de escrituras según pg_stat_database"""
+    with connect(pg, master_db) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT datname, datid, stats_reset, tup_inserted, tup_updated, tup_deleted
+                FROM pg_stat_database
+                WHERE datname = ANY(%s)
+            """, [list(names)])
+            return {
+                row[0]: [row[1], row[2].isoformat() if row[2] else None, row[3], row[4], row[5]]
+                for row in cursor.fetchall()
+            }
+
+
+def table_estimates(pg, db_name):
+    """
+    Tabla -> filas estimadas por el catálogo (pg_class.reltuples, como
+    TenantStats); None en tablas nunca analizadas. restore.py --verify las
+    compara con el conteo real de la BD restaurada.
+    """
+    with connect(pg, db_name) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname, c.reltuples::bigint
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+            """)
+            # reltuples es -1 en tablas nunca analizadas (PG14+)
+            return {name: (rows if rows >= 0 else None) for name, rows in cursor.fetchall()}
+
+
+def run_dirs(backup_dir):
+    """Corridas completas (con manifest), de la más vieja a la más nueva"""
+    runs = []
+    for name in sorted(os.listdir(backup_dir)):
+        try:
+            datetime.strptime(name, RUN_FORMAT)
+        except ValueError:
+            continue
+        if os.path.exists(os.path.join(backup_dir, name, MANIFEST)):
+            runs.append(name)
+    return runs
+
+
+def load_previous(backup_dir):
+    """db_name -> entrada del manifest de la última corrida, con su directorio"""
+    runs = run_dirs(backup_dir)
+    if not runs:
+        return {}
+    with open(os.path.join(backup_dir, runs[-1], MANIFEST)) as f:
+        manifest = json.load(f)
+    previous = {}
+    for entry in manifest['databases']:
+        if entry['status'] in ('dumped', 'unchanged'):
+            entry['path'] = os.path.join(backup_dir, runs[-1], entry['file'])
+            previous[entry['db_name']] = entry
+    return previous
+
+
+# ============================================
+# VOLCADO
+# ============================================
+
+def pg_dump_command(pg, db_name, *extra):
+    return ['pg_dump', '-Fc', *extra, '-h', pg['host'], '-p', str(pg['port']), '-U', pg['user'], '-d', db_name]
+
+
+def pg_env(pg):
+    env = dict(os.environ)
+    if pg['password']:
+        env['PGPASSWORD'] = pg['password']
+    return env
+
+
+def dump_to_file(pg, db_name, run_path, timeout):
+    """pg_dump -Fc a <db_name>.dump (vía archivo .partial)"""
+    filename = f"{db_name}.dump"
+    target = os.path.join(run_path, filename)
+    partial = target + '.partial'
+    try:
+        subprocess.run(
+            pg_dump_command(pg, db_name, '-f', partial),
+            env=pg_env(pg), capture_output=True, text=True, check=True, timeout=timeout,
+        )
+        os.replace(partial, target)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(e.stderr.strip())
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return {'file': filename, 'size_bytes': os.path.getsize(target)}
+
+
+def dump_to_store(pg, db_name, run_path, timeout, store):
+    """pg_dump -Fc -Z0 por pipe al repositorio de chunks; deja <db_name>.idx en la corrida"""
+    filename = f"{db_name}{INDEX_SUFFIX}"
+    started = time.monotonic()
+    # stderr a un archivo: un pipe sin leer puede bloquear a pg_dump si escribe mucho
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            pg_dump_command(pg, db_name, '-Z0'), env=pg_env(pg), stdout=subprocess.PIPE, stderr=stderr,
+        )
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        try:
+            index = store.write_stream(process.stdout)
+        except Exception:
+            process.kill()
+            raise
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            if time.monotonic() - started >= timeout:
+                raise RuntimeError(f"pg_dump excedió {timeout}s")
+            stderr.seek(0)
+            raise RuntimeError(stderr.read().decode(errors='replace').strip() or f"pg_dump salió con código {returncode}")
+
+    # Los chunks de un volcado fallido quedan sin índice y los borra el gc
+    write_index(os.path.join(run_path, filename), index)
+    return {'file': filename, 'size_bytes': index['size_bytes'], 'stored_bytes': index['stored_bytes']}
+
+
+def dump_database(pg, db_name, run_path, timeout, store=None):
+    """Vuelca una BD (a archivo o al repositorio de chunks); retorna la entrada del manifest"""
+    started = time.monotonic()
+    try:
+        # Antes del volcado: el catálogo describe la BD tal como queda en el dump (salvo escrituras concurrentes)
+        tables = table_estimates(pg, db_name)
+        if store is None:
+            result = dump_to_file(pg, db_name, run_path, timeout)
+        else:
+            result = dump_to_store(pg, db_name, run_path, timeout, store)
+    except Exception as e:
+        return {'db_name': db_name, 'status': 'failed', 'error': str(e),
+                'duration_s': round(time.monotonic() - started, 2)}
+
+    return {
+        'db_name': db_name,
+        'status': 'dumped',
+        **result,
+        'duration_s': round(time.monotonic() - started, 2),
+        'dumped_at': datetime.now().strftime(RUN_FORMAT),
+        'tables': tables,
+    }
+
+
+def reuse_dump(previous, run_path):
+    """Enlaza el volcado (o índice) anterior en la corrida nueva (copia si no hay hardlinks)"""
+    target = os.path.join(run_path, previous['file'])
+    try:
+        os.link(previous['path'], target)
+    except OSError:
+        shutil.copy2(previous['path'], target)
+    return {
+        'db_name': previous['db_name'],
+        'status': 'unchanged',
+        'file': previous['file'],
+        'size_bytes': previous['size_bytes'],
+        'duration_s': 0,
+        'dumped_at': previous['dumped_at'],
+        'tables': previous.get('tables'),
+    }
+
+
+def needs_dump(previous, signature, full_every, now):
+    if previous is None or signature is None or previous.get('signature') != signature:
+        return True
+    dumped_at = datetime.strptime(previous['dumped_at'], RUN_FORMAT)
+    return now - dumped_at >= timedelta(days=full_every)
+
+
+def cleanup(backup_dir, retention_days, now):
+    """
+    Borra corridas más viejas que la retención (nunca la última completa),
+    incluidas las interrumpidas sin manifest, y los .sql del script anterior
+    """
+    limit = now - timedelta(days=retention_days)
+    removed = 0
+    runs = run_dirs(backup_dir)
+    keep = runs[-1] if runs else None
+    for name in os.listdir(backup_dir):
+        try:
+            run_date = datetime.strptime(name, RUN_FORMAT)
+        except ValueError:
+            continue
+        if name != keep and run_date < limit:
+            shutil.rmtree(os.path.join(backup_dir, name))
+            removed += 1
+    for name in os.listdir(backup_dir):
+        path = os.path.join(backup_dir, name)
+        if name.endswith('.sql') and datetime.fromtimestamp(os.path.getmtime(path)) < limit:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Backups paralelos e incrementales de las BDs')
+    parser.add_argument('--backup-dir', default=os.getenv('BACKUP_DIR', '/backups'))
+    parser.add_argument('--master-db', default=os.getenv('POSTGRES_DB', 'tenant_master'))
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BACKUP_CONCURRENCY', 4)),
+                        help='pg_dump simultáneos')
+    parser.add_argument('--retention-days', type=int, default=int(os.getenv('BACKUP_RETENTION_DAYS', 7)))
+    parser.add_argument('--full-every', type=int, default=int(os.getenv('BACKUP_FULL_EVERY_DAYS', 7)),
+                        help='Días máximos sin volcar de nuevo un tenant sin cambios')
+    parser.add_argument('--timeout', type=int, default=3600, help='Segundos máximos por pg_dump')
+    parser.add_argument('--tenant', action='append', default=[], help='Solo estos db_name (repetible)')
+    parser.add_argument('--force', action='store_true', help='Volcar todo aunque no haya cambios')
+    parser.add_argument('--store', choices=['chunks', 'files'], default=os.getenv('BACKUP_STORE', 'chunks'),
+                        help='chunks: repositorio deduplicado; files: un .dump comprimido por BD')
+    parser.add_argument('--gc-grace', type=int, default=3600,
+                        help='Segundos de gracia antes de borrar chunks no referenciados')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pg = pg_settings()
+    now = datetime.now()
+    run_id = now.strftime(RUN_FORMAT)
+    run_path = os.path.join(args.backup_dir, run_id)
+    os.makedirs(run_path, exist_ok=True)
+    started = time.monotonic()
+
+    store = ChunkStore(args.backup_dir) if args.store == 'chunks' else None
+    suffix = INDEX_SUFFIX if store else '.dump'
+
+    print(f"Iniciando backup {run_id} ({args.store})...")
+    previous = load_previous(args.backup_dir)
+    tenants = list_tenant_dbs(pg, args.master_db, only=set(args.tenant))
+    signatures = database_signatures(pg, args.master_db, [args.master_db] + tenants)
+
+    entries = []
+    to_dump = [args.master_db]
+    for db_name in tenants:
+        prev = previous.get(db_name)
+        # Cambió --store: el volcado anterior no sirve para esta corrida
+        if prev is not None and (not prev['file'].endswith(suffix) or not os.path.exists(prev['path'])):
+            prev = None
+        if args.force or needs_dump(prev, signatures.get(db_name), args.full_every, now):
+            to_dump.append(db_name)
+        else:
+            entry = reuse_dump(prev, run_path)
+            entry['signature'] = signatures[db_name]
+            entries.append(entry)
+    print(f"{len(tenants)} tenants: {len(to_dump) - 1} con cambios, {len(entries)} sin cambios")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [executor.submit(dump_database, pg, db_name, run_path, args.timeout, store) for db_name in to_dump]
+        for future in as_completed(futures):
+            entry = future.result()
+            # Firma tomada antes del volcado: si hubo escrituras durante, la próxima corrida vuelve a volcar
+            entry['signature'] = signatures.get(entry['db_name'])
+            entries.append(entry)
+            if entry['status'] == 'dumped':
+                stored = f", {entry['stored_bytes'] / 1024 / 1024:.1f} MB nuevos" if 'stored_bytes' in entry else ''
+                print(f"✓ {entry['db_name']} ({entry['size_bytes'] / 1024 / 1024:.1f} MB{stored}, "
+                      f"{entry['duration_s']:.1f}s)")
+            else:
+                print(f"✗ {entry['db_name']}: {entry['error']}")
+
+    failed = [entry for entry in entries if entry['status'] == 'failed']
+    dumped = [entry for entry in entries if entry['status'] == 'dumped']
+    manifest = {
+        'run_id': run_id,
+        'host': socket.gethostname(),
+        'postgres_host': pg['host'],
+        'master_db': args.master_db,
+        'store': args.store,
+        'started_at': now.isoformat(),
+        'finished_at': datetime.now().isoformat(),
+        'duration_s': round(time.monotonic() - started, 2),
+        'dumped': len(dumped),
+        'unchanged': sum(1 for entry in entries if entry['status'] == 'unchanged'),
+        'failed': len(failed),
+        'size_bytes': sum(entry['size_bytes'] for entry in dumped),
+        # Bytes que esta corrida agregó al disco (en chunks: solo los chunks nuevos)
+        'stored_bytes': sum(entry.get('stored_bytes', entry['size_bytes']) for entry in dumped),
+        'databases': sorted(entries, key=lambda entry: entry['db_name']),
+    }
+    # El manifest se escribe al final: una corrida sin manifest no cuenta como completa
+    with open(os.path.join(run_path, MANIFEST + '.partial'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(run_path, MANIFEST + '.partial'), os.path.join(run_path, MANIFEST))
+
+    removed = cleanup(args.backup_dir, args.retention_days, now)
+    print(f"✓ Backups viejos eliminados: {removed} (>{args.retention_days} días)")
+    # También en modo files: limpia los chunks que quedaron al cambiar de modo
+    chunk_store = store or ChunkStore(args.backup_dir)
+    if os.path.isdir(chunk_store.chunks_path):
+        chunks, freed = chunk_store.gc(referenced_chunks(args.backup_dir), args.gc_grace)
+        print(f"✓ Chunks no referenciados eliminados: {chunks} ({freed / 1024 / 1024:.1f} MB)")
+    print(f"Backup completado en {manifest['duration_s']:.1f}s: {manifest['dumped']} volcadas, "
+          f"{manifest['unchanged']} sin cambios, {manifest['failed']} fallidas")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
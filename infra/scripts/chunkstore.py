@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Repositorio de chunks deduplicados para los volcados de tenants
+
+Los volcados (pg_dump -Fc -Z0, sin comprimir para que el contenido igual
+produzca bytes iguales) se cortan en chunks definidos por contenido: hay
+corte en un fin de línea cuando el hash de los WINDOW bytes que lo preceden
+cumple hash & MASK == 0, con tamaños entre MIN_SIZE y MAX_SIZE. Es el mismo
+criterio de un rolling hash, evaluado solo en los '\\n' (las filas de COPY
+terminan en uno) para que el corte corra a velocidad de C y no byte a byte
+en Python. Como el corte depende solo del contenido local, insertar o borrar
+filas mueve los cortes vecinos y el resto de los chunks se repite.
+
+Cada chunk se guarda una vez, comprimido con zlib, en
+<repo>/chunks/<sha256[:2]>/<sha256>. Un volcado es un índice (.idx, JSON)
+con la lista ordenada de chunks. Los índices viven en los directorios de
+corrida de backup.py; gc() borra los chunks que ya no referencia ningún
+índice (después de que la retención borró corridas viejas).
+
+Uso:
+    python chunkstore.py cat <archivo.idx> > volcado.dump     (restore en streaming)
+    python chunkstore.py gc <backup_dir>
+    python chunkstore.py stats <backup_dir>
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+MIN_SIZE = 16 * 1024
+MAX_SIZE = 1024 * 1024
+# Un corte cada ~256 fines de línea: chunks de decenas de KB para filas típicas
+MASK = 0xFF
+WINDOW = 64
+READ_SIZE = 4 * 1024 * 1024
+COMPRESSION_LEVEL = 3
+CHUNKS_DIR = 'chunks'
+INDEX_SUFFIX = '.idx'
+
+
+class ChunkCorrupted(Exception):
+    """El contenido de un chunk no coincide con su hash"""
+
+
+def find_cut(buf, start, end):
+    """Primer corte definido por contenido en buf[start:end], o None"""
+    pos = start + MIN_SIZE
+    limit = min(start + MAX_SIZE, end)
+    while pos < limit:
+        newline = buf.find(b'\n', pos, limit)
+        if newline < 0:
+            break
+        if zlib.crc32(buf[newline - WINDOW + 1:newline + 1]) & MASK == 0:
+            return newline + 1
+        pos = newline + 1
+    if end - start >= MAX_SIZE:
+        return start + MAX_SIZE
+    return None
+
+
+def iter_chunks(stream):
+    """Corta un stream binario en chunks definidos por contenido"""
+    buf = b''
+    while True:
+        data = stream.read(READ_SIZE)
+        buf += data
+        start = 0
+        while True:
+            cut = find_cut(buf, start, len(buf))
+            if cut is None:
+                break
+            yield buf[start:cut]
+            start = cut
+        buf = buf[start:]
+        if not data:
+            if buf:
+                yield buf
+            return
+
+
+class ChunkStore:
+    def __init__(self, root):
+        self.root = root
+        self.chunks_path = os.path.join(root, CHUNKS_DIR)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunks_path, digest[:2], digest)
+
+    def put(self, data):
+        """Guarda un chunk si no existe; retorna (hash, bytes escritos en disco)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            # Marca de uso: gc no borra chunks tocados dentro del periodo de gracia
+            os.utime(path)
+            return digest, 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        return digest, len(compressed)
+
+    def get(self, digest):
+        with open(self.chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ChunkCorrupted(f'Chunk {digest} corrupto')
+        return data
+
+    def write_stream(self, stream):
+        """Guarda un stream; retorna el índice (dict) con los chunks y cuánto se escribió"""
+        chunks = []
+        size = 0
+        stored = 0
+        for data in iter_chunks(stream):
+            digest, written = self.put(data)
+            chunks.append([digest, len(data)])
+            size += len(data)
+            stored += written
+        return {'size_bytes': size, 'stored_bytes': stored, 'chunks': chunks}
+
+    def read_stream(self, index):
+        """Genera los bytes del volcado chunk por chunk (sin armarlo en memoria)"""
+        for digest, _ in index['chunks']:
+            yield self.get(digest)
+
+    def gc(self, referenced, grace_seconds=3600):
+        """Borra chunks no referenciados; los tocados hace menos de grace_seconds se conservan"""
+        limit = time.time() - grace_seconds
+        removed = 0
+        freed = 0
+        if not os.path.isdir(self.chunks_path):
+            return removed, freed
+        for prefix in os.listdir(self.chunks_path):
+            directory = os.path.join(self.chunks_path, prefix)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name in referenced:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > limit:
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+
+# ============================================
+# ÍNDICES
+# ============================================
+
+def write_index(path, index):
+    tmp = path + '.partial'
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+def read_index(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def referenced_chunks(backup_dir):
+    """Hashes referenciados por los índices de todas las corridas en backup_dir"""
+    referenced = set()
+    for run in os.listdir(backup_dir):
+        run_path = os.path.join(backup_dir, run)
+        if run == CHUNKS_DIR or not os.path.isdir(run_path):
+            continue
+        for name in os.listdir(run_path):
+            if name.endswith(INDEX_SUFFIX):
+                referenced.update(digest for digest, _ in read_index(os.path.join(run_path, name))['chunks'])
+    return referenced
+
+
+def store_for_index(index_path):
+    """El repositorio de un índice es el directorio padre de su corrida"""
+    return ChunkStore(os.path.dirname(os.path.dirname(os.path.abspath(index_path))))
+
+
+# ============================================
+# CLI
+# ============================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Repositorio de chunks de los backups')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cat = sub.add_parser('cat', help='Escribe el volcado de un índice en stdout')
+    cat.add_argument('index')
+    gc = sub.add_parser('gc', help='Borra chunks que ningún índice referencia')
+    gc.add_argument('backup_dir')
+    gc.add_argument('--grace', type=int, default=3600, help='Segundos de gracia para chunks recientes')
+    stats = sub.add_parser('stats', help='Tamaño lógico vs. almacenado')
+    stats.add_argument('backup_dir')
+    args = parser.parse_args()
+
+    if args.command == 'cat':
+        index = read_index(args.index)
+        store = store_for_index(args.index)
+        out = sys.stdout.buffer
+        for data in store.read_stream(index):
+            out.write(data)
+        out.flush()
+
+    elif args.command == 'gc':
+        store = ChunkStore(args.backup_dir)
+        removed, freed = store.gc(referenced_chunks(args.backup_dir), args.grace)
+        print(f"✓ {removed} chunks eliminados ({freed / 1024 / 1024:.1f} MB)")
+
+    elif args.command == 'stats':
+        logical = 0
+        for run in sorted(os.listdir(args.backup_dir)):
+            run_path = os.path.join(args.backup_dir, run)
+            if run == CHUNKS_DIR or not os.path.isdir(run_path):
+                continue
+            for name in os.listdir(run_path):
+                if name.endswith(INDEX_SUFFIX):
+                    logical += read_index(os.path.join(run_path, name))['size_bytes']
+        stored = 0
+        count = 0
+        store = ChunkStore(args.backup_dir)
+        if os.path.isdir(store.chunks_path):
+            for prefix in os.listdir(store.chunks_path):
+                for name in os.listdir(os.path.join(store.chunks_path, prefix)):
+                    stored += os.path.getsize(os.path.join(store.chunks_path, prefix, name))
+                    count += 1
+        ratio = logical / stored if stored else 0
+        print(f"Lógico: {logical / 1024 / 1024:.1f} MB, almacenado: {stored / 1024 / 1024:.1f} MB "
+              f"en {count} chunks (x{ratio:.1f})")
+
+
+if __name__ == '__main__':
+    main()
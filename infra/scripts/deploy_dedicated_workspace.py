@@ -1,21 +1,49 @@
 #!/usr/bin/env python3
 """
 Script para deployment automático de workspaces dedicados
-- Copia código base
-- Inicializa Git
+- Sincroniza el código base (incremental, ver source_sync.py)
+- Inicializa Git (sobre el almacén de objetos compartido del producto, ver object_store.py)
 - Crea repo privado en GitHub
 - Push automático
 - Genera docker-compose.yml
+
+Con --step <nombre> ejecuta solo una etapa (copy, git, repo, push), para que
+el panel pueda correrlas como pasos independientes del aprovisionamiento.
 """
 
 import os
 import sys
 import subprocess
-import shutil
 import json
+import argparse
 import requests
 from pathlib import Path
 
+from object_store import ObjectStoreError, ProductObjectStore
+from source_sync import IGNORE_PATTERNS, sync_tree
+
+GITIGNORE = """
+__pycache__/
+*.pyc
+*.pyo
+*.pyd
+.Python
+*.so
+*.egg
+*.egg-info/
+dist/
+build/
+.env
+.venv
+venv/
+ENV/
+db.sqlite3
+*.log
+.DS_Store
+node_modules/
+.source-sync.json
+"""
+
 
 class WorkspaceDeployer:
     def __init__(self, product_name, subdomain, db_name, db_user, db_password):
@@ -33,6 +61,9 @@ class WorkspaceDeployer:
         self.github_token = os.getenv('GITHUB_TOKEN')
         self.github_username = os.getenv('GITHUB_USERNAME', 'kritaar')
         self.repo_name = f"{product_name}-{subdomain}"
+        self.repo_created = False
+        self.repo_error = None
+        self.sync_mode = os.getenv('SOURCE_SYNC_MODE', 'auto')
         
     def log(self, message):
         """Print con formato"""
@@ -56,26 +87,34 @@ class WorkspaceDeployer:
             raise
     
     def copy_source_code(self):
-        """Copia código base a carpeta del cliente"""
-        self.log(f"Copiando código de {self.source_path} a {self.dest_path}")
+        """Sincroniza el código base en la carpeta del cliente (solo reescribe lo que cambió)"""
+        self.log(f"Sincronizando código de {self.source_path} a {self.dest_path}")
         
         if not os.path.exists(self.source_path):
             raise Exception(f"No existe el código fuente en {self.source_path}")
         
-        # Crear carpeta destino
-        os.makedirs(os.path.dirname(self.dest_path), exist_ok=True)
-        
-        # Copiar todo excepto .git
-        if os.path.exists(self.dest_path):
-            shutil.rmtree(self.dest_path)
+        # Reflink (o hardlink con SOURCE_SYNC_MODE=hardlink) para lo nuevo; lo que no cambió no se toca
+        summary = sync_tree(self.source_path, self.dest_path, mode=self.sync_mode)
         
-        shutil.copytree(
-            self.source_path,
-            self.dest_path,
-            ignore=shutil.ignore_patterns('.git', '__pycache__', '*.pyc', 'venv', 'node_modules')
+        self.log(
+            f"Código sincronizado en {summary['seconds']:.1f}s: {summary['written']} escritos "
+            f"({summary['bytes_written'] / 1024 / 1024:.1f} MB; reflink {summary['reflink']}, "
+            f"hardlink {summary['hardlink']}, copia {summary['copy']}), {summary['unchanged']} sin cambios, "
+            f"{summary['removed']} eliminados"
         )
-        
-        self.log(f"Código copiado exitosamente")
+        return summary
+    
+    def write_file(self, path, content):
+        """Escribe vía temporal + rename: nunca modifica in situ un archivo enlazado al código base"""
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    
+    def store_excludes(self):
+        """Lo que el tenant no versiona tampoco entra al commit base que hereda"""
+        patterns = [line for line in GITIGNORE.splitlines() if line.strip()]
+        return patterns + [pattern for pattern in IGNORE_PATTERNS if pattern not in patterns]
     
     def initialize_git(self):
         """Inicializa repositorio Git"""
@@ -93,32 +132,38 @@ class WorkspaceDeployer:
         self.run_command("git config user.email 'deploy@surgir.online'", cwd=self.dest_path)
         
         # Crear .gitignore
-        gitignore_content = """
-__pycache__/
-*.pyc
-*.pyo
-*.pyd
-.Python
-*.so
-*.egg
-*.egg-info/
-dist/
-build/
-.env
-.venv
-venv/
-ENV/
-db.sqlite3
-*.log
-.DS_Store
-node_modules/
-"""
         gitignore_path = os.path.join(self.dest_path, '.gitignore')
-        with open(gitignore_path, 'w') as f:
-            f.write(gitignore_content)
+        self.write_file(gitignore_path, GITIGNORE)
+        
+        # Redeploy: la carpeta (y su .git) se conserva entre deployments
+        has_history = subprocess.run(
+            ["git", "rev-parse", "--verify", "-q", "HEAD"], cwd=self.dest_path, capture_output=True
+        ).returncode == 0
+        new_repo = not has_history
+        
+        # Objetos del código base compartidos por todos los tenants del producto
+        try:
+            store = ProductObjectStore(os.path.dirname(self.dest_path), self.store_excludes())
+            base = store.update_base(self.source_path)
+            store.attach(self.dest_path)
+            if new_repo:
+                store.start_from_base(self.dest_path, base)
+                has_history = True
+            self.log(f"Almacén de objetos compartido: base {base[:10]}")
+        except ObjectStoreError as e:
+            self.log(f"⚠️ Sin almacén de objetos compartido, el repo guarda todos sus objetos: {e}")
         
         self.run_command("git add .", cwd=self.dest_path)
         
+        if has_history:
+            if not self.run_command("git status --porcelain", cwd=self.dest_path).strip():
+                self.log("Sin cambios desde el último deployment")
+                return
+            message = "Initial commit - Deployment automático" if new_repo else "Actualización desde el código base"
+            self.run_command(f'git commit -m "{message}"', cwd=self.dest_path)
+            self.log("Git commit exitoso")
+            return
+        
         # Intentar commit
         try:
             self.run_command('git commit -m "Initial commit - Deployment automático"', cwd=self.dest_path)
@@ -160,6 +205,7 @@ node_modules/
             if response.status_code == 201:
                 repo_data = response.json()
                 repo_url = repo_data['clone_url']
+                self.repo_created = True
                 self.log(f"✅ Repo creado: {repo_url}")
                 return repo_url
             elif response.status_code == 422:
@@ -170,16 +216,18 @@ node_modules/
             else:
                 self.log(f"❌ Error creando repo: {response.status_code}")
                 self.log(response.json())
+                self.repo_error = f"GitHub respondió {response.status_code}"
                 return None
         except Exception as e:
             self.log(f"Error conectando a GitHub: {e}")
+            self.repo_error = str(e)
             return None
     
     def push_to_github(self, repo_url):
         """Push código a GitHub"""
         if not repo_url:
             self.log("No hay repo URL, saltando push")
-            return
+            return False
         
         self.log(f"Haciendo push a {repo_url}")
         
@@ -195,8 +243,10 @@ node_modules/
             self.run_command("git branch -M main", cwd=self.dest_path)
             self.run_command("git push -u origin main --force", cwd=self.dest_path)
             self.log("✅ Push exitoso")
+            return True
         except Exception as e:
             self.log(f"⚠️ Error en push: {e}")
+            return False
     
     def generate_docker_compose(self):
         """Genera docker-compose.yml personalizado"""
@@ -232,8 +282,7 @@ networks:
 """
         
         compose_path = os.path.join(self.dest_path, 'docker-compose.yml')
-        with open(compose_path, 'w') as f:
-            f.write(compose_content)
+        self.write_file(compose_path, compose_content)
         
         self.log("docker-compose.yml generado")
     
@@ -275,19 +324,59 @@ networks:
             }
 
 
+    def run_step(self, step, repo_url=None):
+        """Ejecuta una sola etapa del deployment"""
+        try:
+            if step == 'copy':
+                self.copy_source_code()
+                self.generate_docker_compose()
+                return {
+                    'success': True,
+                    'path': self.dest_path,
+                    'compose_path': os.path.join(self.dest_path, 'docker-compose.yml')
+                }
+
+            if step == 'git':
+                self.initialize_git()
+                return {'success': True, 'path': self.dest_path}
+
+            if step == 'repo':
+                repo_url = self.create_github_repo()
+                if repo_url is None and self.repo_error:
+                    return {'success': False, 'error': self.repo_error}
+                return {'success': True, 'repo_url': repo_url or '', 'created': self.repo_created}
+
+            if step == 'push':
+                if not self.push_to_github(repo_url):
+                    return {'success': False, 'error': f'No se pudo hacer push a {repo_url}'}
+                return {'success': True, 'repo_url': repo_url}
+
+            return {'success': False, 'error': f'Etapa desconocida: {step}'}
+
+        except Exception as e:
+            self.log(f"❌ ERROR EN ETAPA {step}: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+
 def main():
-    if len(sys.argv) < 6:
-        print("Uso: deploy_dedicated_workspace.py <product_name> <subdomain> <db_name> <db_user> <db_password>")
-        sys.exit(1)
-    
-    product_name = sys.argv[1]
-    subdomain = sys.argv[2]
-    db_name = sys.argv[3]
-    db_user = sys.argv[4]
-    db_password = sys.argv[5]
+    parser = argparse.ArgumentParser(description='Deployment de workspaces dedicados')
+    parser.add_argument('product_name')
+    parser.add_argument('subdomain')
+    parser.add_argument('db_name')
+    parser.add_argument('db_user')
+    parser.add_argument('db_password')
+    parser.add_argument('--step', choices=['copy', 'git', 'repo', 'push'], help='Ejecutar solo esta etapa')
+    parser.add_argument('--repo-url', default='', help='URL del repo para la etapa push')
+    args = parser.parse_args()
     
-    deployer = WorkspaceDeployer(product_name, subdomain, db_name, db_user, db_password)
-    result = deployer.deploy()
+    deployer = WorkspaceDeployer(args.product_name, args.subdomain, args.db_name, args.db_user, args.db_password)
+    if args.step:
+        result = deployer.run_step(args.step, repo_url=args.repo_url)
+    else:
+        result = deployer.deploy()
     
     # Output JSON para que Django lo pueda leer
     print("\n=== RESULT ===")
@@ -1,52 +1,278 @@
 #!/usr/bin/env python3
+"""
+Migra las BDs de todos los tenants en paralelo
+
+- Antes de migrar, lee django_migrations de cada tenant (en paralelo) y omite
+  los que ya tienen aplicadas todas las migraciones del código.
+- Los pendientes se reparten en un pool de procesos: cada worker arranca
+  Django y carga el grafo de migraciones una sola vez (TenantMigrator) y
+  migra cada tenant en el mismo proceso, con un alias de BD registrado al
+  vuelo (panel.tenant_connections). El plan se calcula una vez por versión
+  de migraciones aplicadas y se reusa entre tenants.
+- El fallo de un tenant no detiene al resto; cada resultado (con su tiempo)
+  se agrega a un archivo de estado NDJSON. Con --resume se omiten los
+  tenants que ya quedaron migrados en la corrida anterior.
+
+Uso:
+    python migrate_all.py [--concurrency 8] [--tenant tenant_acme] [--dry-run] [--resume]
+"""
+import argparse
+import hashlib
+import json
 import os
 import sys
-import django
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+from types import SimpleNamespace
 
+BACKEND_DIR = os.environ.get('PANEL_BACKEND_DIR', str(Path(__file__).resolve().parents[2] / 'app' / 'backend'))
+sys.path.insert(0, BACKEND_DIR)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-django.setup()
 
-from panel.models import Tenant
-import subprocess
+TENANT_FIELDS = ['id', 'subdomain', 'db_name', 'db_user', 'db_password', 'db_host', 'db_port']
+DONE_STATUSES = ('migrated', 'up_to_date')
 
-def migrate_tenant(tenant):
-    print(f"Migrating tenant: {tenant.name} ({tenant.db_name})")
-    
-    env = os.environ.copy()
-    env['DATABASE_NAME'] = tenant.db_name
-    
-    result = subprocess.run(
-        ['python', 'manage.py', 'migrate', '--database', tenant.db_name],
-        env=env,
-        capture_output=True,
-        text=True
+
+def setup_django():
+    import django
+    django.setup()
+
+
+# ============================================
+# ESTADO DE CADA TENANT
+# ============================================
+
+def expected_migrations():
+    """Migraciones del código que corresponden a las BDs de tenants"""
+    from django.db.migrations.loader import MigrationLoader
+    from panel.tenant_migrations import tenant_nodes
+
+    # Mismo filtro del router que usa TenantMigrator para elegir sus targets
+    return tenant_nodes(MigrationLoader(None, ignore_no_migrations=True).graph)
+
+
+def applied_migrations(tenant):
+    """(app, name) registrados en django_migrations del tenant"""
+    from panel.db_pool import db_pool
+    from panel.tenant_connections import tenant_connections
+
+    # Mismo host/puerto/rol que el alias con el que migrate_tenant lo migra
+    db = tenant_connections.settings_for(SimpleNamespace(**tenant))
+    with db_pool.connection(db['NAME'], host=db['HOST'], port=db['PORT'], user=db['USER'],
+                            password=db['PASSWORD'], timeout=10) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('public.django_migrations')")
+            if cursor.fetchone()[0] is None:
+                return set()
+            cursor.execute("SELECT app, name FROM django_migrations")
+            return set(cursor.fetchall())
+
+
+def find_pending(tenants, expected):
+    """{db_name: migraciones pendientes o error} consultando los tenants en paralelo"""
+    from panel.collectors import fan_out
+
+    return fan_out(
+        tenants,
+        lambda tenant: len(expected - applied_migrations(tenant)),
+        key=lambda tenant: tenant['db_name'],
+        deadline=max(60, len(tenants)),
     )
-    
-    if result.returncode == 0:
-        print(f"✓ {tenant.name} migrated successfully")
-        return True
-    else:
-        print(f"✗ {tenant.name} migration failed: {result.stderr}")
-        return False
+
+
+def plan_fingerprint(expected):
+    """Identifica la versión del código: un --resume solo vale para la misma"""
+    return hashlib.sha256(json.dumps(sorted(expected)).encode()).hexdigest()[:16]
+
+
+def load_state(path, fingerprint):
+    """db_name -> último resultado de una corrida anterior con el mismo código"""
+    state = {}
+    if not os.path.exists(path):
+        return state
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if entry.get('fingerprint') == fingerprint:
+                state[entry['db_name']] = entry
+    return state
+
+
+# ============================================
+# WORKERS
+# ============================================
+
+LOCK_TIMEOUT = 30
+MIGRATOR = None
+
+
+def init_worker(lock_timeout):
+    """Una vez por proceso: Django y el grafo de migraciones"""
+    global LOCK_TIMEOUT, MIGRATOR
+    setup_django()
+    from panel.tenant_migrations import TenantMigrator
+
+    LOCK_TIMEOUT = lock_timeout
+    MIGRATOR = TenantMigrator()
+
+
+def migrate_tenant(tenant):
+    """Migra un tenant en este proceso; nunca lanza excepción"""
+    from django.db import connections
+    from panel.tenant_connections import tenant_connections
+
+    started = time.monotonic()
+    alias = None
+    try:
+        alias = tenant_connections.alias_for(SimpleNamespace(**tenant))
+        # Un tenant con tablas bloqueadas falla rápido en vez de colgar al worker
+        if 'postgresql' in connections.settings[alias]['ENGINE']:
+            options = connections.settings[alias].setdefault('OPTIONS', {})
+            options['options'] = f"{options.get('options', '')} -c lock_timeout={LOCK_TIMEOUT * 1000}".strip()
+
+        hits = MIGRATOR.plan_hits
+        applied = MIGRATOR.migrate(connections[alias])
+        return {
+            'db_name': tenant['db_name'],
+            'status': 'migrated',
+            'applied': len(applied),
+            'plan_reused': MIGRATOR.plan_hits > hits,
+            'seconds': round(time.monotonic() - started, 2),
+        }
+    except Exception as e:
+        return {
+            'db_name': tenant['db_name'],
+            'status': 'failed',
+            'error': str(e),
+            'seconds': round(time.monotonic() - started, 2),
+        }
+    finally:
+        if alias:
+            tenant_connections.discard(alias)
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Migra las BDs de los tenants en paralelo')
+    parser.add_argument('--concurrency', type=int, default=min(8, os.cpu_count() or 4),
+                        help='Procesos que migran a la vez')
+    parser.add_argument('--tenant', action='append', default=[],
+                        help='db_name o subdominio a migrar (repetible); por defecto todos los activos')
+    parser.add_argument('--all-statuses', action='store_true', help='Incluir tenants suspendidos/inactivos')
+    parser.add_argument('--dry-run', action='store_true', help='Solo mostrar qué tenants tienen migraciones pendientes')
+    parser.add_argument('--state', default='migrate_all.state.ndjson', help='Archivo de estado para --resume')
+    parser.add_argument('--resume', action='store_true', help='Omitir tenants migrados en la corrida anterior')
+    parser.add_argument('--lock-timeout', type=int, default=30, help='Segundos de espera por locks por sentencia')
+    return parser.parse_args()
+
+
+def load_tenants(args):
+    from django.db.models import Q
+    from panel.models import Tenant
+
+    tenants = Tenant.objects.all()
+    if not args.all_statuses:
+        tenants = tenants.filter(status='active')
+    if args.tenant:
+        tenants = tenants.filter(Q(db_name__in=args.tenant) | Q(subdomain__in=args.tenant))
+    return list(tenants.order_by('id').values(*TENANT_FIELDS))
+
 
 def main():
-    tenants = Tenant.objects.filter(status='active')
-    total = tenants.count()
-    success = 0
-    failed = 0
-    
-    print(f"Starting migration for {total} tenants...")
-    
-    for tenant in tenants:
-        if migrate_tenant(tenant):
-            success += 1
+    args = parse_args()
+    setup_django()
+    from django.db import connections
+
+    started = time.monotonic()
+    tenants = load_tenants(args)
+    expected = expected_migrations()
+    fingerprint = plan_fingerprint(expected)
+    print(f"{len(tenants)} tenants, {len(expected)} migraciones en el código (versión {fingerprint})")
+
+    if args.resume:
+        state = load_state(args.state, fingerprint)
+        done = {name for name, entry in state.items() if entry['status'] in DONE_STATUSES}
+        tenants = [tenant for tenant in tenants if tenant['db_name'] not in done]
+        print(f"Reanudando: {len(done)} tenants ya completados se omiten")
+    elif os.path.exists(args.state) and not args.dry_run:
+        os.remove(args.state)
+
+    results = []
+
+    def record(result):
+        results.append(result)
+        if args.dry_run:
+            return
+        result['fingerprint'] = fingerprint
+        with open(args.state, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+    pending = []
+    for db_name, check in find_pending(tenants, expected).items():
+        if check['degraded']:
+            record({'db_name': db_name, 'status': 'failed', 'error': check['error'], 'seconds': 0})
+            print(f"✗ {db_name}: no se pudo leer django_migrations: {check['error']}")
+        elif check['value'] == 0:
+            record({'db_name': db_name, 'status': 'up_to_date', 'seconds': 0})
         else:
-            failed += 1
-    
-    print(f"\nMigration completed:")
-    print(f"  Success: {success}")
-    print(f"  Failed: {failed}")
-    print(f"  Total: {total}")
+            pending.append((check['value'], db_name))
+
+    by_name = {tenant['db_name']: tenant for tenant in tenants}
+    # Los que más migraciones deben primero: acortan la cola final
+    pending = [by_name[db_name] for _, db_name in sorted(pending, reverse=True)]
+    up_to_date = sum(1 for result in results if result['status'] == 'up_to_date')
+    print(f"{up_to_date} al día, {len(pending)} con migraciones pendientes")
+
+    if args.dry_run:
+        for tenant in pending:
+            print(f"  · {tenant['db_name']}")
+        return
+
+    if pending:
+        # spawn: cada worker arranca Django limpio, sin conexiones heredadas del padre
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(args.concurrency, len(pending)),
+            mp_context=get_context('spawn'),
+            initializer=init_worker,
+            initargs=(args.lock_timeout,),
+        ) as executor:
+            futures = {executor.submit(migrate_tenant, tenant): tenant['db_name'] for tenant in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    result = {'db_name': futures[future], 'status': 'failed',
+                              'error': f'Worker interrumpido: {e}', 'seconds': 0}
+                record(result)
+                if result['status'] == 'migrated':
+                    reused = ', plan reusado' if result['plan_reused'] else ''
+                    print(f"✓ {result['db_name']}: {result['applied']} migraciones en {result['seconds']:.2f}s{reused}")
+                else:
+                    print(f"✗ {result['db_name']}: {result['error']} ({result['seconds']:.1f}s)")
+
+    migrated = [result for result in results if result['status'] == 'migrated']
+    failed = [result for result in results if result['status'] == 'failed']
+    print(f"\nMigración completada en {time.monotonic() - started:.1f}s:")
+    print(f"  Migrados: {len(migrated)}")
+    print(f"  Al día: {up_to_date}")
+    print(f"  Fallidos: {len(failed)}")
+    if migrated:
+        slowest = max(migrated, key=lambda result: result['seconds'])
+        print(f"  Más lento: {slowest['db_name']} ({slowest['seconds']:.1f}s)")
+    if failed:
+        print(f"  Reintentar los fallidos con: --resume (estado en {args.state})")
+        sys.exit(1)
+
 
 if __name__ == '__main__':
     main()
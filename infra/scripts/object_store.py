@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Almacén de objetos git compartido por producto para los repos de tenants
+
+Cada workspace dedicado tenía su propio `git add .` del árbol completo del
+producto: N copias de los mismos blobs en disco y un historial distinto por
+tenant. Aquí cada producto tiene un repo bare
+<clientes>/.objects.git con un commit "base" del código base (rama
+refs/heads/base, un commit nuevo por versión del código):
+
+- El repo del tenant apunta a ese almacén con objects/info/alternates: git
+  encuentra ahí los objetos y no los vuelve a escribir, así que el repo del
+  tenant solo guarda lo propio (docker-compose.yml, .gitignore, cambios).
+- Un tenant nuevo arranca con su rama apuntando al commit base (sin copiar
+  nada) y hace un solo commit con su delta. Los pushes siguientes del mismo
+  repo solo envían los commits nuevos.
+- El almacén usa su propio índice, así que actualizar la base solo vuelve a
+  leer los archivos del código base que cambiaron. Sus exclusiones son las
+  mismas que las del .gitignore de los tenants: nada que el tenant ignore
+  queda versionado por heredarlo de la base.
+
+Los repos de tenants dependen de los objetos del almacén: nunca se poda
+(gc.auto=0, gc.pruneExpire=never) y solo se compacta con `git repack -d`,
+que no borra objetos. Borrar el almacén rompe los repos de los tenants.
+"""
+import fcntl
+import os
+import subprocess
+from contextlib import contextmanager
+
+STORE_DIR = '.objects.git'
+BASE_REF = 'refs/heads/base'
+
+
+class ObjectStoreError(Exception):
+    """Falló una operación git sobre el almacén compartido"""
+
+
+def git(*args, cwd=None, env=None):
+    result = subprocess.run(['git', *args], cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ObjectStoreError(f"git {' '.join(args)}: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+class ProductObjectStore:
+    def __init__(self, clients_path, exclude_patterns):
+        self.path = os.path.join(clients_path, STORE_DIR)
+        self.objects_path = os.path.join(self.path, 'objects')
+        self.exclude_patterns = exclude_patterns
+
+    @contextmanager
+    def locked(self):
+        """Serializa los deployments concurrentes del mismo producto (un solo índice)"""
+        with open(os.path.join(self.path, 'deploy.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def ensure(self):
+        if not os.path.isdir(self.objects_path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            git('init', '--bare', '-q', self.path)
+            git('config', 'gc.auto', '0', cwd=self.path)
+            git('config', 'gc.pruneExpire', 'never', cwd=self.path)
+        os.makedirs(os.path.join(self.path, 'info'), exist_ok=True)
+        with open(os.path.join(self.path, 'info', 'exclude'), 'w') as f:
+            f.write('\n'.join(self.exclude_patterns) + '\n')
+
+    def update_base(self, source_path):
+        """Commit base del código actual (nuevo solo si el árbol cambió); retorna su sha"""
+        self.ensure()
+        with self.locked():
+            env = dict(os.environ, GIT_DIR=self.path, GIT_WORK_TREE=source_path,
+                       GIT_INDEX_FILE=os.path.join(self.path, 'index'))
+            git('add', '-A', '.', cwd=source_path, env=env)
+            tree = git('write-tree', env=env)
+            try:
+                parent = git('rev-parse', '-q', '--verify', BASE_REF, env=env)
+            except ObjectStoreError:
+                parent = None
+            if parent and git('rev-parse', f'{parent}^{{tree}}', env=env) == tree:
+                return parent
+
+            commit_env = dict(env, GIT_AUTHOR_NAME='Tenant Master', GIT_AUTHOR_EMAIL='deploy@surgir.online',
+                              GIT_COMMITTER_NAME='Tenant Master', GIT_COMMITTER_EMAIL='deploy@surgir.online')
+            args = ['commit-tree', tree, '-m', 'Código base']
+            if parent:
+                args += ['-p', parent]
+            commit = git(*args, env=commit_env)
+            git('update-ref', BASE_REF, commit, env=env)
+            # Los objetos sueltos del commit nuevo pasan a un pack; -d sin -a no borra nada alcanzable ni suelto
+            git('repack', '-d', '-q', env=env)
+            return commit
+
+    def attach(self, repo_path):
+        """Hace que el repo del tenant lea objetos del almacén (también repos creados antes)"""
+        alternates = os.path.join(repo_path, '.git', 'objects', 'info', 'alternates')
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        lines = []
+        if os.path.exists(alternates):
+            with open(alternates) as f:
+                lines = [line.strip() for line in f if line.strip()]
+        if self.objects_path not in lines:
+            with open(alternates, 'w') as f:
+                f.write('\n'.join(lines + [self.objects_path]) + '\n')
+
+    def start_from_base(self, repo_path, base, branch='main'):
+        """Repo sin commits: su rama apunta al commit base y el índice a su árbol"""
+        git('update-ref', f'refs/heads/{branch}', base, cwd=repo_path)
+        git('symbolic-ref', 'HEAD', f'refs/heads/{branch}', cwd=repo_path)
+        git('read-tree', 'HEAD', cwd=repo_path)
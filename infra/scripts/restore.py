@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Restore paralelo de los backups de backup.py y verificación automática
+
+restore: restaura BDs de una corrida (por defecto la última completa) en BDs
+nuevas <db><--suffix>, varias a la vez (--concurrency) y cada una con
+pg_restore -j (--jobs). Con --template la BD se crea con
+CREATE DATABASE ... TEMPLATE (p. ej. la plantilla migrada del producto, ver
+panel/template_dbs.py) y solo se cargan los datos del volcado; el esquema
+de la plantilla tiene que coincidir con el del volcado. Después del restore
+se corre ANALYZE: sin estadísticas la BD no está realmente recuperada.
+
+verify: restaura una muestra de la corrida (la master y --sample tenants al
+azar) en BDs temporales restore_verify_*, cuenta las filas reales de cada
+tabla y las compara con las filas estimadas por el catálogo
+(pg_class.reltuples, como TenantStats) que backup.py guardó en el manifest.
+Las BDs temporales se borran al terminar; el resultado queda en
+<corrida>/verify.json.
+
+Los volcados del repositorio de chunks (.idx) se reconstruyen en --work-dir
+porque pg_restore -j necesita un archivo; con --jobs 1 se pasan por stdin sin
+escribirlos a disco. Ambos comandos informan el throughput (MB/s) y, con él,
+el tiempo estimado de recuperar todas las BDs de la corrida.
+
+Uso:
+    python restore.py restore --tenant tenant_acme [--suffix _restored] [--jobs 4] [--owner user_acme]
+    python restore.py restore --all --concurrency 4 --run 20261018_020000
+    python restore.py restore --tenant tenant_acme --suffix '' --replace     (sobre la BD original)
+    python restore.py verify [--sample 5] [--concurrency 4] [--jobs 2]
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+
+from backup import MANIFEST, connect, pg_env, pg_settings, run_dirs, table_estimates
+from chunkstore import INDEX_SUFFIX, read_index, store_for_index
+
+SCRATCH_PREFIX = 'restore_verify_'
+VERIFY_REPORT = 'verify.json'
+
+
+# ============================================
+# CORRIDAS
+# ============================================
+
+def load_run(backup_dir, run_id):
+    """(run_id, manifest) de la corrida pedida; 'latest' es la última completa"""
+    if run_id == 'latest':
+        runs = run_dirs(backup_dir)
+        if not runs:
+            raise SystemExit(f"No hay corridas completas en {backup_dir}")
+        run_id = runs[-1]
+    with open(os.path.join(backup_dir, run_id, MANIFEST)) as f:
+        return run_id, json.load(f)
+
+
+def restorable(manifest):
+    """db_name -> entrada del manifest para las BDs con volcado"""
+    return {
+        entry['db_name']: entry for entry in manifest['databases']
+        if entry['status'] in ('dumped', 'unchanged')
+    }
+
+
+# ============================================
+# POSTGRES
+# ============================================
+
+@contextmanager
+def admin_connection(pg, db_name='postgres'):
+    conn = connect(pg, db_name)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            yield cursor
+    finally:
+        conn.close()
+
+
+def drop_database(pg, db_name):
+    with admin_connection(pg) as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{db_name}" WITH (FORCE)')
+
+
+def create_database(pg, db_name, template=None, owner=None):
+    sql = f'CREATE DATABASE "{db_name}" TEMPLATE "{template or "template0"}"'
+    if owner:
+        sql += f' OWNER "{owner}"'
+    with admin_connection(pg) as cursor:
+        cursor.execute(sql)
+
+
+def empty_tables(pg, db_name):
+    """Vacía las tablas clonadas de la plantilla (django_migrations, permisos...) antes de cargar datos"""
+    with admin_connection(pg, db_name) as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+        """)
+        tables = [f'public."{row[0]}"' for row in cursor.fetchall()]
+        if tables:
+            cursor.execute(f"TRUNCATE {', '.join(tables)} CASCADE")
+
+
+def reassign_template_objects(pg, db_name, owner):
+    """Los objetos clonados de la plantilla son de su rol dueño: pasan a `owner` (como create_database)"""
+    with admin_connection(pg, db_name) as cursor:
+        cursor.execute("""
+            SELECT DISTINCT pg_get_userbyid(c.relowner) FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public'
+        """)
+        for (role,) in cursor.fetchall():
+            # Nunca el usuario de la conexión: REASSIGN también movería sus BDs
+            if role not in (owner, pg['user']):
+                cursor.execute(f'REASSIGN OWNED BY "{role}" TO "{owner}"')
+
+
+def analyze(pg, db_name):
+    with admin_connection(pg, db_name) as cursor:
+        cursor.execute("ANALYZE")
+
+
+def exact_counts(pg, db_name):
+    """Tabla -> COUNT(*) real"""
+    counts = {}
+    with admin_connection(pg, db_name) as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')
+        """)
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'SELECT COUNT(*) FROM public."{name}"')
+            counts[name] = cursor.fetchone()[0]
+    return counts
+
+
+def remove_scratch(pg):
+    """Borra BDs restore_verify_* que dejó una verificación interrumpida"""
+    with admin_connection(pg) as cursor:
+        cursor.execute("SELECT datname FROM pg_database WHERE datname LIKE %s",
+                       [SCRATCH_PREFIX.replace('_', '\\_') + '%'])
+        names = [row[0] for row in cursor.fetchall()]
+    for name in names:
+        drop_database(pg, name)
+    return len(names)
+
+
+# ============================================
+# PG_RESTORE
+# ============================================
+
+def run_process(command, env, timeout, feed=None):
+    """Corre un comando con timeout; `feed` (iterable de bytes) va a su stdin"""
+    started = time.monotonic()
+    # stderr a un archivo: un pipe sin leer puede bloquear al proceso si escribe mucho
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            command, env=env, stdout=subprocess.DEVNULL, stderr=stderr,
+            stdin=subprocess.PIPE if feed is not None else subprocess.DEVNULL,
+        )
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        try:
+            if feed is not None:
+                try:
+                    for data in feed:
+                        process.stdin.write(data)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass  # El proceso terminó antes: su stderr dice por qué
+            returncode = process.wait()
+        except Exception:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            timer.cancel()
+        if returncode != 0:
+            if time.monotonic() - started >= timeout:
+                raise RuntimeError(f"{command[0]} excedió {timeout}s")
+            stderr.seek(0)
+            raise RuntimeError(stderr.read().decode(errors='replace').strip() or
+                               f"{command[0]} salió con código {returncode}")
+
+
+def materialize(index_path, work_dir):
+    """Reconstruye el volcado de un índice en un archivo temporal (pg_restore -j no lee de stdin)"""
+    os.makedirs(work_dir, exist_ok=True)
+    store = store_for_index(index_path)
+    fd, path = tempfile.mkstemp(dir=work_dir, suffix='.dump')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in store.read_stream(read_index(index_path)):
+                f.write(data)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def pg_restore(pg, dump_path, db_name, options):
+    """pg_restore de un .dump o .idx en db_name; retorna segundos de reconstrucción del .idx"""
+    command = ['pg_restore', '--exit-on-error', '-h', pg['host'], '-p', str(pg['port']), '-U', pg['user'],
+               '-d', db_name, *options['pg_restore_args']]
+
+    if not dump_path.endswith(INDEX_SUFFIX):
+        run_process(command + ['-j', str(options['jobs']), dump_path], pg_env(pg), options['timeout'])
+        return 0
+
+    if options['jobs'] <= 1:
+        store = store_for_index(dump_path)
+        run_process(command, pg_env(pg), options['timeout'], feed=store.read_stream(read_index(dump_path)))
+        return 0
+
+    started = time.monotonic()
+    path = materialize(dump_path, options['work_dir'])
+    materialize_s = time.monotonic() - started
+    try:
+        run_process(command + ['-j', str(options['jobs']), path], pg_env(pg), options['timeout'])
+    finally:
+        os.remove(path)
+    return materialize_s
+
+
+def restore_database(pg, dump_path, target, options):
+    """
+    Crea `target` y restaura el volcado; retorna los tiempos. Si falla, la BD
+    a medio restaurar se borra.
+    """
+    template = options.get('template')
+    owner = options.get('owner')
+    args = []
+    if options.get('scratch'):
+        # Una BD temporal no necesita los roles ni permisos del tenant
+        args += ['--no-owner', '--no-privileges']
+    elif owner and not template:
+        # Los objetos se crean directamente como el rol dueño
+        args += ['--no-owner', f'--role={owner}']
+    if template:
+        # El esquema viene de la plantilla; desactivar triggers evita fallos de FK por el orden de carga en paralelo
+        args += ['--data-only', '--disable-triggers']
+
+    started = time.monotonic()
+    create_database(pg, target, template=template, owner=owner)
+    try:
+        if template:
+            empty_tables(pg, target)
+        materialize_s = pg_restore(pg, dump_path, target, {**options, 'pg_restore_args': args})
+        restore_s = time.monotonic() - started
+        if template and owner:
+            reassign_template_objects(pg, target, owner)
+        if not options.get('scratch'):
+            analyze(pg, target)
+    except Exception:
+        drop_database(pg, target)
+        raise
+    return {
+        'materialize_s': round(materialize_s, 2),
+        'restore_s': round(restore_s, 2),
+        'total_s': round(time.monotonic() - started, 2),
+    }
+
+
+# ============================================
+# VERIFICACIÓN
+# ============================================
+
+def compare_counts(estimates, counts, tolerance, slack):
+    """Diferencias entre el conteo real y la estimación del catálogo fuera de tolerancia"""
+    problems = []
+    for table, estimate in sorted(estimates.items()):
+        if table not in counts:
+            problems.append(f"{table}: no existe en la BD restaurada")
+        elif estimate is not None and abs(counts[table] - estimate) > max(slack, estimate * tolerance):
+            problems.append(f"{table}: {counts[table]} filas, el catálogo estimaba {estimate}")
+    return problems
+
+
+def verify_database(pg, backup_dir, run_id, entry, options):
+    """Restaura en una BD temporal, compara filas y la borra; nunca lanza excepción"""
+    db_name = entry['db_name']
+    scratch = f"{SCRATCH_PREFIX}{secrets.token_hex(4)}"
+    result = {'db_name': db_name, 'size_bytes': entry['size_bytes']}
+    try:
+        estimates = entry.get('tables')
+        result['estimates'] = 'manifest'
+        if estimates is None:
+            # Manifest anterior a las estimaciones: se compara con la BD en vivo (pudo cambiar desde el backup)
+            estimates = table_estimates(pg, db_name)
+            result['estimates'] = 'live'
+
+        result.update(restore_database(
+            pg, os.path.join(backup_dir, run_id, entry['file']), scratch, {**options, 'scratch': True},
+        ))
+        counts = exact_counts(pg, scratch)
+        problems = compare_counts(estimates, counts, options['tolerance'], options['slack'])
+        result.update({
+            'status': 'failed' if problems else 'verified',
+            'tables': len(counts),
+            'rows': sum(counts.values()),
+            'problems': problems,
+        })
+    except Exception as e:
+        result.update({'status': 'failed', 'problems': [str(e)]})
+    finally:
+        try:
+            drop_database(pg, scratch)
+        except Exception as e:
+            print(f"⚠️  No se pudo borrar {scratch}: {e}")
+    return result
+
+
+# ============================================
+# REPORTE
+# ============================================
+
+def throughput_report(results, wall_s, manifest, concurrency):
+    """Imprime el throughput y la recuperación estimada de toda la corrida; retorna el resumen"""
+    done = [result for result in results if 'restore_s' in result]
+    restored_bytes = sum(result['size_bytes'] for result in done)
+    mb = restored_bytes / 1024 / 1024
+    aggregate = mb / wall_s if wall_s else 0
+    per_db = [result['size_bytes'] / 1024 / 1024 / result['restore_s'] for result in done if result['restore_s']]
+    all_bytes = sum(entry['size_bytes'] for entry in restorable(manifest).values())
+    estimated_s = (all_bytes / 1024 / 1024) / aggregate if aggregate else None
+
+    print(f"\nThroughput: {mb:.1f} MB en {wall_s:.1f}s = {aggregate:.1f} MB/s con {concurrency} restores simultáneos")
+    if per_db:
+        print(f"  Por BD: {min(per_db):.1f}-{max(per_db):.1f} MB/s")
+    materialize_s = sum(result['materialize_s'] for result in done)
+    if materialize_s:
+        print(f"  Reconstrucción de volcados .idx: {materialize_s:.1f}s en total")
+    if estimated_s is not None:
+        print(f"  Recuperación estimada de la corrida completa ({len(restorable(manifest))} BDs, "
+              f"{all_bytes / 1024 ** 3:.2f} GB): {estimated_s / 60:.1f} min")
+    return {
+        'restored_bytes': restored_bytes,
+        'wall_s': round(wall_s, 2),
+        'mb_per_s': round(aggregate, 2),
+        'estimated_full_restore_s': round(estimated_s, 1) if estimated_s is not None else None,
+    }
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def parse_args():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--backup-dir', default=os.getenv('BACKUP_DIR', '/backups'))
+    common.add_argument('--run', default='latest', help='Corrida (YYYYmmdd_HHMMSS); por defecto la última completa')
+    common.add_argument('--concurrency', type=int, default=int(os.getenv('RESTORE_CONCURRENCY', 2)),
+                        help='BDs restaurándose a la vez')
+    common.add_argument('--jobs', type=int, default=int(os.getenv('RESTORE_JOBS', 4)),
+                        help='pg_restore -j por BD')
+    common.add_argument('--timeout', type=int, default=3600, help='Segundos máximos por pg_restore')
+    common.add_argument('--work-dir', help='Dónde reconstruir los .idx (por defecto BACKUP_DIR/.restore)')
+
+    parser = argparse.ArgumentParser(description='Restore paralelo y verificación de backups')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    restore = sub.add_parser('restore', parents=[common], help='Restaura BDs de la corrida')
+    restore.add_argument('--tenant', action='append', default=[], help='db_name a restaurar (repetible)')
+    restore.add_argument('--all', action='store_true', help='Todos los tenants de la corrida')
+    restore.add_argument('--suffix', default='_restored', help="Sufijo de la BD destino ('' = mismo nombre)")
+    restore.add_argument('--replace', action='store_true', help='Borrar la BD destino si existe')
+    restore.add_argument('--template', help='Crear la BD desde esta plantilla y cargar solo datos')
+    restore.add_argument('--owner', help='Rol dueño de la BD y sus objetos (por defecto, los del volcado)')
+
+    verify = sub.add_parser('verify', parents=[common], help='Restaura una muestra en BDs temporales y compara filas')
+    verify.add_argument('--sample', type=int, default=int(os.getenv('RESTORE_VERIFY_SAMPLE', 5)),
+                        help='Tenants al azar (además de la master)')
+    verify.add_argument('--tenant', action='append', default=[], help='Verificar estos db_name en vez de una muestra')
+    verify.add_argument('--tolerance', type=float, default=0.2,
+                        help='Diferencia relativa aceptada contra la estimación del catálogo')
+    verify.add_argument('--slack', type=int, default=100, help='Diferencia absoluta aceptada (tablas chicas)')
+    verify.add_argument('--seed', help='Semilla de la muestra (reproducible)')
+    return parser.parse_args()
+
+
+def run_restore(args, pg, run_id, manifest, options):
+    entries = restorable(manifest)
+    names = [name for name in entries if name != manifest['master_db']] if args.all else args.tenant
+    missing = [name for name in names if name not in entries]
+    if missing or not names:
+        raise SystemExit(f"Sin volcado en la corrida {run_id}: {', '.join(missing) or 'indicar --tenant o --all'}")
+
+    def restore_one(db_name):
+        target = f"{db_name}{args.suffix}"
+        result = {'db_name': db_name, 'target': target, 'size_bytes': entries[db_name]['size_bytes']}
+        try:
+            if args.replace:
+                drop_database(pg, target)
+            result.update(restore_database(
+                pg, os.path.join(args.backup_dir, run_id, entries[db_name]['file']), target, options,
+            ))
+            result['status'] = 'restored'
+        except Exception as e:
+            result.update({'status': 'failed', 'error': str(e)})
+        return result
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [executor.submit(restore_one, db_name) for db_name in names]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'restored':
+                print(f"✓ {result['db_name']} → {result['target']} ({result['size_bytes'] / 1024 / 1024:.1f} MB, "
+                      f"{result['total_s']:.1f}s)")
+            else:
+                print(f"✗ {result['db_name']}: {result['error']}")
+    return results
+
+
+def run_verify(args, pg, run_id, manifest, options):
+    entries = restorable(manifest)
+    if args.tenant:
+        names = args.tenant
+    else:
+        tenants = sorted(name for name in entries if name != manifest['master_db'])
+        names = [manifest['master_db']] + random.Random(args.seed).sample(tenants, min(args.sample, len(tenants)))
+    missing = [name for name in names if name not in entries]
+    if missing:
+        raise SystemExit(f"Sin volcado en la corrida {run_id}: {', '.join(missing)}")
+
+    orphans = remove_scratch(pg)
+    if orphans:
+        print(f"✓ BDs temporales de una verificación anterior eliminadas: {orphans}")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        futures = [
+            executor.submit(verify_database, pg, args.backup_dir, run_id, entries[db_name],
+                            {**options, 'tolerance': args.tolerance, 'slack': args.slack})
+            for db_name in names
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'verified':
+                live = ', estimaciones en vivo' if result['estimates'] == 'live' else ''
+                print(f"✓ {result['db_name']}: {result['tables']} tablas, {result['rows']} filas "
+                      f"({result['total_s']:.1f}s{live})")
+            else:
+                print(f"✗ {result['db_name']}:")
+                for problem in result['problems']:
+                    print(f"    {problem}")
+    return results
+
+
+def main():
+    args = parse_args()
+    pg = pg_settings()
+    run_id, manifest = load_run(args.backup_dir, args.run)
+    options = {
+        'jobs': max(1, args.jobs),
+        'timeout': args.timeout,
+        'work_dir': args.work_dir or os.path.join(args.backup_dir, '.restore'),
+        'template': getattr(args, 'template', None),
+        'owner': getattr(args, 'owner', None),
+    }
+
+    print(f"{args.command} de la corrida {run_id} ({manifest.get('store', 'files')}), "
+          f"{args.concurrency} a la vez con -j {options['jobs']}...")
+    started = time.monotonic()
+    if args.command == 'restore':
+        results = run_restore(args, pg, run_id, manifest, options)
+    else:
+        results = run_verify(args, pg, run_id, manifest, options)
+    summary = throughput_report(results, time.monotonic() - started, manifest, args.concurrency)
+
+    failed = [result for result in results if result['status'] == 'failed']
+    if args.command == 'verify':
+        report = {
+            'run_id': run_id,
+            'verified_at': datetime.now().isoformat(),
+            'concurrency': args.concurrency,
+            'jobs': options['jobs'],
+            **summary,
+            'failed': len(failed),
+            'databases': sorted(results, key=lambda result: result['db_name']),
+        }
+        path = os.path.join(args.backup_dir, run_id, VERIFY_REPORT)
+        with open(path + '.partial', 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(path + '.partial', path)
+
+    print(f"{len(results) - len(failed)} correctas, {len(failed)} fallidas")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
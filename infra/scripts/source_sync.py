@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Sincronización incremental del código base a las carpetas de los tenants
+
+sync_tree reemplaza al rmtree + copytree de cada deployment dedicado:
+
+- Cada archivo del código base se identifica por su sha256. Los hashes se
+  guardan por producto en <clientes>/.source-hashes.json junto con el tamaño
+  y el mtime del archivo, así que un redeploy solo vuelve a leer los que
+  cambiaron (como el índice de git).
+- En la carpeta del tenant, .source-sync.json registra qué hash se
+  materializó en cada ruta y con qué tamaño/mtime quedó. Un archivo con el
+  mismo hash y sin tocar no se reescribe; uno nuevo o cambiado se
+  materializa en un temporal y se mueve con os.replace.
+- Materializar es, por orden: reflink (FICLONE: bloques compartidos con
+  copy-on-write, en btrfs/XFS), hardlink (solo con mode='hardlink') o copia.
+  El hardlink comparte el inodo con el código base: una edición in situ en
+  cualquiera de los dos se ve en ambos, por eso no es el modo por defecto.
+- Se borran los archivos que se materializaron antes y ya no están en el
+  código base; lo que no vino de ahí (.git, docker-compose.yml generado,
+  cambios propios del tenant en rutas nuevas) no se toca.
+
+Uso:
+    python source_sync.py <origen> <destino> [--mode auto|reflink|hardlink|copy]
+"""
+import argparse
+import errno
+import fcntl
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+IGNORE_PATTERNS = ('.git', '__pycache__', '*.pyc', 'venv', 'node_modules')
+MANIFEST = '.source-sync.json'
+HASH_CACHE = '.source-hashes.json'
+FICLONE = 0x40049409
+READ_SIZE = 1024 * 1024
+
+
+def ignored(name):
+    return name in (MANIFEST, HASH_CACHE) or any(fnmatch.fnmatch(name, pattern) for pattern in IGNORE_PATTERNS)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                return digest.hexdigest()
+            digest.update(data)
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_json(path, data):
+    """Escritura atómica con temporal propio: varios deployments del mismo producto pueden correr a la vez"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def scan_source(source, cache):
+    """ruta relativa -> sha256 de los archivos del código base (reusando hashes de archivos sin cambios)"""
+    files = {}
+    fresh = {}
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames[:] = sorted(d for d in dirnames if not ignored(d))
+        for filename in filenames:
+            if ignored(filename):
+                continue
+            path = os.path.join(dirpath, filename)
+            rel = os.path.relpath(path, source)
+            stat = os.stat(path)
+            cached = cache.get(rel)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                digest = cached[2]
+            else:
+                digest = file_hash(path)
+            files[rel] = digest
+            fresh[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+    return files, fresh
+
+
+class Materializer:
+    """Crea archivos del destino a partir del origen con el método más barato disponible"""
+
+    def __init__(self, mode='auto'):
+        self.mode = mode
+        self.reflink_supported = mode in ('auto', 'reflink')
+        self.counts = {'reflink': 0, 'hardlink': 0, 'copy': 0}
+
+    def _reflink(self, src, tmp):
+        with open(src, 'rb') as source, open(tmp, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        shutil.copystat(src, tmp)
+
+    def materialize(self, src, dst):
+        """Reemplaza dst por el contenido de src; retorna el método usado"""
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), prefix='.tmp-')
+        os.close(fd)
+        try:
+            method = None
+            if self.reflink_supported:
+                try:
+                    self._reflink(src, tmp)
+                    method = 'reflink'
+                except OSError as e:
+                    if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                        raise
+                    # El sistema de archivos no soporta reflink: no reintentar en cada archivo
+                    if self.mode == 'reflink':
+                        raise
+                    self.reflink_supported = False
+            if method is None and self.mode == 'hardlink':
+                os.remove(tmp)
+                try:
+                    os.link(src, tmp)
+                    method = 'hardlink'
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+            if method is None:
+                shutil.copy2(src, tmp)
+                method = 'copy'
+            os.replace(tmp, dst)
+        except Exception:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            raise
+        self.counts[method] += 1
+        return method
+
+
+def remove_empty_dirs(root, rel_dirs):
+    """Borra directorios que quedaron vacíos, de los más profundos a la raíz"""
+    for rel in sorted(rel_dirs, key=lambda d: d.count(os.sep), reverse=True):
+        path = os.path.join(root, rel)
+        while rel and os.path.isdir(path) and not os.listdir(path):
+            os.rmdir(path)
+            rel = os.path.dirname(rel)
+            path = os.path.join(root, rel)
+
+
+def sync_tree(source, dest, mode='auto'):
+    """
+    Deja en dest el código de source reescribiendo solo lo que cambió.
+    Retorna un resumen con los archivos escritos, sin cambios y borrados.
+    """
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f"No existe el código fuente en {source}")
+    started = time.monotonic()
+    os.makedirs(dest, exist_ok=True)
+
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(dest)), HASH_CACHE)
+    files, fresh_cache = scan_source(source, load_json(cache_path))
+    save_json(cache_path, fresh_cache)
+
+    manifest_path = os.path.join(dest, MANIFEST)
+    previous = load_json(manifest_path)
+    materializer = Materializer(mode)
+    manifest = {}
+    summary = {'files': len(files), 'unchanged': 0, 'written': 0, 'removed': 0, 'bytes_written': 0}
+
+    for rel, digest in sorted(files.items()):
+        src = os.path.join(source, rel)
+        dst = os.path.join(dest, rel)
+        record = previous.get(rel)
+        try:
+            stat = os.stat(dst, follow_symlinks=False)
+        except FileNotFoundError:
+            stat = None
+
+        unchanged = False
+        if stat is not None and record:
+            # Mismo hash materializado y el archivo no se tocó desde entonces
+            unchanged = record[0] == digest and record[1] == stat.st_size and record[2] == stat.st_mtime_ns
+        elif stat is not None and os.path.isfile(dst):
+            # Carpeta sin manifest (copia completa anterior): se compara el contenido una vez
+            unchanged = file_hash(dst) == digest
+
+        if unchanged:
+            summary['unchanged'] += 1
+        else:
+            if stat is not None and os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            materializer.materialize(src, dst)
+            summary['written'] += 1
+            summary['bytes_written'] += os.path.getsize(src)
+            stat = os.stat(dst)
+        manifest[rel] = [digest, stat.st_size, stat.st_mtime_ns]
+
+    # Lo que se materializó antes y ya no está en el código base
+    removed_dirs = set()
+    for rel in previous:
+        if rel in files:
+            continue
+        path = os.path.join(dest, rel)
+        if os.path.isfile(path) or os.path.islink(path):
+            os.remove(path)
+            summary['removed'] += 1
+            removed_dirs.add(os.path.dirname(rel))
+    remove_empty_dirs(dest, removed_dirs)
+
+    save_json(manifest_path, manifest)
+    summary.update(materializer.counts)
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sincroniza el código base a la carpeta de un tenant')
+    parser.add_argument('source')
+    parser.add_argument('dest')
+    parser.add_argument('--mode', choices=['auto', 'reflink', 'hardlink', 'copy'],
+                        default=os.getenv('SOURCE_SYNC_MODE', 'auto'))
+    args = parser.parse_args()
+    print(json.dumps(sync_tree(args.source, args.dest, args.mode)))
+
+
+if __name__ == '__main__':
+    main()